@@ -4,15 +4,32 @@ EvansMathibe Agency - Multi-Agent System
 A comprehensive AI-powered agency management system
 """
 
+import asyncio
 import os
 import sys
 import json
+import time
+import functools
+import inspect
 import subprocess
+import threading
+from bisect import bisect_left, insort
 from pathlib import Path
 from datetime import datetime
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Callable, Union
+
+from agent_log import AgentLogger
+
+try:
+    from agency_metrics import instrument, report as metrics_report
+except ImportError:
+    # Run as a script from agents/; the daemon and other importers already
+    # have scripts/ on the path.
+    sys.path.append(str(Path(__file__).resolve().parent.parent / "scripts"))
+    from agency_metrics import instrument, report as metrics_report
 
 AGENCY_ROOT = Path("/home/ev/EvansMathibe_Agency")
+PROJECTS_DIR = AGENCY_ROOT / "data" / "projects"
 GITHUB_REPO = "Evansxm/evansmathibe-agency"
 CONTACT_INFO = {
     "phone": "+27 72 416 5061",
@@ -36,27 +53,58 @@ SERVICES = {
 }
 
 
+AGENT_ROLES = [
+    "coding",
+    "uiux",
+    "data",
+    "content",
+    "visual",
+    "designer",
+    "creative",
+    "monitor",
+    "payment",
+]
+
+
 class EvansMathibeAgent:
     """Base class for all EvansMathibe agents"""
 
+    def __init_subclass__(cls, **kwargs):
+        """Record calls, errors and latency for every public agent method.
+
+        Static and class methods are instrumented inside their descriptor, so
+        they keep their binding; properties and nested classes are left alone.
+        """
+        super().__init_subclass__(**kwargs)
+        timed = instrument(cls.__name__)
+        for attr, value in list(vars(cls).items()):
+            if attr.startswith("_"):
+                continue
+            if isinstance(value, (staticmethod, classmethod)):
+                setattr(cls, attr, type(value)(timed(value.__func__)))
+            elif inspect.isfunction(value):
+                setattr(cls, attr, timed(value))
+
     def __init__(self, name: str, role: str):
         self.name = name
         self.role = role
         self.tasks_completed = []
-        self.logs = []
+        self.logger = AgentLogger(name)
+
+    @property
+    def logs(self) -> List[str]:
+        return self.logger.entries()
 
-    def log(self, message: str):
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        entry = f"[{timestamp}] [{self.name}] {message}"
-        self.logs.append(entry)
-        print(entry)
+    def log(self, message: str, level: str = "INFO"):
+        self.logger.log(message, level)
 
     def save_log(self):
-        log_dir = AGENCY_ROOT / "logs"
-        log_dir.mkdir(exist_ok=True)
-        log_file = log_dir / f"{self.name.lower().replace(' ', '_')}.log"
-        with open(log_file, "a") as f:
-            f.write("\n".join(self.logs))
+        """Wait for this agent's queued records to reach its log file.
+
+        Records are appended by the log pipeline as they are written, so
+        this no longer writes anything itself.
+        """
+        return self.logger.flush()
 
 
 class CodingAgent(EvansMathibeAgent):
@@ -211,25 +259,144 @@ class CreativeDirectorAgent(EvansMathibeAgent):
 
 
 class ProjectMonitorAgent(EvansMathibeAgent):
-    """Agent responsible for monitoring project progress"""
+    """Agent responsible for monitoring project progress
 
-    def __init__(self):
+    Each project keeps a bitset of completed task indexes next to its
+    completion list, so an update is O(1) and repeats are not double-counted.
+    Projects are also kept in a list sorted by completion fraction for the
+    bulk dashboard query, and each project is persisted to its own file so a
+    restarted monitor picks up where it left off.
+    """
+
+    def __init__(self, state_dir: Path = None):
         super().__init__("ProjectWatch", "Project Monitor")
+        self.state_dir = Path(state_dir) if state_dir else PROJECTS_DIR / "monitor"
         self.projects = {}
-
-    def track_project(self, project_name: str, tasks: List[str]):
-        self.projects[project_name] = {
-            "tasks": tasks,
+        self._ranking = []
+        self._stamps = {}
+        self._load_projects()
+
+    @staticmethod
+    def _fraction(project: Dict) -> float:
+        total = len(project["tasks"])
+        return len(project["completed"]) / total if total else 0.0
+
+    def _state_file(self, project_name: str) -> Path:
+        return self.state_dir / f"{project_name.lower().replace(' ', '_')}.json"
+
+    @staticmethod
+    def _stamp(state_file: Path):
+        st = state_file.stat()
+        return (st.st_mtime_ns, st.st_size)
+
+    def _load_projects(self):
+        if not self.state_dir.exists():
+            return
+        for state_file in self.state_dir.glob("*.json"):
+            self._load_project(state_file)
+
+    def _load_project(self, state_file: Path):
+        stamp = self._stamp(state_file)
+        with open(state_file) as f:
+            state = json.load(f)
+        self._set_project(
+            state["project"],
+            state["tasks"],
+            state.get("dependencies"),
+            state.get("completed", []),
+            state.get("status", "active"),
+        )
+        self._stamps[state_file.name] = (stamp, state["project"])
+
+    def refresh(self):
+        """Pick up project files other processes wrote or removed since they
+        were loaded; a long-lived monitor calls this before serving."""
+        current = set()
+        if self.state_dir.exists():
+            for state_file in self.state_dir.glob("*.json"):
+                current.add(state_file.name)
+                known = self._stamps.get(state_file.name)
+                if known is None or known[0] != self._stamp(state_file):
+                    self._load_project(state_file)
+        for name in [n for n in self._stamps if n not in current]:
+            project_name = self._stamps.pop(name)[1]
+            if project_name in self.projects:
+                self._unrank(project_name)
+                del self.projects[project_name]
+
+    def _save_project(self, project_name: str):
+        p = self.projects[project_name]
+        self.state_dir.mkdir(parents=True, exist_ok=True)
+        state_file = self._state_file(project_name)
+        tmp_file = state_file.with_suffix(".tmp")
+        with open(tmp_file, "w") as f:
+            json.dump(
+                {
+                    "project": project_name,
+                    "tasks": p["tasks"],
+                    "completed": p["completed"],
+                    "dependencies": p["dependencies"],
+                    "status": p["status"],
+                },
+                f,
+                indent=2,
+            )
+        os.replace(tmp_file, state_file)
+        self._stamps[state_file.name] = (self._stamp(state_file), project_name)
+
+    def _unrank(self, project_name: str):
+        key = (self._fraction(self.projects[project_name]), project_name)
+        i = bisect_left(self._ranking, key)
+        if i < len(self._ranking) and self._ranking[i] == key:
+            del self._ranking[i]
+
+    def _set_project(self, project_name, tasks, dependencies, completed, status):
+        if project_name in self.projects:
+            self._unrank(project_name)
+        p = {
+            "tasks": list(tasks),
+            "index": {task: i for i, task in enumerate(tasks)},
+            "done": 0,
             "completed": [],
-            "status": "active",
+            "dependencies": dependencies or {},
+            "status": status,
         }
+        for task in completed:
+            i = p["index"].get(task)
+            if i is not None and not p["done"] >> i & 1:
+                p["done"] |= 1 << i
+                p["completed"].append(task)
+        self.projects[project_name] = p
+        insort(self._ranking, (self._fraction(p), project_name))
+
+    def track_project(
+        self,
+        project_name: str,
+        tasks: List[str],
+        dependencies: Dict[str, List[str]] = None,
+    ):
+        self._set_project(project_name, tasks, dependencies, [], "active")
+        self._save_project(project_name)
         self.log(f"Tracking project: {project_name} with {len(tasks)} tasks")
         return {"status": "tracking", "project": project_name}
 
     def update_progress(self, project_name: str, task: str):
-        if project_name in self.projects:
-            self.projects[project_name]["completed"].append(task)
-            self.log(f"Updated {project_name}: completed {task}")
+        p = self.projects.get(project_name)
+        if p is None:
+            return {"status": "unknown_project"}
+        i = p["index"].get(task)
+        if i is None:
+            return {"status": "unknown_task"}
+        if p["done"] >> i & 1:
+            return {"status": "unchanged"}
+        self._unrank(project_name)
+        p["done"] |= 1 << i
+        p["completed"].append(task)
+        if len(p["completed"]) == len(p["tasks"]):
+            p["status"] = "completed"
+        insort(self._ranking, (self._fraction(p), project_name))
+        self._save_project(project_name)
+        self.log(f"Updated {project_name}: completed {task}")
         return {"status": "updated"}
 
     def get_status(self, project_name: str):
@@ -240,9 +407,15 @@ class ProjectMonitorAgent(EvansMathibeAgent):
             return {
                 "project": project_name,
                 "progress": f"{done}/{total}",
-                "percentage": f"{(done / total) * 100:.1f}%",
+                "percentage": f"{self._fraction(p) * 100:.1f}%",
+                "status": p["status"],
             }
 
+    def get_all_statuses(self, least_complete_first: bool = False) -> List[Dict]:
+        """Status of every tracked project, most complete first by default."""
+        ranking = self._ranking if least_complete_first else reversed(self._ranking)
+        return [self.get_status(name) for _, name in ranking]
+
 
 class PaymentAgent(EvansMathibeAgent):
     """Agent responsible for payment processing via Stripe"""
@@ -269,35 +442,66 @@ class PaymentAgent(EvansMathibeAgent):
         return {"status": "success", "product": product_name, "price_id": price_id}
 
 
+class LazyAgent:
+    """Agency attribute that builds its agent on first access."""
+
+    def __init__(self, role: str):
+        self.role = role
+
+    def __get__(self, agency, owner=None):
+        if agency is None:
+            return self
+        return agency.get_agent(self.role)
+
+
+AGENT_CLASSES = {
+    "coding": CodingAgent,
+    "uiux": UIUXAgent,
+    "data": DataPythonAgent,
+    "content": ContentAgent,
+    "visual": VisualAssetsAgent,
+    "designer": GraphicDesignerAgent,
+    "creative": CreativeDirectorAgent,
+    "monitor": ProjectMonitorAgent,
+    "payment": PaymentAgent,
+}
+
+
 class EvansMathibeAgency:
-    """Main agency orchestrator that manages all agents"""
+    """Main agency orchestrator that manages all agents
+
+    Agents are created the first time they are asked for, so a command that
+    only needs one agent (or none) does not pay for all nine.
+    """
+
+    coding_agent = LazyAgent("coding")
+    uiux_agent = LazyAgent("uiux")
+    data_agent = LazyAgent("data")
+    content_agent = LazyAgent("content")
+    visual_agent = LazyAgent("visual")
+    designer_agent = LazyAgent("designer")
+    creative_director = LazyAgent("creative")
+    monitor_agent = LazyAgent("monitor")
+    payment_agent = LazyAgent("payment")
 
     def __init__(self):
-        self.coding_agent = CodingAgent()
-        self.uiux_agent = UIUXAgent()
-        self.data_agent = DataPythonAgent()
-        self.content_agent = ContentAgent()
-        self.visual_agent = VisualAssetsAgent()
-        self.designer_agent = GraphicDesignerAgent()
-        self.creative_director = CreativeDirectorAgent()
-        self.monitor_agent = ProjectMonitorAgent()
-        self.payment_agent = PaymentAgent()
-
-        self.log("EvansMathibe Agency initialized with all agents")
+        self.agents = {}
+        self.logger = AgentLogger("Agency")
+        self._agents_lock = threading.Lock()
+
+    def log(self, message: str, level: str = "INFO"):
+        self.logger.log(message, level)
 
     def get_agent(self, agent_name: str):
-        agents = {
-            "coding": self.coding_agent,
-            "uiux": self.uiux_agent,
-            "data": self.data_agent,
-            "content": self.content_agent,
-            "visual": self.visual_agent,
-            "designer": self.designer_agent,
-            "creative": self.creative_director,
-            "monitor": self.monitor_agent,
-            "payment": self.payment_agent,
-        }
-        return agents.get(agent_name.lower())
+        role = agent_name.lower()
+        agent = self.agents.get(role)
+        if agent is None and role in AGENT_CLASSES:
+            with self._agents_lock:
+                agent = self.agents.get(role)
+                if agent is None:
+                    agent = self.agents[role] = AGENT_CLASSES[role]()
+                    self.log(f"Started {agent.name} ({agent.role})", "DEBUG")
+        return agent
 
     def list_services(self):
         print("\n" + "=" * 60)
@@ -311,17 +515,439 @@ class EvansMathibeAgency:
     def get_contact_info(self):
         return CONTACT_INFO
 
+    def refresh(self):
+        """Catch started agents up with state other processes saved."""
+        monitor = self.agents.get("monitor")
+        if monitor is not None:
+            monitor.refresh()
+
+
+class AgencyDispatcher:
+    """Runs agent work concurrently, routed to agents by role.
+
+    Work is submitted as ``(role, method)`` where role is a ``get_agent`` name
+    and method is an agent method name or a callable taking the agent first.
+    Agent methods are synchronous, so each call runs in a thread pool; a
+    per-role semaphore caps how many calls one agent handles at once. On
+    timeout the caller gets an error result, but the worker thread finishes
+    its call in the background and keeps its role's slot until it does.
+    """
+
+    def __init__(
+        self,
+        agency: "EvansMathibeAgency" = None,
+        limits: Dict[str, int] = None,
+        default_limit: int = 4,
+        timeout: float = None,
+    ):
+        self.agency = agency or EvansMathibeAgency()
+        self.limits = limits or {}
+        self.default_limit = default_limit
+        self.timeout = timeout
+        self.tasks = []
+        self._semaphores = {}
+        workers = sum(self.limits.get(r, default_limit) for r in AGENT_ROLES)
+        from concurrent.futures import ThreadPoolExecutor
+
+        self._executor = ThreadPoolExecutor(max_workers=workers)
+
+    def _semaphore(self, role: str) -> asyncio.Semaphore:
+        if role not in self._semaphores:
+            limit = self.limits.get(role, self.default_limit)
+            self._semaphores[role] = asyncio.Semaphore(limit)
+        return self._semaphores[role]
+
+    def submit(
+        self,
+        role: str,
+        method: Union[str, Callable],
+        *args,
+        timeout: float = None,
+        **kwargs,
+    ) -> asyncio.Task:
+        """Schedule one agent call; must be called from a running event loop."""
+        if timeout is None:
+            timeout = self.timeout
+        task = asyncio.ensure_future(
+            self._run(role.lower(), method, args, kwargs, timeout)
+        )
+        self.tasks.append(task)
+        return task
+
+    async def _run(self, role, method, args, kwargs, timeout):
+        name = (
+            method if isinstance(method, str) else getattr(method, "__name__", "call")
+        )
+        agent = self.agency.get_agent(role)
+        if agent is None:
+            return {
+                "role": role,
+                "method": name,
+                "error": f"Unknown agent role: {role}",
+            }
+        if isinstance(method, str):
+            if not callable(getattr(agent, method, None)):
+                return {
+                    "role": role,
+                    "method": name,
+                    "error": f"{agent.name} has no method {method}",
+                }
+            call = functools.partial(getattr(agent, method), *args, **kwargs)
+        else:
+            call = functools.partial(method, agent, *args, **kwargs)
+
+        semaphore = self._semaphore(role)
+        await semaphore.acquire()
+        loop = asyncio.get_running_loop()
+        start = time.perf_counter()
+        future = loop.run_in_executor(self._executor, call)
+
+        def finished(future):
+            # The slot is held until the thread is done, not until the caller
+            # stops waiting, so a timeout never lets a role exceed its limit.
+            semaphore.release()
+            if not future.cancelled():
+                future.exception()
+
+        future.add_done_callback(finished)
+        try:
+            result = await asyncio.wait_for(asyncio.shield(future), timeout)
+        except asyncio.TimeoutError:
+            return {
+                "role": role,
+                "method": name,
+                "error": f"Timed out after {timeout}s",
+            }
+        except Exception as e:
+            return {"role": role, "method": name, "error": str(e)}
+        return {
+            "role": role,
+            "method": name,
+            "status": "success",
+            "result": result,
+            "elapsed": round(time.perf_counter() - start, 4),
+        }
 
-def main():
-    agency = EvansMathibeAgency()
+    async def gather(self) -> List[Dict]:
+        """Wait for everything submitted so far; results keep submission order."""
+        tasks, self.tasks = self.tasks, []
+        return list(await asyncio.gather(*tasks))
+
+    async def run_project(self, jobs) -> List[Dict]:
+        """Run ``(role, method, args)`` or ``(role, method, args, kwargs)`` jobs."""
+        for job in jobs:
+            role, method, args = job[:3]
+            kwargs = job[3] if len(job) > 3 else {}
+            self.submit(role, method, *args, **kwargs)
+        return await self.gather()
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
+
+
+def campaign_pipeline(client: str, brief: str = "Brand launch") -> List[Dict]:
+    """Standard client campaign, from concept approval through to deploy."""
+    slug = client.lower().replace(" ", "-")
+    return [
+        {
+            "name": "concept",
+            "role": "creative",
+            "method": "develop_campaign_concept",
+            "args": [client, brief],
+            "duration": 2,
+        },
+        {
+            "name": "concept approval",
+            "role": "creative",
+            "method": "approve_design",
+            "args": [f"{client} concept"],
+            "after": ["concept"],
+            "duration": 1,
+        },
+        {
+            "name": "copy",
+            "role": "content",
+            "method": "write_copy",
+            "args": ["landing page", client],
+            "after": ["concept"],
+            "duration": 2,
+        },
+        {
+            "name": "logo",
+            "role": "designer",
+            "method": "create_logo",
+            "args": [client],
+            "after": ["concept approval"],
+            "duration": 3,
+        },
+        {
+            "name": "banner",
+            "role": "designer",
+            "method": "design_banner",
+            "args": ["1200x628"],
+            "after": ["concept approval"],
+            "duration": 2,
+        },
+        {
+            "name": "landing page",
+            "role": "uiux",
+            "method": "create_landing_page",
+            "args": [client],
+            "after": ["logo", "copy"],
+            "duration": 3,
+        },
+        {
+            "name": "frontend",
+            "role": "coding",
+            "method": "create_frontend",
+            "args": [slug],
+            "after": ["landing page"],
+            "duration": 3,
+        },
+        {
+            "name": "payment link",
+            "role": "payment",
+            "method": "create_payment_link",
+            "args": ["advertising", 30000],
+            "duration": 1,
+        },
+        {
+            "name": "deploy",
+            "role": "coding",
+            "method": "deploy_to_github",
+            "args": [slug, slug],
+            "after": ["frontend", "banner", "payment link"],
+            "duration": 1,
+        },
+    ]
+
+
+class ProjectPipeline:
+    """A client project as a dependency graph of agent tasks.
+
+    Each task is a dict with ``name``, ``role``, ``method``, optional
+    ``args``/``kwargs``, ``after`` (names it depends on) and an estimated
+    ``duration`` used for the critical path. ``run()`` dispatches every task
+    whose dependencies are complete at once, reports each completion to the
+    ProjectMonitorAgent, and persists state after every step so an
+    interrupted project resumes where it stopped.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        tasks: List[Dict],
+        agency: "EvansMathibeAgency" = None,
+        state_file: Path = None,
+    ):
+        self.name = name
+        self.tasks = {t["name"]: t for t in tasks}
+        self.dependencies = {t["name"]: list(t.get("after", [])) for t in tasks}
+        for task, deps in self.dependencies.items():
+            unknown = [d for d in deps if d not in self.tasks]
+            if unknown:
+                raise ValueError(f"Task '{task}' depends on unknown tasks: {unknown}")
+        self.order = self.topological_order()
+        self.agency = agency or EvansMathibeAgency()
+        slug = name.lower().replace(" ", "_")
+        self.state_file = (
+            Path(state_file) if state_file else PROJECTS_DIR / f"{slug}.json"
+        )
+        self.completed = {}
+        self.failed = {}
+        self._load_state()
+
+    def topological_order(self) -> List[str]:
+        remaining = {name: len(deps) for name, deps in self.dependencies.items()}
+        dependents = {name: [] for name in self.tasks}
+        for name, deps in self.dependencies.items():
+            for dep in deps:
+                dependents[dep].append(name)
+        ready = [name for name, count in remaining.items() if count == 0]
+        order = []
+        while ready:
+            name = ready.pop(0)
+            order.append(name)
+            for child in dependents[name]:
+                remaining[child] -= 1
+                if remaining[child] == 0:
+                    ready.append(child)
+        if len(order) != len(self.tasks):
+            cycle = sorted(set(self.tasks) - set(order))
+            raise ValueError(f"Dependency cycle between tasks: {cycle}")
+        return order
+
+    def critical_path(self) -> Dict:
+        """Longest chain of dependent tasks by estimated duration."""
+        finish, previous = {}, {}
+        for name in self.order:
+            deps = self.dependencies[name]
+            start = max((finish[d] for d in deps), default=0)
+            previous[name] = max(deps, key=lambda d: finish[d]) if deps else None
+            finish[name] = start + self.tasks[name].get("duration", 1)
+        if not finish:
+            return {"path": [], "duration": 0}
+        name = max(finish, key=finish.get)
+        total = finish[name]
+        path = []
+        while name:
+            path.append(name)
+            name = previous[name]
+        return {"path": path[::-1], "duration": total}
+
+    def _load_state(self):
+        if self.state_file.exists():
+            with open(self.state_file) as f:
+                state = json.load(f)
+            # Failed tasks are not restored, so resuming retries them.
+            self.completed = {
+                k: v for k, v in state.get("completed", {}).items() if k in self.tasks
+            }
 
-    if len(sys.argv) > 1:
-        command = sys.argv[1]
+    def save_state(self):
+        self.state_file.parent.mkdir(parents=True, exist_ok=True)
+        tmp_file = self.state_file.with_suffix(".tmp")
+        with open(tmp_file, "w") as f:
+            json.dump(
+                {
+                    "project": self.name,
+                    "completed": self.completed,
+                    "failed": self.failed,
+                    "updated_at": datetime.now().isoformat(),
+                },
+                f,
+                indent=2,
+            )
+        os.replace(tmp_file, self.state_file)
+
+    def blocked(self) -> List[str]:
+        """Tasks that cannot run because a dependency failed."""
+        blocked = set()
+        for name in self.order:
+            if any(d in self.failed or d in blocked for d in self.dependencies[name]):
+                blocked.add(name)
+        return [name for name in self.order if name in blocked]
+
+    def ready(self, running=()) -> List[str]:
+        return [
+            name
+            for name in self.order
+            if name not in self.completed
+            and name not in self.failed
+            and name not in running
+            and all(d in self.completed for d in self.dependencies[name])
+        ]
+
+    async def run(self, dispatcher: AgencyDispatcher = None) -> Dict:
+        dispatcher = dispatcher or AgencyDispatcher(self.agency)
+        monitor = self.agency.monitor_agent
+        monitor.track_project(self.name, list(self.order), self.dependencies)
+        for name in self.order:
+            if name in self.completed:
+                monitor.update_progress(self.name, name)
+
+        running = {}
+
+        def launch():
+            for name in self.ready(running.values()):
+                spec = self.tasks[name]
+                task = dispatcher.submit(
+                    spec["role"],
+                    spec["method"],
+                    *spec.get("args", []),
+                    **spec.get("kwargs", {}),
+                )
+                running[task] = name
+
+        launch()
+        while running:
+            done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                name = running.pop(task)
+                outcome = task.result()
+                if "error" in outcome:
+                    self.failed[name] = outcome["error"]
+                else:
+                    self.completed[name] = outcome["result"]
+                    monitor.update_progress(self.name, name)
+            self.save_state()
+            launch()
+        dispatcher.tasks.clear()
+
+        return {
+            "project": self.name,
+            "completed": [n for n in self.order if n in self.completed],
+            "failed": self.failed,
+            "blocked": self.blocked(),
+            "critical_path": self.critical_path(),
+            "status": monitor.get_status(self.name),
+        }
+
+
+def benchmark_dispatch(io_delay: float = 0.05, repeats: int = 3):
+    """Compare sequential and dispatched runs of a client project.
+
+    Agent methods are instant stubs, so each call first sleeps ``io_delay``
+    to stand in for the network or disk I/O a real call would do.
+    """
+    project = "Client Launch"
+    jobs = [
+        ("creative", "develop_campaign_concept", ("Client", "Spring launch")),
+        ("content", "write_copy", ("landing page", project)),
+        ("content", "create_social_content", ("instagram",)),
+        ("content", "write_press_release", (project,)),
+        ("designer", "create_logo", ("Client",)),
+        ("designer", "design_banner", ("1200x628",)),
+        ("uiux", "create_landing_page", (project,)),
+        ("coding", "create_frontend", (project,)),
+        ("coding", "create_backend", (project,)),
+        ("data", "create_api", ("leads",)),
+        ("visual", "create_gallery", (["a.jpg", "b.jpg"], project)),
+        ("payment", "create_payment_link", ("photography", 12000)),
+    ] * repeats
+
+    def with_io(name):
+        def call(agent, *args):
+            time.sleep(io_delay)
+            return getattr(agent, name)(*args)
+
+        call.__name__ = name
+        return call
+
+    agency = EvansMathibeAgency()
+    start = time.perf_counter()
+    for role, name, args in jobs:
+        with_io(name)(agency.get_agent(role), *args)
+    sequential = time.perf_counter() - start
+
+    dispatcher = AgencyDispatcher(agency)
+    start = time.perf_counter()
+    results = asyncio.run(
+        dispatcher.run_project([(r, with_io(n), a) for r, n, a in jobs])
+    )
+    concurrent = time.perf_counter() - start
+    dispatcher.shutdown()
+
+    return {
+        "calls": len(jobs),
+        "succeeded": sum(1 for r in results if r.get("status") == "success"),
+        "sequential_s": round(sequential, 3),
+        "dispatched_s": round(concurrent, 3),
+        "speedup": round(sequential / concurrent, 1),
+    }
+
+
+def main(argv=None, agency=None):
+    argv = sys.argv if argv is None else argv
+    agency = agency or EvansMathibeAgency()
+
+    if len(argv) > 1:
+        command = argv[1]
 
         if command == "services":
             agency.list_services()
-        elif command == "agent" and len(sys.argv) > 2:
-            agent_name = sys.argv[2]
+        elif command == "agent" and len(argv) > 2:
+            agent_name = argv[2]
             agent = agency.get_agent(agent_name)
             if agent:
                 print(f"Agent: {agent.name} - Role: {agent.role}")
@@ -332,15 +958,52 @@ def main():
             print(f"Phone: {info['phone']}")
             print(f"WhatsApp: {info['whatsapp']}")
             print(f"Email: {info['email']}")
+        elif command == "pipeline" and len(argv) > 2:
+            target = argv[2]
+            if target.endswith(".json"):
+                with open(target) as f:
+                    spec = json.load(f)
+                name, tasks = spec["name"], spec["tasks"]
+            else:
+                name = target
+                tasks = campaign_pipeline(target, *argv[3:4])
+            pipeline = ProjectPipeline(name, tasks, agency)
+            print(f"Critical path: {pipeline.critical_path()}")
+            summary = asyncio.run(pipeline.run())
+            print(json.dumps(summary, indent=2, default=str))
+        elif command == "projects":
+            for status in agency.monitor_agent.get_all_statuses():
+                print(
+                    f"{status['percentage']:>7}  {status['progress']:>7}  "
+                    f"{status['project']} ({status['status']})"
+                )
+        elif command == "metrics":
+            print(metrics_report(argv[2] if len(argv) > 2 else "summary"))
+        elif command == "bench-dispatch":
+            delay = float(argv[2]) if len(argv) > 2 else 0.05
+            print(json.dumps(benchmark_dispatch(delay), indent=2))
         else:
             print("Available commands:")
             print("  python agency.py services    - List all services")
             print("  python agency.py agent <name> - Get agent info")
             print("  python agency.py contact     - Get contact info")
+            print(
+                "  python agency.py pipeline <client|spec.json> [brief] - Run project pipeline"
+            )
+            print("  python agency.py projects    - Progress of all tracked projects")
+            print(
+                "  python agency.py metrics [json|prometheus] - Call counts and latency"
+            )
+            print(
+                "  python agency.py bench-dispatch [io_delay] - Time concurrent dispatch"
+            )
     else:
         agency.list_services()
         print("\nContact:", agency.get_contact_info())
 
 
 if __name__ == "__main__":
-    main()
+    from agency_daemon import forward
+
+    if not forward("agency"):
+        main()
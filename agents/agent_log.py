@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+"""
+EvansMathibe Agency - Agent Log Pipeline
+Agents enqueue log records and a background writer batches them to
+per-agent files with size-based rotation
+"""
+
+import atexit
+import os
+import queue
+import threading
+import time
+from collections import deque
+from pathlib import Path
+from typing import Dict, List
+
+AGENCY_ROOT = Path("/home/ev/EvansMathibe_Agency")
+LOG_DIR = AGENCY_ROOT / "logs"
+
+LEVELS = {"DEBUG": 10, "INFO": 20, "WARNING": 30, "ERROR": 40}
+
+MAX_LOG_BYTES = 5 * 1024 * 1024  # 5MB per file before rotating
+LOG_BACKUPS = 3
+RING_SIZE = 1000  # records kept in memory per agent
+BATCH_SIZE = 500
+
+
+def log_filename(name: str) -> str:
+    return f"{name.lower().replace(' ', '_')}.log"
+
+
+def format_record(record) -> str:
+    timestamp, name, level, message = record
+    stamp = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(timestamp))
+    if level == "INFO":
+        return f"[{stamp}] [{name}] {message}"
+    return f"[{stamp}] [{name}] {level}: {message}"
+
+
+class LogPipeline:
+    """Queue between agents and their log files.
+
+    ``emit`` only filters on level, stamps the time and enqueues, so logging
+    never waits on the console or the disk. A daemon thread drains the queue
+    in batches, formats each record once, echoes it to the console and
+    appends it to ``<agent>.log``, rotating to ``.log.1`` .. ``.log.N`` when
+    a file passes ``max_bytes``. The pipeline is flushed at interpreter exit.
+    A console that cannot take the echo (a closed pipe, an encoding it cannot
+    represent) or a batch that fails to write never stops the writer; lost
+    records are counted in ``dropped``.
+    """
+
+    def __init__(
+        self,
+        log_dir: Path = LOG_DIR,
+        level: str = "INFO",
+        console: bool = True,
+        max_bytes: int = MAX_LOG_BYTES,
+        backups: int = LOG_BACKUPS,
+    ):
+        self.log_dir = Path(log_dir)
+        self.level = LEVELS[level.upper()]
+        self.console = console
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self._queue = queue.SimpleQueue()
+        self._files = {}
+        self._sizes = {}
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._closed = False
+        self.dropped = 0
+
+    def set_level(self, level: str):
+        self.level = LEVELS[level.upper()]
+
+    def emit(self, name: str, message: str, level: str = "INFO"):
+        """Queue one record; returns it, or None if filtered out by level."""
+        level = level.upper()
+        levelno = LEVELS[level]
+        if levelno < self.level or self._closed:
+            return None
+        record = (time.time(), name, level, message)
+        if self._thread is None:
+            self._start()
+        self._queue.put(record)
+        return record
+
+    def _start(self):
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="agency-log-writer", daemon=True
+                )
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < BATCH_SIZE:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            records, waiters, stop = [], [], False
+            for item in batch:
+                if item is None:
+                    stop = True
+                elif isinstance(item, threading.Event):
+                    waiters.append(item)
+                else:
+                    records.append(item)
+            try:
+                self._write(records)
+            except Exception:
+                self.dropped += len(records)
+            finally:
+                for waiter in waiters:
+                    waiter.set()
+            if stop:
+                self._close_files()
+                return
+
+    def _write(self, records: List):
+        if not records:
+            return
+        by_file: Dict[str, List[str]] = {}
+        for record in records:
+            by_file.setdefault(record[1], []).append(format_record(record))
+        if self.console:
+            try:
+                print("\n".join(line for lines in by_file.values() for line in lines))
+            except OSError:
+                # e.g. ``agency.py ... | head`` closed the pipe; stop echoing.
+                self.console = False
+            except ValueError:
+                pass
+        for name, lines in by_file.items():
+            try:
+                self._append(log_filename(name), "\n".join(lines) + "\n")
+            except OSError:
+                pass
+
+    def _append(self, filename: str, text: str):
+        f = self._files.get(filename)
+        if f is None:
+            self.log_dir.mkdir(parents=True, exist_ok=True)
+            f = self._files[filename] = open(self.log_dir / filename, "a")
+            self._sizes[filename] = f.tell()
+        f.write(text)
+        f.flush()
+        self._sizes[filename] += len(text.encode())
+        if self._sizes[filename] >= self.max_bytes:
+            self._rotate(filename)
+
+    def _rotate(self, filename: str):
+        self._files.pop(filename).close()
+        self._sizes.pop(filename)
+        path = self.log_dir / filename
+        for i in range(self.backups - 1, 0, -1):
+            older = path.with_name(f"{filename}.{i}")
+            if older.exists():
+                os.replace(older, path.with_name(f"{filename}.{i + 1}"))
+        if self.backups:
+            os.replace(path, path.with_name(f"{filename}.1"))
+        else:
+            path.unlink()
+
+    def _close_files(self):
+        for f in self._files.values():
+            f.close()
+        self._files.clear()
+        self._sizes.clear()
+
+    def flush(self, timeout: float = 5.0) -> bool:
+        """Block until every record queued so far has been written.
+
+        Returns False on timeout, or if the writer has stopped with records
+        still queued.
+        """
+        if self._thread is None:
+            return True
+        if not self._thread.is_alive():
+            return self._queue.empty()
+        done = threading.Event()
+        self._queue.put(done)
+        return done.wait(timeout)
+
+    def close(self, timeout: float = 5.0):
+        """Write out the queue and stop the writer thread."""
+        if self._closed:
+            return
+        self._closed = True
+        if self._thread is not None and self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join(timeout)
+
+
+PIPELINE = LogPipeline(level=os.environ.get("AGENCY_LOG_LEVEL", "INFO"))
+atexit.register(PIPELINE.close)
+
+
+class AgentLogger:
+    """Per-agent handle on the shared pipeline with a bounded ring buffer
+    of recent records for in-process inspection."""
+
+    def __init__(self, name: str, pipeline: LogPipeline = None, size: int = RING_SIZE):
+        self.name = name
+        self.pipeline = pipeline or PIPELINE
+        self.recent = deque(maxlen=size)
+
+    def log(self, message: str, level: str = "INFO"):
+        record = self.pipeline.emit(self.name, message, level)
+        if record is not None:
+            self.recent.append(record)
+
+    def entries(self) -> List[str]:
+        """Recent records formatted as they appear in the log file."""
+        return [format_record(record) for record in self.recent]
+
+    def flush(self) -> bool:
+        return self.pipeline.flush()
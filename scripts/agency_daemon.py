@@ -0,0 +1,332 @@
+#!/usr/bin/env python3
+"""
+EvansMathibe Agency - Agency Daemon
+Keeps the agency, task history and asset index loaded in one long-running
+process and serves the CLIs over a Unix socket with a line-delimited JSON
+protocol
+"""
+
+import io
+import json
+import os
+import socket
+import sys
+import threading
+import time
+from pathlib import Path
+
+AGENCY_ROOT = Path("/home/ev/EvansMathibe_Agency")
+SOCKET_PATH = Path(os.environ.get("AGENCY_SOCKET", AGENCY_ROOT / "run" / "agency.sock"))
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+CLIS = ["agency", "task_history", "visual_manager", "payment"]
+
+
+def request(message: dict, socket_path: Path = SOCKET_PATH, timeout: float = None):
+    """Send one request to the daemon and return its decoded reply."""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        sock.connect(str(socket_path))
+        sock.sendall(json.dumps(message).encode() + b"\n")
+        with sock.makefile("rb") as reader:
+            line = reader.readline()
+    if not line:
+        raise ConnectionError("daemon closed the connection")
+    return json.loads(line)
+
+
+def _absolute_args(argv):
+    """Make arguments that name existing relative paths absolute, since the
+    daemon does not share the client's working directory."""
+    return [
+        os.path.abspath(arg) if not os.path.isabs(arg) and os.path.exists(arg) else arg
+        for arg in argv
+    ]
+
+
+def forward(cli: str, argv=None) -> bool:
+    """Run a CLI command in the daemon when ``AGENCY_DAEMON=1`` is set.
+
+    Prints the command's output and exits with its status. Returns False,
+    so the caller runs the command itself, when thin mode is off or no
+    daemon is listening.
+    """
+    if os.environ.get("AGENCY_DAEMON") != "1":
+        return False
+    argv = sys.argv if argv is None else argv
+    message = {"op": "cli", "cli": cli, "argv": [argv[0]] + _absolute_args(argv[1:])}
+    try:
+        reply = request(message)
+    except (OSError, ValueError):
+        return False
+    sys.stdout.write(reply.get("stdout", ""))
+    sys.stderr.write(reply.get("stderr", ""))
+    if reply.get("code"):
+        sys.exit(reply["code"])
+    return True
+
+
+class ThreadLocalStream:
+    """Stand-in for ``sys.stdout`` that sends each thread's writes to its
+    own buffer while a request is being handled, and to the real stream
+    otherwise."""
+
+    def __init__(self, default):
+        self.default = default
+        self.local = threading.local()
+
+    @property
+    def current(self):
+        return getattr(self.local, "buffer", None) or self.default
+
+    def write(self, text):
+        return self.current.write(text)
+
+    def flush(self):
+        return self.current.flush()
+
+    def __getattr__(self, name):
+        return getattr(self.current, name)
+
+
+class AgencyDaemon:
+    """Serves CLI commands and method calls against warm, shared objects.
+
+    Each client connection gets its own thread. Commands for the same CLI
+    are serialised on a per-CLI lock because the objects they share are
+    not thread-safe; commands for different CLIs run in parallel.
+    """
+
+    def __init__(self, socket_path: Path = SOCKET_PATH):
+        sys.path.insert(0, str(REPO_ROOT / "agents"))
+        sys.path.insert(0, str(REPO_ROOT / "scripts"))
+        import agency
+        import payment
+        import task_history
+        import visual_manager
+
+        self.socket_path = Path(socket_path)
+        self.modules = {
+            "agency": agency,
+            "task_history": task_history,
+            "visual_manager": visual_manager,
+            "payment": payment,
+        }
+        self.objects = {
+            "agency": agency.EvansMathibeAgency(),
+            "task_history": task_history.open_history(),
+            "visual_manager": visual_manager.VisualAssetsManager(),
+            "payment": None,
+        }
+        self.locks = {name: threading.Lock() for name in CLIS}
+        self.started = time.time()
+        self.served = 0
+        self._server = None
+
+    def _payment_handler(self):
+        if self.objects["payment"] is None:
+            try:
+                self.objects["payment"] = self.modules["payment"].StripePaymentHandler()
+            except RuntimeError:
+                pass
+        return self.objects["payment"]
+
+    def _refresh(self, cli: str):
+        """Catch a warm object up with writes from cron jobs, direct CLI runs
+        and other instances before serving a command (lock held)."""
+        refresh = getattr(self.objects[cli], "refresh", None)
+        if refresh is not None:
+            refresh()
+
+    def run_cli(self, cli: str, argv) -> dict:
+        if cli not in self.modules:
+            return {"stdout": "", "stderr": f"Unknown CLI: {cli}\n", "code": 2}
+        stdout, stderr, code = io.StringIO(), "", 0
+        with self.locks[cli]:
+            target = self._payment_handler() if cli == "payment" else self.objects[cli]
+            self._refresh(cli)
+            sys.stdout.local.buffer = stdout
+            try:
+                self.modules[cli].main(argv, target)
+            except SystemExit as e:
+                code = e.code if isinstance(e.code, int) else 1
+            except Exception as e:
+                stderr, code = f"{type(e).__name__}: {e}\n", 1
+            finally:
+                sys.stdout.local.buffer = None
+        return {"stdout": stdout.getvalue(), "stderr": stderr, "code": code}
+
+    def _resolve(self, target: str):
+        if target.startswith("agent."):
+            return "agency", self.objects["agency"].get_agent(target[6:])
+        if target == "history":
+            return "task_history", self.objects["task_history"]
+        if target == "visual":
+            return "visual_manager", self.objects["visual_manager"]
+        if target == "payment":
+            return "payment", self._payment_handler()
+        if target == "agency":
+            return "agency", self.objects["agency"]
+        return None, None
+
+    def call(self, target: str, method: str, args=(), kwargs=None) -> dict:
+        """Call a public method on one of the warm objects."""
+        cli, obj = self._resolve(target)
+        if obj is None:
+            return {"error": f"Unknown target: {target}"}
+        if method.startswith("_") or not callable(getattr(obj, method, None)):
+            return {"error": f"{target} has no method {method}"}
+        with self.locks[cli]:
+            self._refresh(cli)
+            try:
+                result = getattr(obj, method)(*args, **(kwargs or {}))
+            except Exception as e:
+                return {"error": f"{type(e).__name__}: {e}"}
+        return {"result": json.loads(json.dumps(result, default=str))}
+
+    def status(self) -> dict:
+        return {
+            "pid": os.getpid(),
+            "uptime_s": round(time.time() - self.started, 1),
+            "served": self.served,
+            "socket": str(self.socket_path),
+        }
+
+    def handle(self, message: dict) -> dict:
+        self.served += 1
+        op = message.get("op")
+        if op == "cli":
+            return self.run_cli(message.get("cli"), message.get("argv") or [""])
+        if op == "call":
+            return self.call(
+                message.get("target", ""),
+                message.get("method", ""),
+                message.get("args", []),
+                message.get("kwargs"),
+            )
+        if op == "ping":
+            return {"status": "ok"}
+        if op == "status":
+            return self.status()
+        if op == "shutdown":
+            threading.Thread(target=self._server.shutdown).start()
+            return {"status": "stopping"}
+        return {"error": f"Unknown op: {op}"}
+
+    def serve(self):
+        import signal
+        import socketserver
+
+        daemon = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                for line in self.rfile:
+                    try:
+                        reply = daemon.handle(json.loads(line))
+                    except ValueError as e:
+                        reply = {"error": f"Bad request: {e}"}
+                    self.wfile.write(json.dumps(reply).encode() + b"\n")
+
+        class Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+            daemon_threads = True
+
+        if self.socket_path.exists():
+            try:
+                request({"op": "ping"}, self.socket_path, timeout=1)
+                raise RuntimeError(f"Daemon already running on {self.socket_path}")
+            except OSError:
+                self.socket_path.unlink()
+        self.socket_path.parent.mkdir(parents=True, exist_ok=True)
+
+        sys.stdout = ThreadLocalStream(sys.stdout)
+        self._server = Server(str(self.socket_path), Handler)
+        if threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGTERM, lambda *_: self.handle({"op": "shutdown"}))
+        print(f"Agency daemon listening on {self.socket_path} (pid {os.getpid()})")
+        try:
+            self._server.serve_forever()
+        finally:
+            self._server.server_close()
+            if self.socket_path.exists():
+                self.socket_path.unlink()
+            sys.stdout = sys.stdout.default
+
+
+def benchmark(runs: int = 20, command=("task_history", "list", "5")):
+    """Compare running a CLI command directly, through its own thin client
+    mode, and through this module's client, against a running daemon."""
+    import subprocess
+    import statistics
+
+    cli, args = command[0], list(command[1:])
+    script = REPO_ROOT / ("agents" if cli == "agency" else "scripts") / f"{cli}.py"
+    local_env = dict(os.environ, AGENCY_DAEMON="0")
+    thin_env = dict(os.environ, AGENCY_DAEMON="1")
+    variants = {
+        "direct": ([sys.executable, str(script)] + args, local_env),
+        "cli_thin_mode": ([sys.executable, str(script)] + args, thin_env),
+        "daemon_client": (
+            [sys.executable, __file__, "run", cli] + args,
+            thin_env,
+        ),
+    }
+    report = {"command": " ".join(command), "runs": runs}
+    for name, (cmd, env) in variants.items():
+        times = []
+        for _ in range(runs):
+            start = time.perf_counter()
+            subprocess.run(cmd, env=env, capture_output=True)
+            times.append(time.perf_counter() - start)
+        report[f"{name}_ms"] = round(statistics.median(times) * 1000, 1)
+
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        request({"op": "cli", "cli": cli, "argv": [str(script)] + args})
+        times.append(time.perf_counter() - start)
+    report["in_process_request_ms"] = round(statistics.median(times) * 1000, 2)
+    return report
+
+
+def main():
+    command = sys.argv[1] if len(sys.argv) > 1 else ""
+
+    if command == "serve":
+        AgencyDaemon().serve()
+    elif command in ("status", "stop"):
+        try:
+            reply = request({"op": "status" if command == "status" else "shutdown"})
+        except OSError:
+            print(f"No daemon listening on {SOCKET_PATH}")
+            sys.exit(1)
+        print(json.dumps(reply, indent=2))
+    elif command == "run" and len(sys.argv) > 2:
+        os.environ["AGENCY_DAEMON"] = "1"
+        if not forward(sys.argv[2], sys.argv[2:]):
+            print(f"No daemon listening on {SOCKET_PATH}")
+            sys.exit(1)
+    elif command == "call" and len(sys.argv) > 3:
+        args = [json.loads(a) if a[:1] in '[{"0123456789-' else a for a in sys.argv[4:]]
+        reply = request(
+            {"op": "call", "target": sys.argv[2], "method": sys.argv[3], "args": args}
+        )
+        print(json.dumps(reply, indent=2))
+    elif command == "bench":
+        runs = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+        bench_command = sys.argv[3:] or ("task_history", "list", "5")
+        print(json.dumps(benchmark(runs, bench_command), indent=2))
+    else:
+        print("Usage:")
+        print("  python agency_daemon.py serve                 - Start the daemon")
+        print("  python agency_daemon.py status|stop           - Query or stop it")
+        print("  python agency_daemon.py run <cli> [args ...]  - Run a CLI command")
+        print("  python agency_daemon.py call <target> <method> [args ...]")
+        print("      targets: agency, agent.<role>, history, visual, payment")
+        print("  python agency_daemon.py bench [runs] [cli args ...]")
+        print("\nSet AGENCY_DAEMON=1 to have agency.py, task_history.py,")
+        print("visual_manager.py and payment.py forward commands to the daemon.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+"""
+EvansMathibe Agency - Metrics
+Call counts, error counts and latency histograms for agent methods,
+encoder subprocesses and Stripe calls, exportable as JSON or Prometheus text
+"""
+
+import atexit
+import fcntl
+import functools
+import json
+import os
+import subprocess
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, List
+
+AGENCY_ROOT = Path("/home/ev/EvansMathibe_Agency")
+METRICS_FILE = AGENCY_ROOT / "data" / "metrics.json"
+
+# Upper bounds in seconds; a final bucket catches everything slower.
+LATENCY_BUCKETS = [0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 30.0, 120.0]
+
+
+class MetricsRegistry:
+    """Per ``(component, operation)`` counters and latency histograms.
+
+    Each process accumulates in memory and merges its totals into
+    ``METRICS_FILE`` at exit, so the file reflects every CLI run and daemon
+    that has touched the agency.
+    """
+
+    def __init__(self, buckets: List[float] = LATENCY_BUCKETS):
+        self.buckets = list(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def _new_series(self) -> Dict:
+        return {
+            "calls": 0,
+            "errors": 0,
+            "sum": 0.0,
+            "buckets": [0] * (len(self.buckets) + 1),
+        }
+
+    def observe(self, component: str, operation: str, seconds: float, error=False):
+        slot = bisect_left(self.buckets, seconds)
+        with self._lock:
+            series = self._series.get((component, operation))
+            if series is None:
+                series = self._series[(component, operation)] = self._new_series()
+            series["calls"] += 1
+            series["errors"] += bool(error)
+            series["sum"] += seconds
+            series["buckets"][slot] += 1
+
+    @contextmanager
+    def timed(self, component: str, operation: str):
+        """Time the block; an exception escaping it counts as an error."""
+        start = time.perf_counter()
+        error = True
+        try:
+            yield
+            error = False
+        finally:
+            self.observe(component, operation, time.perf_counter() - start, error)
+
+    def instrument(self, component: str, operation: str = None):
+        """Decorator timing every call of the wrapped function."""
+
+        def decorator(func):
+            name = operation or func.__name__
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                error = True
+                try:
+                    result = func(*args, **kwargs)
+                    error = isinstance(result, dict) and "error" in result
+                    return result
+                finally:
+                    self.observe(component, name, time.perf_counter() - start, error)
+
+            return wrapper
+
+        return decorator
+
+    def snapshot(self) -> Dict[str, Dict[str, Dict]]:
+        """``{component: {operation: series}}`` copied out of the registry."""
+        data = {}
+        with self._lock:
+            for (component, operation), series in self._series.items():
+                data.setdefault(component, {})[operation] = dict(
+                    series, buckets=list(series["buckets"])
+                )
+        return data
+
+    def merge(self, data: Dict[str, Dict[str, Dict]]):
+        with self._lock:
+            for component, operations in data.items():
+                for operation, other in operations.items():
+                    if len(other["buckets"]) != len(self.buckets) + 1:
+                        continue
+                    series = self._series.get((component, operation))
+                    if series is None:
+                        series = self._series[(component, operation)] = (
+                            self._new_series()
+                        )
+                    series["calls"] += other["calls"]
+                    series["errors"] += other["errors"]
+                    series["sum"] += other["sum"]
+                    for i, count in enumerate(other["buckets"]):
+                        series["buckets"][i] += count
+
+    def reset(self):
+        with self._lock:
+            self._series.clear()
+
+    def load(self, path: Path = METRICS_FILE):
+        """Add the totals persisted at ``path`` into this registry."""
+        try:
+            with open(path) as f:
+                self.merge(json.load(f).get("series", {}))
+        except (OSError, ValueError):
+            pass
+
+    def save(self, path: Path = METRICS_FILE):
+        """Merge this process's totals into ``path`` and start counting afresh."""
+        data = self.snapshot()
+        if not data:
+            return
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path.with_suffix(".lock"), "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            total = MetricsRegistry(self.buckets)
+            total.load(path)
+            total.merge(data)
+            tmp_file = path.with_suffix(f".{os.getpid()}.tmp")
+            with open(tmp_file, "w") as f:
+                json.dump(total.to_dict(), f)
+            os.replace(tmp_file, path)
+        self.reset()
+
+    def to_dict(self) -> Dict:
+        return {"buckets": self.buckets, "series": self.snapshot()}
+
+    def to_json(self) -> str:
+        return json.dumps(self.to_dict(), indent=2)
+
+    def to_prometheus(self) -> str:
+        lines = [
+            "# HELP agency_operation_seconds Latency of agency operations",
+            "# TYPE agency_operation_seconds histogram",
+        ]
+        errors = [
+            "# HELP agency_operation_errors_total Failed agency operations",
+            "# TYPE agency_operation_errors_total counter",
+        ]
+        for component, operations in sorted(self.snapshot().items()):
+            for operation, series in sorted(operations.items()):
+                labels = f'component="{component}",operation="{operation}"'
+                cumulative = 0
+                for bound, count in zip(self.buckets + ["+Inf"], series["buckets"]):
+                    cumulative += count
+                    lines.append(
+                        f'agency_operation_seconds_bucket{{{labels},le="{bound}"}} '
+                        f"{cumulative}"
+                    )
+                lines.append(
+                    f"agency_operation_seconds_sum{{{labels}}} {series['sum']}"
+                )
+                lines.append(
+                    f"agency_operation_seconds_count{{{labels}}} {series['calls']}"
+                )
+                errors.append(
+                    f"agency_operation_errors_total{{{labels}}} {series['errors']}"
+                )
+        return "\n".join(lines + errors) + "\n"
+
+    def quantile(self, series: Dict, q: float) -> float:
+        """Upper bound of the bucket holding the ``q`` quantile."""
+        rank = q * series["calls"]
+        cumulative = 0
+        for bound, count in zip(self.buckets, series["buckets"]):
+            cumulative += count
+            if cumulative >= rank:
+                return bound
+        return float("inf")
+
+    def summary(self) -> List[Dict]:
+        """One row per operation, slowest total time first."""
+        rows = []
+        for component, operations in self.snapshot().items():
+            for operation, series in operations.items():
+                rows.append(
+                    {
+                        "component": component,
+                        "operation": operation,
+                        "calls": series["calls"],
+                        "errors": series["errors"],
+                        "total_s": round(series["sum"], 4),
+                        "mean_ms": round(series["sum"] / series["calls"] * 1000, 3),
+                        "p95_le_s": self.quantile(series, 0.95),
+                    }
+                )
+        rows.sort(key=lambda row: row["total_s"], reverse=True)
+        return rows
+
+
+METRICS = MetricsRegistry()
+
+
+def _save_at_exit():
+    # Metrics are best-effort: a machine without the agency root (or without
+    # write access to it) must not end every CLI run with a traceback.
+    try:
+        METRICS.save()
+    except OSError:
+        pass
+
+
+if os.environ.get("AGENCY_METRICS", "1") != "0":
+    atexit.register(_save_at_exit)
+
+
+def timed(component: str, operation: str):
+    return METRICS.timed(component, operation)
+
+
+def instrument(component: str, operation: str = None):
+    return METRICS.instrument(component, operation)
+
+
+def run_command(cmd, **kwargs) -> subprocess.CompletedProcess:
+    """``subprocess.run`` timed under the program's name.
+
+    A non-zero exit status counts as an error even when ``check`` is off.
+    """
+    start = time.perf_counter()
+    error = True
+    try:
+        result = subprocess.run(cmd, **kwargs)
+        error = result.returncode != 0
+        return result
+    finally:
+        METRICS.observe(
+            "subprocess", Path(cmd[0]).name, time.perf_counter() - start, error
+        )
+
+
+def collected() -> MetricsRegistry:
+    """Persisted totals plus whatever this process has not saved yet."""
+    totals = MetricsRegistry(METRICS.buckets)
+    totals.load()
+    totals.merge(METRICS.snapshot())
+    return totals
+
+
+def report(fmt: str = "summary") -> str:
+    totals = collected()
+    if fmt == "json":
+        return totals.to_json()
+    if fmt == "prometheus":
+        return totals.to_prometheus().rstrip("\n")
+    rows = totals.summary()
+    if not rows:
+        return "No metrics recorded yet"
+    return "\n".join(
+        f"{row['component']:>20}.{row['operation']:<28} "
+        f"calls={row['calls']:<6} errors={row['errors']:<4} "
+        f"mean={row['mean_ms']}ms p95<={row['p95_le_s']}s"
+        for row in rows
+    )
+
+
+def main():
+    import sys
+
+    print(report(sys.argv[1] if len(sys.argv) > 1 else "summary"))
+
+
+if __name__ == "__main__":
+    main()
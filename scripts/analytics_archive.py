@@ -0,0 +1,485 @@
+#!/usr/bin/env python3
+"""
+EvansMathibe Agency - Analytics Archive
+Compacts the analytics snapshots in data/archive into day-partitioned
+JSON-lines files with hourly, daily and monthly rollups, so trend queries
+read a few partitions instead of every snapshot
+"""
+
+import json
+import os
+import re
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, Iterator, List
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+ARCHIVE_DIR = REPO_ROOT / "data" / "archive"
+STORE_DIR = REPO_ROOT / "data" / "analytics"
+
+SNAPSHOT_PATTERN = re.compile(
+    r"analytics_(\d{4}-\d{2}-\d{2})_(\d{2})-(\d{2})-(\d{2})\.json$"
+)
+TIMESTAMP_FORMATS = ("%Y-%m-%d_%H-%M-%S", "%Y-%m-%d %H:%M:%S")
+LEVELS = {"hour": 13, "day": 10, "month": 7}  # prefix length of the ISO time
+READ_CHUNK = 1 << 16  # characters read from a snapshot file at a time
+
+
+def parse_timestamp(value):
+    """``datetime`` for an archive timestamp, or None if it is not one.
+
+    Older snapshots carry the literal ``$DATE`` because the workflow's
+    heredoc was quoted, so callers fall back to the file name.
+    """
+    if not isinstance(value, str):
+        return None
+    try:
+        return datetime.fromisoformat(value.replace("Z", "+00:00")).replace(tzinfo=None)
+    except ValueError:
+        pass
+    for fmt in TIMESTAMP_FORMATS:
+        try:
+            return datetime.strptime(value, fmt)
+        except ValueError:
+            continue
+    return None
+
+
+def filename_timestamp(name: str):
+    match = SNAPSHOT_PATTERN.search(name)
+    if not match:
+        return None
+    day, hour, minute, second = match.groups()
+    return datetime.fromisoformat(f"{day}T{hour}:{minute}:{second}")
+
+
+def iter_json_values(stream, chunk_size: int = READ_CHUNK) -> Iterator:
+    """Each JSON value in a text ``stream``: a single document, the items of
+    a top-level list, or one value per line or back to back.
+
+    The stream is read a chunk at a time and only the value being decoded
+    is held, so a large list of snapshots is never read whole.
+    """
+    decoder = json.JSONDecoder()
+    buffer, position, eof, in_list = "", 0, False, False
+    while True:
+        separators = " \t\r\n," if in_list else " \t\r\n"
+        while position < len(buffer) and buffer[position] in separators:
+            position += 1
+        if position == len(buffer):
+            if eof:
+                if in_list:
+                    raise ValueError("Unterminated list of snapshots")
+                return
+            buffer, position = stream.read(chunk_size), 0
+            eof = not buffer
+            continue
+        if buffer[position] == "[" and not in_list:
+            in_list, position = True, position + 1
+            continue
+        if buffer[position] == "]" and in_list:
+            in_list, position = False, position + 1
+            continue
+        try:
+            value, end = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            end = len(buffer)
+        if end == len(buffer) and not eof:
+            # The value may go on in the next chunk. Read at least as much
+            # again as is held, so a large value is decoded a bounded number
+            # of times.
+            chunk = stream.read(max(chunk_size, len(buffer) - position))
+            buffer, position = buffer[position:] + chunk, 0
+            eof = not chunk
+            continue
+        position = end
+        yield value
+
+
+def flatten_metrics(value, prefix: str = "", into: Dict = None) -> Dict[str, float]:
+    """Numeric leaves of a snapshot keyed by dotted path."""
+    into = {} if into is None else into
+    if isinstance(value, dict):
+        for key, item in value.items():
+            flatten_metrics(item, f"{prefix}{key}.", into)
+    elif isinstance(value, (int, float)) and not isinstance(value, bool):
+        into[prefix[:-1]] = value
+    return into
+
+
+def snapshot_records(path: Path) -> Iterator[Dict]:
+    """Store records for one snapshot file, timestamped from the snapshot,
+    else its file name, else its modification time."""
+    fallback = filename_timestamp(path.name)
+    source = "filename"
+    if fallback is None:
+        mtime = datetime.fromtimestamp(int(path.stat().st_mtime), timezone.utc)
+        fallback = mtime.replace(tzinfo=None)
+        source = "mtime"
+    with open(path) as f:
+        for snapshot in iter_json_values(f):
+            if not isinstance(snapshot, dict):
+                continue
+            data = {k: v for k, v in snapshot.items() if k != "timestamp"}
+            ts = parse_timestamp(snapshot.get("timestamp"))
+            yield {
+                "ts": (ts or fallback).isoformat(),
+                "ts_from": "snapshot" if ts else source,
+                "file": path.name,
+                "type": snapshot.get("type", "unknown"),
+                "data": data,
+            }
+
+
+def empty_bucket() -> Dict:
+    return {"snapshots": 0, "types": {}, "metrics": {}}
+
+
+def add_to_bucket(bucket: Dict, record: Dict):
+    bucket["snapshots"] += 1
+    bucket["types"][record["type"]] = bucket["types"].get(record["type"], 0) + 1
+    for name, value in flatten_metrics(record["data"]).items():
+        stats = bucket["metrics"].get(name)
+        if stats is None:
+            bucket["metrics"][name] = {
+                "count": 1,
+                "sum": value,
+                "min": value,
+                "max": value,
+            }
+        else:
+            stats["count"] += 1
+            stats["sum"] += value
+            stats["min"] = min(stats["min"], value)
+            stats["max"] = max(stats["max"], value)
+
+
+class AnalyticsStore:
+    """Append-only, day-partitioned store of archive snapshots.
+
+    ``days/<YYYY-MM-DD>.jsonl`` holds one record per snapshot and
+    ``rollups/<YYYY-MM>.json`` the count, sum, min and max of every numeric
+    field per hour, day and month of that month. ``state.json`` lists the
+    snapshot files already compacted and the committed size of each
+    partition. Compacting reads only new snapshots, appends them to their
+    day partitions, and rewrites only the rollups of the months they fall
+    in. ``state.json`` is replaced last, so a partition that grew past its
+    committed size belongs to a compaction that did not finish: it is cut
+    back and its month's rollups rebuilt before the next one.
+    """
+
+    def __init__(self, store_dir: Path = STORE_DIR, archive_dir: Path = ARCHIVE_DIR):
+        self.store_dir = Path(store_dir)
+        self.archive_dir = Path(archive_dir)
+        self.days_dir = self.store_dir / "days"
+        self.rollups_dir = self.store_dir / "rollups"
+        self.state_file = self.store_dir / "state.json"
+        self.state = self._read(
+            self.state_file, {"files": [], "partitions": {}, "timestamps_from": {}}
+        )
+        self._months = {}
+
+    @staticmethod
+    def _read(path: Path, default):
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return default
+
+    @staticmethod
+    def _write(path: Path, value):
+        tmp_file = path.with_suffix(".tmp")
+        with open(tmp_file, "w") as f:
+            f.write(json.dumps(value, separators=(",", ":")))
+        os.replace(tmp_file, path)
+
+    def _month(self, month: str) -> Dict:
+        """Rollups of one month, ``{level: {bucket: stats}}``."""
+        if month not in self._months:
+            self._months[month] = self._read(
+                self.rollups_dir / f"{month}.json", {level: {} for level in LEVELS}
+            )
+        return self._months[month]
+
+    def _add(self, record: Dict):
+        rollups = self._month(record["ts"][:7])
+        for level, width in LEVELS.items():
+            bucket = rollups[level].get(record["ts"][:width])
+            if bucket is None:
+                bucket = rollups[level][record["ts"][:width]] = empty_bucket()
+            add_to_bucket(bucket, record)
+
+    def _save_months(self, months):
+        self.rollups_dir.mkdir(parents=True, exist_ok=True)
+        for month in months:
+            self._write(self.rollups_dir / f"{month}.json", self._month(month))
+
+    def _recover(self):
+        """Undo the partition appends of an unfinished compaction."""
+        if not self.days_dir.exists():
+            return
+        committed = self.state["partitions"]
+        damaged = set()
+        for partition in self.days_dir.glob("*.jsonl"):
+            size = committed.get(partition.stem)
+            if size is None:
+                partition.unlink()
+            elif partition.stat().st_size > size:
+                os.truncate(partition, size)
+            else:
+                continue
+            damaged.add(partition.stem[:7])
+        for month in damaged:
+            self._months[month] = {level: {} for level in LEVELS}
+            for record in self.query(f"{month}-01", f"{month}-31"):
+                self._add(record)
+        self._save_months(damaged)
+
+    def _archived(self):
+        """Names of the snapshot files in the archive, or None if it is
+        missing."""
+        if not self.archive_dir.exists():
+            return None
+        return {
+            entry.name
+            for entry in os.scandir(self.archive_dir)
+            if entry.name.endswith(".json")
+        }
+
+    def pending(self, archived=None) -> List[Path]:
+        """Snapshot files in the archive that have not been compacted."""
+        archived = self._archived() if archived is None else archived
+        done = set(self.state["files"])
+        return sorted(
+            self.archive_dir / name for name in archived or () if name not in done
+        )
+
+    def compact(self, remove: bool = False) -> Dict:
+        """Fold new snapshots into the partitions and rollups.
+
+        With ``remove``, compacted snapshot files are deleted afterwards.
+        """
+        start = time.perf_counter()
+        self._recover()
+        archived = self._archived()
+        files = self.pending(archived)
+        if archived is not None:
+            # Forget snapshots that have left the archive, so the list only
+            # grows with the archive itself.
+            self.state["files"] = [n for n in self.state["files"] if n in archived]
+        by_day, skipped = {}, []
+        sources = self.state["timestamps_from"]
+        for path in files:
+            try:
+                records = list(snapshot_records(path))
+            except (OSError, ValueError):
+                skipped.append(path.name)
+                continue
+            for record in records:
+                sources[record["ts_from"]] = sources.get(record["ts_from"], 0) + 1
+                by_day.setdefault(record["ts"][:10], []).append(record)
+                self._add(record)
+
+        self.days_dir.mkdir(parents=True, exist_ok=True)
+        for day, records in sorted(by_day.items()):
+            partition = self.days_dir / f"{day}.jsonl"
+            with open(partition, "a") as f:
+                f.write(
+                    "".join(
+                        json.dumps(r, separators=(",", ":")) + "\n" for r in records
+                    )
+                )
+                f.flush()
+                os.fsync(f.fileno())
+            self.state["partitions"][day] = partition.stat().st_size
+        self._save_months({day[:7] for day in by_day})
+
+        compacted = [p.name for p in files if p.name not in skipped]
+        self.state["files"].extend(compacted)
+        self.state["updated_at"] = datetime.now().isoformat()
+        self._write(self.state_file, self.state)
+
+        if remove:
+            for path in files:
+                if path.name not in skipped:
+                    path.unlink()
+        return {
+            "status": "success",
+            "compacted": len(compacted),
+            "records": sum(len(r) for r in by_day.values()),
+            "days_touched": len(by_day),
+            "skipped": skipped,
+            "seconds": round(time.perf_counter() - start, 4),
+        }
+
+    def partitions(self, start: str = None, end: str = None) -> List[Path]:
+        """Day partitions overlapping ``[start, end]`` (ISO dates or times)."""
+        first = (start or "")[:10]
+        last = (end or "9999")[:10]
+        return [
+            self.days_dir / f"{day}.jsonl"
+            for day in sorted(self.state["partitions"])
+            if first <= day <= last
+        ]
+
+    def query(self, start: str = None, end: str = None) -> Iterator[Dict]:
+        """Records with ``start <= ts <= end``, oldest first, reading only
+        the partitions in range. ``end`` may be a date, hour or full time."""
+        low, high = start or "", end or "9999"
+        for partition in self.partitions(start, end):
+            with open(partition) as f:
+                records = [json.loads(line) for line in f]
+            records.sort(key=lambda r: r["ts"])
+            for record in records:
+                if low <= record["ts"] and record["ts"][: len(high)] <= high:
+                    yield record
+
+    def rollup(self, level: str = "day", start: str = None, end: str = None):
+        """``{bucket: stats}`` at ``level`` for buckets within the range,
+        reading only the months in range."""
+        if level not in LEVELS:
+            raise ValueError(f"Unknown rollup level: {level}")
+        width = LEVELS[level]
+        low = (start or "")[:width]
+        high = (end or "9999")[:width]
+        months = sorted({day[:7] for day in self.state["partitions"]})
+        result = {}
+        for month in months:
+            if low[:7] <= month <= high[:7]:
+                for bucket, stats in sorted(self._month(month)[level].items()):
+                    if low <= bucket <= high:
+                        result[bucket] = stats
+        return result
+
+    def stats(self) -> Dict:
+        partitions = self.state["partitions"]
+        return {
+            "snapshots_compacted": len(self.state["files"]),
+            "pending": len(self.pending()),
+            "partitions": len(partitions),
+            "bytes": sum(partitions.values()),
+            "first_day": min(partitions, default=None),
+            "last_day": max(partitions, default=None),
+            "timestamps_from": self.state["timestamps_from"],
+        }
+
+
+def benchmark(snapshots: int = 5000, per_day: int = 4):
+    """Compare a trend query over raw snapshot files with the same query
+    against the compacted store, on synthetic snapshots."""
+    import random
+    import tempfile
+    from datetime import timedelta
+
+    rng = random.Random(11)
+    with tempfile.TemporaryDirectory() as tmp:
+        archive = Path(tmp) / "archive"
+        archive.mkdir()
+        first = datetime(2024, 1, 1, 2, 30)
+        step = timedelta(hours=24 / per_day)
+        for i in range(snapshots):
+            ts = first + step * i
+            snapshot = {
+                "timestamp": "$DATE" if i % 3 else ts.isoformat(),
+                "type": "automated_archive",
+                "visitors": {
+                    "total": rng.randint(0, 500),
+                    "mobile": rng.randint(0, 300),
+                },
+                "page_views": rng.randint(0, 2000),
+            }
+            name = f"analytics_{ts:%Y-%m-%d_%H-%M-%S}.json"
+            (archive / name).write_text(json.dumps(snapshot, indent=2))
+        last_day = (first + step * (snapshots - 1)).date()
+        start = (last_day - timedelta(days=30)).isoformat()
+        end = last_day.isoformat()
+
+        def scan():
+            total = 0
+            for path in sorted(archive.glob("analytics_*.json")):
+                for record in snapshot_records(path):
+                    if start <= record["ts"][:10] <= end:
+                        total += record["data"]["page_views"]
+            return total
+
+        report = {"snapshots": snapshots, "query_days": 31}
+        t = time.perf_counter()
+        expected = scan()
+        report["scan_files_s"] = round(time.perf_counter() - t, 4)
+
+        store = AnalyticsStore(Path(tmp) / "store", archive)
+        report["initial_compact_s"] = store.compact()["seconds"]
+
+        t = time.perf_counter()
+        raw = sum(r["data"]["page_views"] for r in store.query(start, end))
+        report["partition_query_s"] = round(time.perf_counter() - t, 4)
+
+        t = time.perf_counter()
+        rolled = sum(
+            s["metrics"]["page_views"]["sum"]
+            for s in store.rollup("day", start, end).values()
+        )
+        report["rollup_query_s"] = round(time.perf_counter() - t, 5)
+
+        for i in range(snapshots, snapshots + per_day):
+            ts = first + step * i
+            name = f"analytics_{ts:%Y-%m-%d_%H-%M-%S}.json"
+            (archive / name).write_text(json.dumps({"timestamp": "$DATE"}))
+        reopened = AnalyticsStore(Path(tmp) / "store", archive)
+        report["incremental_compact_s"] = reopened.compact()["seconds"]
+        report["results_match"] = expected == raw == rolled
+    return report
+
+
+def print_rows(rows):
+    for row in rows:
+        print(json.dumps(row))
+
+
+def main():
+    args = [a for a in sys.argv[1:] if not a.startswith("--")]
+    flags = {a for a in sys.argv[1:] if a.startswith("--")}
+    command = args[0] if args else ""
+    store = AnalyticsStore()
+
+    if command == "compact":
+        print(json.dumps(store.compact(remove="--remove" in flags), indent=2))
+    elif command == "query":
+        print_rows(
+            store.query(
+                args[1] if len(args) > 1 else None, args[2] if len(args) > 2 else None
+            )
+        )
+    elif command == "rollup":
+        level = args[1] if len(args) > 1 else "day"
+        rows = store.rollup(
+            level,
+            args[2] if len(args) > 2 else None,
+            args[3] if len(args) > 3 else None,
+        )
+        print(json.dumps(rows, indent=2))
+    elif command == "stats":
+        print(json.dumps(store.stats(), indent=2))
+    elif command == "bench":
+        snapshots = int(args[1]) if len(args) > 1 else 5000
+        print(json.dumps(benchmark(snapshots), indent=2))
+    else:
+        print("Usage:")
+        print(
+            "  python analytics_archive.py compact [--remove]       - Compact new snapshots"
+        )
+        print(
+            "  python analytics_archive.py query [start] [end]      - Records in range"
+        )
+        print("  python analytics_archive.py rollup [hour|day|month] [start] [end]")
+        print("  python analytics_archive.py stats                    - Store summary")
+        print("  python analytics_archive.py bench [snapshots]        - Files vs store")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+"""
+EvansMathibe Agency - Derived Asset Cache
+Content-addressed store for transcodes and thumbnails, so unchanged inputs
+are never re-encoded
+"""
+
+import fcntl
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from pathlib import Path
+
+AGENCY_ROOT = Path("/home/ev/EvansMathibe_Agency")
+CACHE_DIR = AGENCY_ROOT / "cache" / "derived"
+
+MAX_CACHE_BYTES = 5 * 1024 * 1024 * 1024  # 5GB
+
+
+def file_digest(path, chunk_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(chunk_size):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class DerivedAssetCache:
+    """Derived files keyed by the input's content hash plus encode parameters.
+
+    Content hashes are remembered per path against size and mtime, so a
+    rebuild over unchanged inputs only stats files. The cache evicts least
+    recently used entries once it grows past ``max_bytes``. ``restore`` and
+    ``store`` only update the index in memory; call ``save()`` once a batch
+    is done. Saving merges with the index on disk under ``.lock``, so
+    processes sharing the cache keep each other's entries, forgets hashes of
+    files that are gone and evicts, all in one pass.
+    """
+
+    def __init__(self, cache_dir: Path = CACHE_DIR, max_bytes: int = MAX_CACHE_BYTES):
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self.index_file = self.cache_dir / "index.json"
+        self._index = None
+        self._lock = threading.Lock()
+        self._touched = set()
+
+    @property
+    def index(self):
+        if self._index is None:
+            try:
+                with open(self.index_file) as f:
+                    self._index = json.load(f)
+            except (OSError, ValueError):
+                self._index = {"entries": {}, "digests": {}}
+        return self._index
+
+    def _read_index(self):
+        try:
+            with open(self.index_file) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {"entries": {}, "digests": {}}
+
+    def _merged_index(self):
+        """The index on disk plus the entries this process used or added."""
+        on_disk = self._read_index()
+        entries = on_disk["entries"]
+        for key in self._touched:
+            entry = self.index["entries"].get(key)
+            current = entries.get(key)
+            if entry and (
+                current is None or current["last_used"] <= entry["last_used"]
+            ):
+                entries[key] = entry
+        digests = {**on_disk["digests"], **self.index["digests"]}
+        return {
+            "entries": entries,
+            "digests": {p: d for p, d in digests.items() if os.path.exists(p)},
+        }
+
+    def _save_index(self):
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        with open(self.cache_dir / ".lock", "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            self._index = self._merged_index()
+            self._touched.clear()
+            self._evict()
+            tmp_file = self.index_file.with_suffix(f".{os.getpid()}.tmp")
+            with open(tmp_file, "w") as f:
+                json.dump(self.index, f)
+            os.replace(tmp_file, self.index_file)
+
+    def digest(self, path):
+        """Content hash of ``path``, reusing the last one if size and mtime match."""
+        path = Path(path).resolve()
+        st = path.stat()
+        with self._lock:
+            known = self.index["digests"].get(str(path))
+        if known and known[:2] == [st.st_size, st.st_mtime_ns]:
+            return known[2]
+        value = file_digest(path)
+        with self._lock:
+            self.index["digests"][str(path)] = [st.st_size, st.st_mtime_ns, value]
+        return value
+
+    def remember(self, path, value):
+        """Record a content hash computed elsewhere, e.g. while copying ``path``."""
+        path = Path(path).resolve()
+        st = path.stat()
+        with self._lock:
+            self.index["digests"][str(path)] = [st.st_size, st.st_mtime_ns, value]
+
+    def entry(self, key):
+        """Size and content hash of the cached result for ``key``, if any."""
+        if key is None:
+            return None
+        with self._lock:
+            return self.index["entries"].get(key)
+
+    def save(self):
+        with self._lock:
+            self._save_index()
+
+    def key(self, input_path, operation: str, output_path=None, **params):
+        """Cache key for running ``operation`` on ``input_path`` with ``params``.
+
+        Returns None when the input does not exist, which disables caching for
+        that call and lets the encoder report the error as before.
+        """
+        try:
+            source = self.digest(input_path)
+        except OSError:
+            return None
+        if output_path is not None:
+            params["format"] = Path(output_path).suffix.lower()
+        spec = json.dumps([source, operation, params], sort_keys=True)
+        return hashlib.sha256(spec.encode()).hexdigest()
+
+    def restore(self, key, output_path) -> bool:
+        """Place the cached result for ``key`` at ``output_path`` if there is one."""
+        if key is None:
+            return False
+        with self._lock:
+            entry = self.index["entries"].get(key)
+        cached_file = self.cache_dir / key[:2] / key
+        if entry is None or not cached_file.exists():
+            return False
+        output_path = Path(output_path)
+        try:
+            current = self.digest(output_path) if output_path.exists() else None
+        except OSError:
+            current = None
+        if current != entry["digest"]:
+            shutil.copyfile(cached_file, output_path)
+        with self._lock:
+            entry["last_used"] = time.time()
+            self._touched.add(key)
+        return True
+
+    def store(self, key, output_path):
+        """Copy a freshly produced ``output_path`` into the cache under ``key``."""
+        if key is None or not Path(output_path).exists():
+            return
+        cached_file = self.cache_dir / key[:2] / key
+        cached_file.parent.mkdir(parents=True, exist_ok=True)
+        tmp_file = cached_file.with_suffix(f".{os.getpid()}.tmp")
+        shutil.copyfile(output_path, tmp_file)
+        os.replace(tmp_file, cached_file)
+        output_digest = self.digest(output_path)
+        with self._lock:
+            self.index["entries"][key] = {
+                "size": cached_file.stat().st_size,
+                "digest": output_digest,
+                "last_used": time.time(),
+            }
+            self._touched.add(key)
+
+    def _evict(self):
+        entries = self.index["entries"]
+        total = sum(e["size"] for e in entries.values())
+        for key in sorted(entries, key=lambda k: entries[k]["last_used"]):
+            if total <= self.max_bytes:
+                break
+            total -= entries.pop(key)["size"]
+            cached_file = self.cache_dir / key[:2] / key
+            if cached_file.exists():
+                cached_file.unlink()
+
+    def stats(self):
+        entries = self.index["entries"]
+        return {
+            "entries": len(entries),
+            "bytes": sum(e["size"] for e in entries.values()),
+            "max_bytes": self.max_bytes,
+            "directory": str(self.cache_dir),
+        }
+
+    def clear(self):
+        if self.cache_dir.exists():
+            shutil.rmtree(self.cache_dir)
+        self._index = None
+
+
+def main():
+    import sys
+
+    cache = DerivedAssetCache()
+
+    if len(sys.argv) > 1 and sys.argv[1] == "clear":
+        cache.clear()
+        print(f"Cleared {cache.cache_dir}")
+    else:
+        print(json.dumps(cache.stats(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
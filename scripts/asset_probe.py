@@ -0,0 +1,269 @@
+#!/usr/bin/env python3
+"""
+EvansMathibe Agency - Batch Asset Probe
+Reads image dimensions straight from file headers and probes videos with a
+pool of ffprobe workers, instead of one identify/ffprobe process per file
+"""
+
+import json
+import os
+import struct
+import subprocess
+from pathlib import Path
+from typing import Dict, Iterable, Optional, Tuple
+
+from agency_metrics import run_command
+
+VIDEO_FORMATS = [".mp4", ".mov", ".avi", ".mkv", ".webm", ".ogg"]
+
+# JPEG start-of-frame markers carry the dimensions; C4, C8 and CC are not frames.
+JPEG_SOF_MARKERS = set(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+
+
+def _jpeg_size(f) -> Optional[Tuple[int, int]]:
+    f.seek(2)
+    while True:
+        byte = f.read(1)
+        while byte and byte != b"\xff":
+            byte = f.read(1)
+        while byte == b"\xff":
+            byte = f.read(1)
+        if not byte:
+            return None
+        marker = byte[0]
+        if marker == 0x01 or 0xD0 <= marker <= 0xD9:
+            continue
+        segment = f.read(2)
+        if len(segment) < 2:
+            return None
+        length = struct.unpack(">H", segment)[0]
+        if marker in JPEG_SOF_MARKERS:
+            data = f.read(5)
+            if len(data) < 5:
+                return None
+            height, width = struct.unpack(">xHH", data)
+            return width, height
+        f.seek(length - 2, os.SEEK_CUR)
+
+
+def image_size(path) -> Optional[Tuple[int, int]]:
+    """``(width, height)`` read from the file header, or None if unrecognised.
+
+    Handles PNG, JPEG, GIF, WebP (lossy, lossless and extended) and BMP
+    without decoding any pixels.
+    """
+    with open(path, "rb") as f:
+        head = f.read(32)
+        if head.startswith(b"\x89PNG\r\n\x1a\n") and head[12:16] == b"IHDR":
+            return struct.unpack(">II", head[16:24])
+        if head[:6] in (b"GIF87a", b"GIF89a"):
+            return struct.unpack("<HH", head[6:10])
+        if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+            chunk = head[12:16]
+            if chunk == b"VP8 " and head[23:26] == b"\x9d\x01\x2a":
+                width, height = struct.unpack("<HH", head[26:30])
+                return width & 0x3FFF, height & 0x3FFF
+            if chunk == b"VP8L" and head[20] == 0x2F:
+                bits = struct.unpack("<I", head[21:25])[0]
+                return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+            if chunk == b"VP8X":
+                width = int.from_bytes(head[24:27], "little") + 1
+                height = int.from_bytes(head[27:30], "little") + 1
+                return width, height
+            return None
+        if head[:2] == b"BM" and len(head) >= 26:
+            width, height = struct.unpack("<ii", head[18:26])
+            return width, abs(height)
+        if head[:2] == b"\xff\xd8":
+            return _jpeg_size(f)
+    return None
+
+
+def _identify_batch(paths) -> Dict[str, Dict]:
+    """Dimensions for formats without a header reader, in one identify call."""
+    if not paths:
+        return {}
+    try:
+        result = run_command(
+            ["identify", "-format", "%w %h %i\n"] + [f"{p}[0]" for p in paths],
+            capture_output=True,
+            text=True,
+        )
+    except OSError:
+        return {}
+    info = {}
+    for line in result.stdout.splitlines():
+        parts = line.split(" ", 2)
+        if len(parts) == 3 and parts[0].isdigit() and parts[1].isdigit():
+            name = parts[2][:-3] if parts[2].endswith("[0]") else parts[2]
+            info[name] = {"width": int(parts[0]), "height": int(parts[1])}
+    return info
+
+
+def probe_images(paths: Iterable[str]) -> Dict[str, Dict]:
+    results, leftovers = {}, []
+    for path in map(str, paths):
+        try:
+            size = image_size(path)
+        except OSError:
+            continue
+        if size:
+            results[path] = {"width": size[0], "height": size[1]}
+        else:
+            leftovers.append(path)
+    results.update(_identify_batch(leftovers))
+    return results
+
+
+def ffprobe(path) -> Dict:
+    """Full ffprobe JSON (format and streams) for one file, or {} on failure."""
+    cmd = [
+        "ffprobe",
+        "-v",
+        "quiet",
+        "-print_format",
+        "json",
+        "-show_format",
+        "-show_streams",
+        str(path),
+    ]
+    try:
+        result = run_command(cmd, capture_output=True, text=True)
+        return json.loads(result.stdout)
+    except (OSError, ValueError):
+        return {}
+
+
+def summarize_video(probe: Dict) -> Dict:
+    info = {}
+    if "duration" in probe.get("format", {}):
+        info["duration"] = float(probe["format"]["duration"])
+    for stream in probe.get("streams", []):
+        if stream.get("codec_type") == "video":
+            info["width"] = stream.get("width")
+            info["height"] = stream.get("height")
+            break
+    return info
+
+
+def probe_videos_raw(paths: Iterable[str], workers: int = None) -> Dict[str, Dict]:
+    """Full ffprobe output for many videos, running ``workers`` probes at once."""
+    paths = [str(p) for p in paths]
+    if not paths:
+        return {}
+    workers = workers or min(len(paths), (os.cpu_count() or 2) * 2)
+    from concurrent.futures import ThreadPoolExecutor
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return dict(zip(paths, pool.map(ffprobe, paths)))
+
+
+def probe_videos(paths: Iterable[str], workers: int = None) -> Dict[str, Dict]:
+    return {
+        path: summarize_video(probe)
+        for path, probe in probe_videos_raw(paths, workers).items()
+    }
+
+
+def probe_assets(paths: Iterable[str], workers: int = None) -> Dict[str, Dict]:
+    """Dimensions (and duration for videos) for a mixed batch of assets."""
+    images, videos = [], []
+    for path in map(str, paths):
+        (videos if Path(path).suffix.lower() in VIDEO_FORMATS else images).append(path)
+    results = probe_images(images)
+    results.update(probe_videos(videos, workers))
+    return results
+
+
+def _write_fixture(path: Path, kind: str, width: int, height: int):
+    import zlib
+
+    if kind == "png":
+        ihdr = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+        data = (
+            b"\x89PNG\r\n\x1a\n"
+            + struct.pack(">I", len(ihdr))
+            + b"IHDR"
+            + ihdr
+            + struct.pack(">I", zlib.crc32(b"IHDR" + ihdr))
+        )
+    elif kind == "gif":
+        data = b"GIF89a" + struct.pack("<HH", width, height) + b"\x00\x00\x00;"
+    elif kind == "jpg":
+        app0 = b"JFIF\x00\x01\x01\x00\x00\x01\x00\x01\x00\x00"
+        sof = struct.pack(">BHHB", 8, height, width, 3) + b"\x01\x22\x00" * 3
+        data = (
+            b"\xff\xd8"
+            + b"\xff\xe0"
+            + struct.pack(">H", len(app0) + 2)
+            + app0
+            + b"\xff\xc0"
+            + struct.pack(">H", len(sof) + 2)
+            + sof
+            + b"\xff\xd9"
+        )
+    else:
+        vp8x = (
+            b"\x00\x00\x00\x00"
+            + (width - 1).to_bytes(3, "little")
+            + (height - 1).to_bytes(3, "little")
+        )
+        body = b"WEBP" + b"VP8X" + struct.pack("<I", len(vp8x)) + vp8x
+        data = b"RIFF" + struct.pack("<I", len(body)) + body
+    path.write_bytes(data)
+
+
+def benchmark(count: int = 2000):
+    """Probe a generated fixture set in-process and, if available, with identify."""
+    import shutil
+    import tempfile
+    import time
+
+    kinds = ["png", "jpg", "gif", "webp"]
+    with tempfile.TemporaryDirectory() as tmp:
+        expected = {}
+        for i in range(count):
+            kind = kinds[i % len(kinds)]
+            path = Path(tmp) / f"fixture_{i}.{kind}"
+            width, height = 100 + i, 50 + i % 700
+            _write_fixture(path, kind, width, height)
+            expected[str(path)] = {"width": width, "height": height}
+
+        start = time.perf_counter()
+        found = probe_images(expected)
+        batch_s = time.perf_counter() - start
+        assert found == expected, "header probe disagrees with fixture sizes"
+        report = {"files": count, "batch_s": round(batch_s, 4), "per_file_s": None}
+
+        if shutil.which("identify"):
+            start = time.perf_counter()
+            for path in expected:
+                subprocess.run(
+                    ["identify", "-format", "%wx%h", path],
+                    capture_output=True,
+                    text=True,
+                )
+            report["per_file_s"] = round(time.perf_counter() - start, 4)
+            report["speedup"] = round(report["per_file_s"] / batch_s, 1)
+    return report
+
+
+def main():
+    import sys
+
+    if len(sys.argv) > 1 and sys.argv[1] == "bench":
+        count = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+        report = benchmark(count)
+        print(json.dumps(report, indent=2))
+        if report["per_file_s"] is None:
+            print("identify not found; per-file baseline skipped")
+    elif len(sys.argv) > 1:
+        print(json.dumps(probe_assets(sys.argv[1:]), indent=2))
+    else:
+        print("Usage:")
+        print("  python asset_probe.py <file> [file ...]  - Probe dimensions")
+        print("  python asset_probe.py bench [count]      - Compare with identify")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+EvansMathibe Agency - Directory Scanner
+Lists asset directories in a single os.scandir pass per directory and
+remembers the result until the directory changes
+"""
+
+import json
+import os
+from pathlib import Path
+from typing import Dict, Iterable, List
+
+AGENCY_ROOT = Path("/home/ev/EvansMathibe_Agency")
+SCAN_CACHE_FILE = AGENCY_ROOT / "cache" / "scan.json"
+
+
+class DirectoryScanner:
+    """Reads each directory once and caches its listing keyed on mtime.
+
+    A directory's mtime changes whenever an entry is added, removed or
+    renamed, so an unchanged tree is answered with one ``stat`` per
+    directory. Sizes and mtimes of files rewritten in place are refreshed
+    the next time their directory changes.
+    """
+
+    def __init__(self, cache_file: Path = SCAN_CACHE_FILE):
+        self.cache_file = Path(cache_file) if cache_file else None
+        self._cache = None
+        self._dirty = False
+
+    @property
+    def cache(self) -> Dict:
+        if self._cache is None:
+            self._cache = {}
+            if self.cache_file and self.cache_file.exists():
+                try:
+                    with open(self.cache_file) as f:
+                        self._cache = json.load(f)
+                except ValueError:
+                    pass
+        return self._cache
+
+    def _list_dir(self, directory: str):
+        """``(files, subdirs)`` for one directory, from cache when unchanged."""
+        mtime = os.stat(directory).st_mtime_ns
+        cached = self.cache.get(directory)
+        if cached and cached["mtime"] == mtime:
+            return cached["files"], cached["dirs"]
+
+        files, dirs = [], []
+        with os.scandir(directory) as it:
+            for entry in it:
+                if entry.is_dir(follow_symlinks=False):
+                    dirs.append(entry.name)
+                elif entry.is_file():
+                    st = entry.stat()
+                    files.append([entry.name, st.st_size, st.st_mtime])
+        self.cache[directory] = {"mtime": mtime, "files": files, "dirs": dirs}
+        self._dirty = True
+        return files, dirs
+
+    def scan(self, directory, recursive: bool = False) -> List[Dict]:
+        """Every file under ``directory`` with its name, lowercased extension,
+        size and mtime."""
+        results = []
+        pending = [os.path.abspath(directory)]
+        while pending:
+            current = pending.pop()
+            try:
+                files, dirs = self._list_dir(current)
+            except FileNotFoundError:
+                self.cache.pop(current, None)
+                continue
+            for name, size, mtime in files:
+                results.append(
+                    {
+                        "name": name,
+                        "path": os.path.join(current, name),
+                        "ext": os.path.splitext(name)[1].lower(),
+                        "size": size,
+                        "mtime": mtime,
+                    }
+                )
+            if recursive:
+                pending.extend(
+                    os.path.join(current, d) for d in dirs if not d.startswith(".")
+                )
+        self.save()
+        results.sort(key=lambda e: e["path"])
+        return results
+
+    def by_extension(
+        self, directory, extensions: Iterable[str], recursive: bool = False
+    ) -> Dict[str, List[Dict]]:
+        """Files under ``directory`` grouped by extension, matched case-insensitively."""
+        groups = {ext.lower(): [] for ext in extensions}
+        for entry in self.scan(directory, recursive):
+            if entry["ext"] in groups:
+                groups[entry["ext"]].append(entry)
+        return groups
+
+    def save(self):
+        if not (self._dirty and self.cache_file):
+            return
+        self.cache_file.parent.mkdir(parents=True, exist_ok=True)
+        tmp_file = self.cache_file.with_suffix(f".{os.getpid()}.tmp")
+        with open(tmp_file, "w") as f:
+            json.dump(self.cache, f)
+        os.replace(tmp_file, self.cache_file)
+        self._dirty = False
@@ -0,0 +1,353 @@
+#!/usr/bin/env python3
+"""
+EvansMathibe Agency - Responsive Image Derivatives
+Encodes every site image at several widths in WebP/AVIF (where the local
+ImageMagick supports them) and its own format, in a process pool, and
+records srcset metadata for the site build
+"""
+
+import json
+import os
+import shutil
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List
+from urllib.parse import quote
+
+from asset_cache import file_digest
+from asset_probe import image_size
+
+AGENCY_ROOT = Path("/home/ev/EvansMathibe_Agency")
+WEBSITE_DIR = AGENCY_ROOT / "website"
+DERIVED_SUBDIR = Path("images") / "derived"
+METADATA_NAME = "srcset.json"
+
+WIDTHS = [320, 640, 960, 1280, 1920]
+QUALITY = {"avif": 50, "webp": 80, "jpg": 82, "png": 90}
+MODERN_FORMATS = ["avif", "webp"]
+# Source extension -> fallback format every browser can show.
+FALLBACK_FORMATS = {
+    ".jpg": "jpg",
+    ".jpeg": "jpg",
+    ".png": "png",
+    ".bmp": "png",
+    ".webp": "png",
+}
+MIME_TYPES = {
+    "avif": "image/avif",
+    "webp": "image/webp",
+    "jpg": "image/jpeg",
+    "png": "image/png",
+}
+
+
+def imagemagick() -> str:
+    """ImageMagick's command line tool: ``magick`` on 7, ``convert`` on 6."""
+    return shutil.which("magick") or shutil.which("convert") or "convert"
+
+
+def writable_formats(tool: str = None) -> List[str]:
+    """Which of ``MODERN_FORMATS`` this ImageMagick build can encode."""
+    try:
+        result = subprocess.run(
+            [tool or imagemagick(), "-list", "format"],
+            capture_output=True,
+            text=True,
+        )
+    except OSError:
+        return []
+    supported = set()
+    for line in result.stdout.splitlines():
+        parts = line.split()
+        # "  WEBP* WEBP      rw+   WebP Image Format": name, module, mode
+        if len(parts) >= 3 and "w" in parts[2]:
+            supported.add(parts[0].rstrip("*").lower())
+    return [fmt for fmt in MODERN_FORMATS if fmt in supported]
+
+
+def target_widths(width: int) -> List[int]:
+    """Widths below the original, plus the original capped at the largest."""
+    largest = min(width, WIDTHS[-1])
+    return [w for w in WIDTHS if w < largest] + [largest]
+
+
+def derive_command(tool: str, source: str, outputs: List[Dict]) -> List[str]:
+    """One ImageMagick call that decodes ``source`` once and writes every
+    output from a clone of it."""
+    cmd = [tool, source, "-auto-orient", "-strip"]
+    for output in outputs:
+        cmd += [
+            "(",
+            "+clone",
+            "-resize",
+            f"{output['width']}x",
+            "-quality",
+            str(QUALITY[output["format"]]),
+            "-write",
+            output["path"],
+            "+delete",
+            ")",
+        ]
+    return cmd + ["null:"]
+
+
+def derive_image(job: Dict) -> Dict:
+    """Worker: hash one image and encode its derivatives unless the previous
+    run already produced them from the same content."""
+    start = time.perf_counter()
+    source = job["source"]
+    st = os.stat(source)
+    digest = file_digest(source)
+    previous = job.get("previous") or {}
+    result = {
+        "source": job["rel"],
+        "size": st.st_size,
+        "mtime_ns": st.st_mtime_ns,
+        "digest": digest,
+        "settings": job["settings"],
+    }
+    if (
+        previous.get("digest") == digest
+        and previous.get("settings") == job["settings"]
+        and all(
+            os.path.exists(os.path.join(job["site_dir"], v["src"]))
+            for v in previous.get("variants", [])
+        )
+    ):
+        return dict(previous, **result, status="unchanged")
+
+    dimensions = image_size(source)
+    if dimensions is None:
+        return dict(result, status="error", error="Unrecognised image format")
+    width, height = dimensions
+    stem = f"{Path(source).stem}-{digest[:8]}"
+    outputs = []
+    for fmt in job["formats"]:
+        for w in target_widths(width):
+            rel = (DERIVED_SUBDIR / f"{stem}-{w}w.{fmt}").as_posix()
+            outputs.append(
+                {
+                    "src": rel,
+                    "path": os.path.join(job["site_dir"], rel),
+                    "width": w,
+                    "height": round(height * w / width),
+                    "format": fmt,
+                }
+            )
+    os.makedirs(os.path.join(job["site_dir"], DERIVED_SUBDIR), exist_ok=True)
+    encoded = subprocess.run(
+        derive_command(job["tool"], source, outputs), capture_output=True, text=True
+    )
+    if encoded.returncode != 0:
+        error = encoded.stderr.strip().splitlines()
+        return dict(result, status="error", error=error[-1] if error else "failed")
+    variants = []
+    for output in outputs:
+        output.pop("path")
+        output["bytes"] = os.path.getsize(os.path.join(job["site_dir"], output["src"]))
+        variants.append(output)
+    return dict(
+        result,
+        status="derived",
+        width=width,
+        height=height,
+        variants=variants,
+        seconds=time.perf_counter() - start,
+    )
+
+
+def srcsets(variants: List[Dict]) -> Dict[str, str]:
+    """``{mime type: srcset}`` with formats in preference order. URLs are
+    percent-encoded, as a srcset cannot hold spaces or commas in them."""
+    order = MODERN_FORMATS + ["jpg", "png"]
+    sets = {}
+    for fmt in sorted({v["format"] for v in variants}, key=order.index):
+        sets[MIME_TYPES[fmt]] = ", ".join(
+            f"{quote(v['src'])} {v['width']}w"
+            for v in sorted(variants, key=lambda v: v["width"])
+            if v["format"] == fmt
+        )
+    return sets
+
+
+class DerivativeBuilder:
+    """Keeps responsive derivatives of the site's images up to date.
+
+    Derivatives are written to ``images/derived`` in the site, named after
+    the source and the first eight hex digits of its content hash, and
+    described in ``images/derived/srcset.json``. An image is sent to the
+    pool only when its size or mtime changed since the last run, and the
+    worker skips encoding if the content hash and settings still match.
+    Derivatives that no longer belong to any image are removed.
+    """
+
+    def __init__(self, site_dir: Path = WEBSITE_DIR, workers: int = None):
+        self.site_dir = Path(site_dir)
+        self.derived_dir = self.site_dir / DERIVED_SUBDIR
+        self.metadata_file = self.derived_dir / METADATA_NAME
+        self.workers = workers or os.cpu_count() or 2
+        self.tool = imagemagick()
+        self.formats = writable_formats(self.tool)
+        self.metadata = load_metadata(self.site_dir)
+
+    def sources(self) -> List[Path]:
+        found = []
+        for directory, dirs, files in os.walk(self.site_dir):
+            if Path(directory) == self.site_dir / "images":
+                dirs[:] = [d for d in dirs if d != "derived"]
+            for name in files:
+                if Path(name).suffix.lower() in FALLBACK_FORMATS:
+                    found.append(Path(directory) / name)
+        return sorted(found)
+
+    def _settings(self, source: Path) -> Dict:
+        fallback = FALLBACK_FORMATS[source.suffix.lower()]
+        formats = [f for f in self.formats if f != fallback] + [fallback]
+        return {"widths": WIDTHS, "formats": formats, "quality": QUALITY}
+
+    def build(self, force: bool = False) -> Dict:
+        from concurrent.futures import ProcessPoolExecutor
+
+        start = time.perf_counter()
+        images = self.metadata["images"]
+        jobs, current = [], set()
+        for source in self.sources():
+            rel = source.relative_to(self.site_dir).as_posix()
+            current.add(rel)
+            st = source.stat()
+            previous = images.get(rel)
+            settings = self._settings(source)
+            if (
+                not force
+                and previous
+                and previous.get("status") != "error"
+                and [previous["size"], previous["mtime_ns"]]
+                == [st.st_size, st.st_mtime_ns]
+                and previous.get("settings") == settings
+                and all(
+                    (self.site_dir / v["src"]).exists() for v in previous["variants"]
+                )
+            ):
+                continue
+            jobs.append(
+                {
+                    "source": str(source),
+                    "rel": rel,
+                    "site_dir": str(self.site_dir),
+                    "tool": self.tool,
+                    "formats": settings["formats"],
+                    "settings": settings,
+                    "previous": None if force else previous,
+                }
+            )
+
+        report = {"images": len(current), "derived": 0, "unchanged": 0, "errors": []}
+        if jobs:
+            with ProcessPoolExecutor(max_workers=min(self.workers, len(jobs))) as pool:
+                for result in pool.map(derive_image, jobs, chunksize=4):
+                    if result["status"] == "error":
+                        report["errors"].append(
+                            {"source": result["source"], "error": result["error"]}
+                        )
+                    else:
+                        report[result["status"]] += 1
+                    result.pop("seconds", None)
+                    result["srcset"] = srcsets(result.get("variants", []))
+                    images[result["source"]] = result
+        report["unchanged"] += len(current) - len(jobs)
+
+        for rel in [r for r in images if r not in current]:
+            del images[rel]
+        report["removed_files"] = self._remove_orphans()
+        self._save()
+
+        elapsed = time.perf_counter() - start
+        report.update(self.savings())
+        report["seconds"] = round(elapsed, 3)
+        report["images_per_s"] = round(report["derived"] / elapsed, 1) if jobs else None
+        return report
+
+    def _remove_orphans(self) -> int:
+        wanted = {
+            v["src"].rsplit("/", 1)[-1]
+            for info in self.metadata["images"].values()
+            for v in info.get("variants", [])
+        }
+        removed = 0
+        if self.derived_dir.exists():
+            for entry in os.scandir(self.derived_dir):
+                if entry.name != METADATA_NAME and entry.name not in wanted:
+                    os.unlink(entry.path)
+                    removed += 1
+        return removed
+
+    def _save(self):
+        self.derived_dir.mkdir(parents=True, exist_ok=True)
+        tmp_file = self.metadata_file.with_suffix(".tmp")
+        with open(tmp_file, "w") as f:
+            json.dump(self.metadata, f, indent=2)
+        os.replace(tmp_file, self.metadata_file)
+
+    def savings(self) -> Dict:
+        """Bytes a full-width visitor saves with the smallest full-width
+        derivative instead of the original, over all images."""
+        original = best = 0
+        for info in self.metadata["images"].values():
+            variants = info.get("variants")
+            if not variants:
+                continue
+            widest = max(v["width"] for v in variants)
+            smallest = min(v["bytes"] for v in variants if v["width"] == widest)
+            original += info["size"]
+            best += min(smallest, info["size"])
+        return {
+            "original_bytes": original,
+            "derived_bytes": best,
+            "bytes_saved": original - best,
+            "formats": self.formats + ["original"],
+        }
+
+
+def load_metadata(site_dir: Path = WEBSITE_DIR) -> Dict:
+    """The srcset metadata of ``site_dir``, keyed by image path within it."""
+    try:
+        with open(Path(site_dir) / DERIVED_SUBDIR / METADATA_NAME) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {"images": {}}
+
+
+def main():
+    args = [a for a in sys.argv[1:] if not a.startswith("--")]
+    command = args[0] if args else ""
+    workers = None
+    for arg in sys.argv[1:]:
+        if arg.startswith("--workers="):
+            workers = int(arg.split("=", 1)[1])
+
+    if command == "build":
+        site = Path(args[1]) if len(args) > 1 else WEBSITE_DIR
+        builder = DerivativeBuilder(site, workers)
+        print(json.dumps(builder.build(force="--force" in sys.argv), indent=2))
+    elif command == "formats":
+        print(json.dumps({"tool": imagemagick(), "modern": writable_formats()}))
+    elif command == "srcset" and len(args) > 1:
+        info = load_metadata().get("images", {}).get(args[1])
+        print(
+            json.dumps(
+                info["srcset"] if info else {"error": "No derivatives"}, indent=2
+            )
+        )
+    else:
+        print("Usage:")
+        print("  python image_derivatives.py build [site_dir] [--workers=N] [--force]")
+        print(
+            "  python image_derivatives.py formats       - Formats ImageMagick can write"
+        )
+        print("  python image_derivatives.py srcset <img>  - srcset for a site image")
+
+
+if __name__ == "__main__":
+    main()
@@ -6,19 +6,28 @@ Handles payment processing for services
 
 import os
 import json
+import hashlib
+import random
+import time
+import uuid
 from datetime import datetime
+from importlib.util import find_spec
 from pathlib import Path
+from typing import Dict, List
 
-try:
-    import stripe
+from agency_metrics import timed
 
-    STRIPE_AVAILABLE = True
-except ImportError:
-    STRIPE_AVAILABLE = False
-    print("Warning: Stripe not installed. Install with: pip install stripe")
+# The Stripe SDK is slow to import, so only check that it is installed here
+# and import it once a live API key is in use.
+STRIPE_AVAILABLE = find_spec("stripe") is not None
 
 AGENCY_ROOT = Path("/home/ev/EvansMathibe_Agency")
 CONFIG_FILE = AGENCY_ROOT / "config" / "stripe_config.json"
+CATALOG_FILE = AGENCY_ROOT / "config" / "stripe_catalog.json"
+
+RETRY_LIMIT = 4
+RETRY_BASE_DELAY = 0.5  # seconds, doubled on each retry
+RETRY_MAX_DELAY = 8.0
 
 SERVICES_PRICING = {
     "photography": {
@@ -69,9 +78,225 @@ SERVICES_PRICING = {
 }
 
 
+def known_tier(service: str, tier: str) -> str:
+    """``tier`` if ``service`` offers it, else "standard" like checkout."""
+    service_info = SERVICES_PRICING.get(service.lower(), {})
+    tier = tier.lower()
+    return tier if tier in service_info.get("prices", {}) else "standard"
+
+
+def price_cents(service: str, tier: str):
+    """Price of ``(service, tier)`` in cents, or None if either is unknown."""
+    service_info = SERVICES_PRICING.get(service.lower())
+    if not service_info:
+        return None
+    price = service_info["prices"].get(tier.lower())
+    return None if price is None else price * 100
+
+
+class StripeCatalog:
+    """Local record of the Stripe products, prices and payment links that
+    mirror ``SERVICES_PRICING``.
+
+    Every ``(service, tier)`` gets one product, one active price (tagged with
+    the lookup key ``<service>_<tier>``) and at most one payment link, and
+    their ids are kept in ``CATALOG_FILE``. Syncing only calls Stripe for
+    entries that are missing or whose name, description or amount changed.
+    Prices cannot be edited on Stripe, so a changed amount creates a new price,
+    archives the old one and retires the payment link that pointed to it.
+    If the local file is lost, existing prices are found again by lookup key
+    rather than duplicated.
+    """
+
+    def __init__(self, stripe_module, catalog_file: Path = CATALOG_FILE):
+        self.stripe = stripe_module
+        self.catalog_file = Path(catalog_file)
+        self.entries = self._load()
+
+    def _load(self):
+        if self.catalog_file.exists():
+            with open(self.catalog_file) as f:
+                return json.load(f).get("entries", {})
+        return {}
+
+    def save(self):
+        self.catalog_file.parent.mkdir(parents=True, exist_ok=True)
+        tmp_file = self.catalog_file.with_suffix(".tmp")
+        with open(tmp_file, "w") as f:
+            json.dump(
+                {"entries": self.entries, "synced_at": datetime.now().isoformat()},
+                f,
+                indent=2,
+            )
+        os.replace(tmp_file, self.catalog_file)
+
+    def _call(self, operation: str, func, *args, **kwargs):
+        with timed("stripe", operation):
+            return func(*args, **kwargs)
+
+    @staticmethod
+    def wanted(service: str, tier: str) -> dict:
+        service_info = SERVICES_PRICING[service]
+        return {
+            "name": f"{service_info['name']} - {tier.title()}",
+            "description": service_info["description"],
+            "unit_amount": service_info["prices"][tier] * 100,
+            "currency": "zar",
+        }
+
+    def _adopt(self, lookup_key: str):
+        """Catalog entry rebuilt from an existing Stripe price, if any."""
+        found = self._call(
+            "Price.list",
+            self.stripe.Price.list,
+            lookup_keys=[lookup_key],
+            expand=["data.product"],
+        )
+        for price in found.data:
+            product = price.product
+            return {
+                "product_id": product.id,
+                "price_id": price.id,
+                "name": product.name,
+                "description": product.description,
+                "unit_amount": price.unit_amount,
+                "currency": price.currency,
+            }
+        return None
+
+    def sync_entry(self, service: str, tier: str) -> str:
+        """Bring one ``(service, tier)`` in line with the price list.
+
+        Returns "created", "updated", "adopted" (found on Stripe by lookup
+        key) or "unchanged". Each object is recorded in the entry as soon as
+        Stripe has created it, and a replaced price and link are kept under
+        ``retire`` until they are deactivated, so a sync that fails part-way
+        is finished by the next one instead of creating duplicates.
+        """
+        key = f"{service}:{tier}"
+        lookup_key = f"{service}_{tier}"
+        want = self.wanted(service, tier)
+        entry = self.entries.get(key)
+        outcome = "unchanged"
+        if entry is None:
+            entry = self._adopt(lookup_key)
+            outcome = "adopted" if entry else "created"
+
+        if entry is None:
+            product = self._call(
+                "Product.create",
+                self.stripe.Product.create,
+                name=want["name"],
+                description=want["description"],
+                metadata={"service": service, "tier": tier},
+            )
+            entry = {
+                "product_id": product.id,
+                "name": want["name"],
+                "description": want["description"],
+            }
+        elif (entry["name"], entry["description"]) != (
+            want["name"],
+            want["description"],
+        ):
+            self._call(
+                "Product.modify",
+                self.stripe.Product.modify,
+                entry["product_id"],
+                name=want["name"],
+                description=want["description"],
+            )
+            entry.update(name=want["name"], description=want["description"])
+            outcome = "updated"
+        self.entries[key] = entry
+
+        if (entry.get("unit_amount"), entry.get("currency")) != (
+            want["unit_amount"],
+            want["currency"],
+        ):
+            price = self._call(
+                "Price.create",
+                self.stripe.Price.create,
+                product=entry["product_id"],
+                unit_amount=want["unit_amount"],
+                currency=want["currency"],
+                lookup_key=lookup_key,
+                transfer_lookup_key=True,
+            )
+            retire = entry.setdefault("retire", [])
+            if entry.get("price_id"):
+                retire.append(["Price", entry["price_id"]])
+                outcome = "updated"
+            if entry.get("link_id"):
+                retire.append(["PaymentLink", entry.pop("link_id")])
+                entry.pop("link_url")
+            entry.update(
+                price_id=price.id,
+                unit_amount=want["unit_amount"],
+                currency=want["currency"],
+            )
+        self._retire(entry)
+        return outcome
+
+    def _retire(self, entry: dict):
+        """Deactivate the prices and links ``entry`` replaced, forgetting each
+        once Stripe has it inactive."""
+        retire = entry.get("retire", [])
+        while retire:
+            kind, object_id = retire[0]
+            resource = getattr(self.stripe, kind)
+            self._call(f"{kind}.modify", resource.modify, object_id, active=False)
+            retire.pop(0)
+        entry.pop("retire", None)
+
+    def sync(self) -> dict:
+        """Sync every service and tier, saving the catalog once at the end."""
+        report = {"created": 0, "updated": 0, "adopted": 0, "unchanged": 0}
+        try:
+            for service, service_info in SERVICES_PRICING.items():
+                for tier in service_info["prices"]:
+                    report[self.sync_entry(service, tier)] += 1
+        finally:
+            self.save()
+        return report
+
+    def payment_link(self, service: str, tier: str = "standard") -> dict:
+        """Payment link for ``(service, tier)``, created on first use only.
+
+        An unknown tier falls back to "standard", as it does for checkout.
+        """
+        service, tier = service.lower(), known_tier(service, tier)
+        if price_cents(service, tier) is None:
+            return {"error": f"Unknown service: {service}"}
+        entry = self.entries.get(f"{service}:{tier}")
+        changed = (
+            entry is None
+            or entry.get("unit_amount") != price_cents(service, tier)
+            or "retire" in entry
+        )
+        if changed:
+            try:
+                self.sync_entry(service, tier)
+            finally:
+                self.save()
+            entry = self.entries[f"{service}:{tier}"]
+        if not entry.get("link_id"):
+            link = self._call(
+                "PaymentLink.create",
+                self.stripe.PaymentLink.create,
+                line_items=[{"price": entry["price_id"], "quantity": 1}],
+            )
+            entry.update(link_id=link.id, link_url=link.url)
+            changed = True
+        if changed:
+            self.save()
+        return {"url": entry["link_url"], "price": entry["unit_amount"] // 100}
+
+
 class StripePaymentHandler:
     def __init__(self, api_key: str = None):
         if not STRIPE_AVAILABLE:
+            print("Warning: Stripe not installed. Install with: pip install stripe")
             raise RuntimeError("Stripe package not installed")
 
         self.api_key = api_key or os.environ.get("STRIPE_API_KEY")
@@ -79,8 +304,21 @@ class StripePaymentHandler:
             print("No Stripe API key provided. Using test mode.")
             self.stripe = None
         else:
+            import stripe
+
             stripe.api_key = self.api_key
+            # Point the SDK at a local stripe-mock server for testing.
+            if os.environ.get("STRIPE_API_BASE"):
+                stripe.api_base = os.environ["STRIPE_API_BASE"]
             self.stripe = stripe
+        self._catalog = None
+        self._pool_size = 0
+
+    @property
+    def catalog(self) -> StripeCatalog:
+        if self._catalog is None:
+            self._catalog = StripeCatalog(self.stripe)
+        return self._catalog
 
     def create_checkout_session(
         self,
@@ -88,10 +326,33 @@ class StripePaymentHandler:
         tier: str = "standard",
         success_url: str = None,
         cancel_url: str = None,
+        idempotency_key: str = None,
+        retries: int = 0,
     ):
         if not self.stripe:
             return self._create_mock_session(service, tier)
 
+        params, price = self._checkout_params(service, tier, success_url, cancel_url)
+        if retries and idempotency_key is None:
+            # Without a key, retrying a request that timed out after Stripe
+            # created the session would create a second one.
+            idempotency_key = uuid.uuid4().hex
+        try:
+            session, _ = self._create_session(params, idempotency_key, retries)
+            return {"url": session.url, "session_id": session.id, "amount": price}
+        except self.stripe.error.StripeError as e:
+            return {"error": str(e)}
+
+    def _checkout_params(
+        self,
+        service: str,
+        tier: str,
+        success_url: str = None,
+        cancel_url: str = None,
+        email: str = None,
+        client: str = None,
+        project: str = None,
+    ):
         service_info = SERVICES_PRICING.get(service.lower())
         if not service_info:
             raise ValueError(f"Unknown service: {service}")
@@ -99,32 +360,167 @@ class StripePaymentHandler:
         price = service_info["prices"].get(
             tier.lower(), service_info["prices"]["standard"]
         )
+        params = {
+            "payment_method_types": ["card"],
+            "line_items": [
+                {
+                    "price_data": {
+                        "currency": "zar",
+                        "product_data": {
+                            "name": f"{service_info['name']} - {tier.title()}",
+                            "description": service_info["description"],
+                        },
+                        "unit_amount": price * 100,
+                    },
+                    "quantity": 1,
+                }
+            ],
+            "mode": "payment",
+            "success_url": success_url
+            or "https://evansxm.github.io/evansmathibe-agency/success.html",
+            "cancel_url": cancel_url
+            or "https://evansxm.github.io/evansmathibe-agency/cancel.html",
+        }
+        if email:
+            params["customer_email"] = email
+        params["metadata"] = {"service": service, "tier": tier}
+        if client:
+            params["metadata"]["client"] = client
+        if project:
+            params["metadata"]["project"] = project
+        return params, price
 
+    def _retry_delay(self, error, attempt: int) -> float:
+        """Seconds to wait before retrying ``error``, or None if it is final.
+
+        Rate limits, connection errors, idempotency conflicts (409) and
+        server errors are retried with jittered exponential backoff, or
+        after Retry-After when Stripe sends one.
+        """
+        status = getattr(error, "http_status", None)
+        retryable = isinstance(
+            error,
+            (self.stripe.error.RateLimitError, self.stripe.error.APIConnectionError),
+        ) or (status is not None and (status == 409 or status >= 500))
+        if not retryable or attempt >= RETRY_LIMIT:
+            return None
+        headers = getattr(error, "headers", None) or {}
         try:
-            session = self.stripe.checkout.Session.create(
-                payment_method_types=["card"],
-                line_items=[
-                    {
-                        "price_data": {
-                            "currency": "zar",
-                            "product_data": {
-                                "name": f"{service_info['name']} - {tier.title()}",
-                                "description": service_info["description"],
-                            },
-                            "unit_amount": price * 100,
-                        },
-                        "quantity": 1,
-                    }
-                ],
-                mode="payment",
-                success_url=success_url
-                or "https://evansxm.github.io/evansmathibe-agency/success.html",
-                cancel_url=cancel_url
-                or "https://evansxm.github.io/evansmathibe-agency/cancel.html",
-            )
-            return {"url": session.url, "session_id": session.id, "amount": price}
-        except stripe.error.StripeError as e:
-            return {"error": str(e)}
+            return min(float(headers["Retry-After"]), RETRY_MAX_DELAY)
+        except (KeyError, TypeError, ValueError):
+            delay = min(RETRY_BASE_DELAY * 2**attempt, RETRY_MAX_DELAY)
+            return delay * random.uniform(0.5, 1.0)
+
+    def _create_session(self, params: dict, idempotency_key: str, retries: int):
+        """``(session, attempts)``, retrying transient failures up to
+        ``retries`` times. Every attempt sends the same idempotency key, so
+        a retry never creates a second session."""
+        attempt = 0
+        while True:
+            try:
+                with timed("stripe", "checkout.Session.create"):
+                    session = self.stripe.checkout.Session.create(
+                        idempotency_key=idempotency_key, **params
+                    )
+                return session, attempt + 1
+            except self.stripe.error.StripeError as e:
+                delay = self._retry_delay(e, attempt) if attempt < retries else None
+                if delay is None:
+                    raise
+                time.sleep(delay)
+                attempt += 1
+
+    def use_connection_pool(self, size: int):
+        """Send all Stripe requests through one pooled HTTP session.
+
+        The SDK otherwise opens a session per thread; sharing one keeps
+        ``size`` keep-alive connections open for the batch workers.
+        """
+        if self._pool_size >= size:
+            return True
+        try:
+            import requests
+        except ImportError:
+            return False
+        session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_maxsize=size)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        client_class = getattr(self.stripe, "RequestsClient", None)
+        if client_class is None:
+            client_class = self.stripe.http_client.RequestsClient
+        self.stripe.default_http_client = client_class(session=session)
+        self._pool_size = size
+        return True
+
+    def create_checkout_sessions(
+        self,
+        quotes: List[Dict],
+        workers: int = 8,
+        retries: int = RETRY_LIMIT,
+        batch_id: str = None,
+    ) -> Dict:
+        """Create a checkout session for every quote, ``workers`` at a time.
+
+        Each quote is a dict with ``service`` and optionally ``tier``,
+        ``client``, ``project``, ``email``, ``success_url`` and
+        ``cancel_url``; client and project are stored in the session metadata
+        so webhooks can be matched back to them. The
+        idempotency key of each session is derived from ``batch_id`` and the
+        quote, so running the same batch again returns the sessions already
+        created instead of duplicating them. Results keep the quotes' order,
+        one per quote, with either the session or the error for that quote.
+        """
+        batch_id = batch_id or uuid.uuid4().hex
+        results = [None] * len(quotes)
+
+        def create(index):
+            quote = quotes[index]
+            service = quote.get("service", "")
+            tier = quote.get("tier", "standard")
+            result = {"index": index, "client": quote.get("client"), "tier": tier}
+            result["service"] = service
+            if not self.stripe:
+                result.update(self._create_mock_session(service, tier))
+                return result
+            try:
+                params, price = self._checkout_params(
+                    service,
+                    tier,
+                    quote.get("success_url"),
+                    quote.get("cancel_url"),
+                    quote.get("email"),
+                    quote.get("client"),
+                    quote.get("project"),
+                )
+                spec = json.dumps([batch_id, index, quote], sort_keys=True)
+                key = hashlib.sha256(spec.encode()).hexdigest()
+                session, attempts = self._create_session(params, key, retries)
+                result.update(
+                    url=session.url,
+                    session_id=session.id,
+                    amount=price,
+                    attempts=attempts,
+                )
+            except (ValueError, self.stripe.error.StripeError) as e:
+                result["error"] = str(e)
+            return result
+
+        from concurrent.futures import ThreadPoolExecutor
+
+        if self.stripe:
+            self.use_connection_pool(workers)
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for result in pool.map(create, range(len(quotes))):
+                results[result["index"]] = result
+        return {
+            "batch_id": batch_id,
+            "created": sum(1 for r in results if "error" not in r),
+            "failed": sum(1 for r in results if "error" in r),
+            "seconds": round(time.perf_counter() - start, 3),
+            "results": results,
+        }
 
     def _create_mock_session(self, service: str, tier: str):
         service_info = SERVICES_PRICING.get(service.lower(), {})
@@ -139,26 +535,18 @@ class StripePaymentHandler:
         }
 
     def create_payment_link(self, service: str, tier: str = "standard"):
+        """Payment link for a service tier, reused from the catalog when the
+        price has not changed."""
         service_info = SERVICES_PRICING.get(service.lower())
         if not service_info:
             return None
 
-        price = service_info["prices"].get(tier.lower())
+        price = service_info["prices"][known_tier(service, tier)]
 
         if self.stripe:
             try:
-                product = self.stripe.Product.create(
-                    name=f"{service_info['name']} - {tier.title()}",
-                    description=service_info["description"],
-                )
-                price_obj = self.stripe.Price.create(
-                    unit_amount=price * 100, currency="zar", product=product.id
-                )
-                link = self.stripe.PaymentLink.create(
-                    line_items=[{"price": price_obj.id, "quantity": 1}]
-                )
-                return {"url": link.url, "price": price}
-            except stripe.error.StripeError as e:
+                return self.catalog.payment_link(service, tier)
+            except self.stripe.error.StripeError as e:
                 return {"error": str(e)}
 
         return {"amount": price, "note": "Stripe not configured"}
@@ -171,13 +559,12 @@ def get_payment_config():
     return {"mode": "test", "currency": "zar", "webhook_secret": None, "api_key": None}
 
 
-def main():
+def main(argv=None, handler=None):
     import sys
 
-    handler = StripePaymentHandler()
-
-    if len(sys.argv) > 1:
-        command = sys.argv[1]
+    argv = sys.argv if argv is None else argv
+    if len(argv) > 1:
+        command = argv[1]
 
         if command == "services":
             print("\nServices with Pricing (in ZAR):")
@@ -187,17 +574,48 @@ def main():
                 for tier, price in service["prices"].items():
                     print(f"  {tier.title()}: R{price:,}")
 
-        elif command == "create" and len(sys.argv) > 2:
-            service = sys.argv[2]
-            tier = sys.argv[3] if len(sys.argv) > 3 else "standard"
+        elif command == "create" and len(argv) > 2:
+            service = argv[2]
+            tier = argv[3] if len(argv) > 3 else "standard"
+            handler = handler or StripePaymentHandler()
             result = handler.create_checkout_session(service, tier)
             print(json.dumps(result, indent=2))
 
-        elif command == "link" and len(sys.argv) > 2:
-            service = sys.argv[2]
-            tier = sys.argv[3] if len(sys.argv) > 3 else "standard"
+        elif command == "link" and len(argv) > 2:
+            service = argv[2]
+            tier = argv[3] if len(argv) > 3 else "standard"
+            handler = handler or StripePaymentHandler()
             result = handler.create_payment_link(service, tier)
             print(json.dumps(result, indent=2))
+
+        elif command == "bulk" and len(argv) > 2:
+            with open(argv[2]) as f:
+                quotes = json.load(f)
+            workers = int(argv[3]) if len(argv) > 3 else 8
+            handler = handler or StripePaymentHandler()
+            batch_id = argv[4] if len(argv) > 4 else None
+            print(
+                json.dumps(
+                    handler.create_checkout_sessions(
+                        quotes, workers, batch_id=batch_id
+                    ),
+                    indent=2,
+                )
+            )
+
+        elif command == "sync":
+            handler = handler or StripePaymentHandler()
+            if not handler.stripe:
+                print("Set STRIPE_API_KEY to sync the catalog with Stripe")
+            else:
+                print(json.dumps(handler.catalog.sync(), indent=2))
+
+        elif command == "catalog":
+            if CATALOG_FILE.exists():
+                with open(CATALOG_FILE) as f:
+                    print(f.read())
+            else:
+                print("No catalog yet. Run: python payment.py sync")
     else:
         print("EvansMathibe Stripe Payment System")
         print("=" * 40)
@@ -207,8 +625,16 @@ def main():
         )
         print("  python payment.py create <service> [tier] - Create checkout session")
         print("  python payment.py link <service> [tier]   - Create payment link")
+        print(
+            "  python payment.py bulk <quotes.json> [workers] [batch_id] - Checkout sessions for many quotes"
+        )
+        print("  python payment.py sync                    - Sync prices to Stripe")
+        print("  python payment.py catalog                 - Show synced catalog")
         print("\nNote: Set STRIPE_API_KEY env var for live payments")
 
 
 if __name__ == "__main__":
-    main()
+    from agency_daemon import forward
+
+    if not forward("payment"):
+        main()
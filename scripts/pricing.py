@@ -0,0 +1,463 @@
+#!/usr/bin/env python3
+"""
+EvansMathibe Agency - Pricing Engine
+Quotes multi-service packages from SERVICES_PRICING in integer cents:
+bundle discounts, client discounts, VAT and conversion to other currencies
+at locally supplied rates, one quote at a time or many at once
+"""
+
+import copy
+import json
+from array import array
+from decimal import ROUND_HALF_UP, Decimal
+from functools import lru_cache
+from importlib.util import find_spec
+from pathlib import Path
+from typing import Dict, List
+
+from payment import SERVICES_PRICING
+
+# numpy is optional; without it batches are priced column by column in
+# plain Python, which gives the same results more slowly.
+NUMPY_AVAILABLE = find_spec("numpy") is not None
+
+AGENCY_ROOT = Path("/home/ev/EvansMathibe_Agency")
+FX_RATES_FILE = AGENCY_ROOT / "config" / "fx_rates.json"
+
+TIERS = ("basic", "standard", "premium")
+SERVICES = tuple(SERVICES_PRICING)
+SERVICE_INDEX = {service: i for i, service in enumerate(SERVICES)}
+TIER_INDEX = {tier: i for i, tier in enumerate(TIERS)}
+
+# Price of (service, tier) in cents at SERVICES.index(service) * len(TIERS)
+# + TIERS.index(tier); -1 where a service does not offer a tier.
+PRICE_TABLE = array(
+    "q",
+    [
+        (
+            SERVICES_PRICING[service]["prices"][tier] * 100
+            if tier in SERVICES_PRICING[service]["prices"]
+            else -1
+        )
+        for service in SERVICES
+        for tier in TIERS
+    ],
+)
+
+UNIT_INDEX = {
+    (service, tier): s * len(TIERS) + t
+    for s, service in enumerate(SERVICES)
+    for t, tier in enumerate(TIERS)
+    if PRICE_TABLE[s * len(TIERS) + t] >= 0
+}
+
+VAT_BPS = 1500  # South African VAT, 15%
+# Discount on packages of at least this many different services.
+BUNDLE_DISCOUNT_BPS = {2: 500, 3: 1000}
+BUNDLE_BPS_BY_COUNT = [
+    max([bps for n, bps in BUNDLE_DISCOUNT_BPS.items() if count >= n], default=0)
+    for count in range(len(SERVICES) + 1)
+]
+# Bundle discount for each set of services, as a bitmask of service indexes.
+BUNDLE_BPS_BY_MASK = [
+    BUNDLE_BPS_BY_COUNT[bin(mask).count("1")] for mask in range(1 << len(SERVICES))
+]
+
+SERVICE_BITS = [1 << (index // len(TIERS)) for index in range(len(PRICE_TABLE))]
+
+BASE_CURRENCY = "ZAR"
+RATE_SCALE = 1_000_000  # rates are held as integer millionths
+
+
+def scaled(value, scale: int) -> int:
+    """``value * scale`` rounded half up to an integer, without float error."""
+    return int((Decimal(str(value)) * scale).to_integral_value(ROUND_HALF_UP))
+
+
+def apply_bps(amount: int, bps: int) -> int:
+    """``bps`` basis points of ``amount`` cents, rounded half up."""
+    return (amount * bps + 5000) // 10000
+
+
+def rate_table(rates: Dict = None) -> Dict[str, int]:
+    """Units of each currency per rand, as integer millionths.
+
+    ``rates`` maps currency codes to rates such as ``{"USD": 0.054}``; when
+    omitted they are read from ``FX_RATES_FILE``. Rand is always present.
+    """
+    if rates is None:
+        try:
+            with open(FX_RATES_FILE) as f:
+                rates = json.load(f)
+        except (OSError, ValueError):
+            rates = {}
+    table = {code.upper(): scaled(rate, RATE_SCALE) for code, rate in rates.items()}
+    table[BASE_CURRENCY] = RATE_SCALE
+    if any(rate <= 0 for rate in table.values()):
+        raise ValueError("Exchange rates must be positive")
+    return table
+
+
+def unit_index(service: str, tier: str) -> int:
+    """Position of ``(service, tier)`` in ``PRICE_TABLE``."""
+    index = UNIT_INDEX.get((service, tier))
+    if index is None:
+        index = UNIT_INDEX.get((service.lower(), tier.lower()))
+    if index is None:
+        if service.lower() not in SERVICE_INDEX:
+            raise ValueError(f"Unknown service: {service}")
+        raise ValueError(f"Unknown tier for {service}: {tier}")
+    return index
+
+
+@lru_cache(maxsize=1024)
+def percent_bps(percent) -> int:
+    bps = scaled(percent, 100)
+    if not 0 <= bps <= 10000:
+        raise ValueError(f"Discount must be between 0 and 100%: {percent}")
+    return bps
+
+
+def discount_bps(spec: Dict) -> int:
+    return percent_bps(spec.get("discount_pct", 0))
+
+
+def quantity(item: Dict) -> int:
+    qty = item.get("quantity", 1)
+    if not isinstance(qty, int) or isinstance(qty, bool) or qty < 0:
+        raise ValueError(f"Quantity must be a whole number >= 0: {qty}")
+    return qty
+
+
+def currency_rate(spec: Dict, rates: Dict[str, int]):
+    currency = spec.get("currency", BASE_CURRENCY).upper()
+    if currency not in rates:
+        raise ValueError(f"No exchange rate for {currency}")
+    return currency, rates[currency]
+
+
+def quote(spec: Dict, rates: Dict = None) -> Dict:
+    """Price one package.
+
+    ``spec`` is ``{"items": [{"service", "tier", "quantity"}, ...]}`` with
+    optional ``discount_pct``, ``vat`` (default True) and ``currency``
+    (default ZAR), and ``rates`` comes from ``rate_table``. The bundle
+    discount comes off the subtotal first, then the client discount, then
+    VAT is added and the total converted. Each step is rounded half up to
+    the cent. All amounts but ``total_cents`` are in rand cents;
+    ``total_cents`` is in the quote's currency.
+    """
+    rates = rate_table() if rates is None else rates
+    subtotal, services = 0, set()
+    for item in spec["items"]:
+        index = unit_index(item["service"], item.get("tier", "standard"))
+        subtotal += PRICE_TABLE[index] * quantity(item)
+        services.add(index // len(TIERS))
+    bundle = apply_bps(subtotal, BUNDLE_BPS_BY_COUNT[len(services)])
+    discount = apply_bps(subtotal - bundle, discount_bps(spec))
+    net = subtotal - bundle - discount
+    vat = apply_bps(net, VAT_BPS) if spec.get("vat", True) else 0
+    currency, rate = currency_rate(spec, rates)
+    return {
+        "subtotal_cents": subtotal,
+        "bundle_discount_cents": bundle,
+        "discount_cents": discount,
+        "net_cents": net,
+        "vat_cents": vat,
+        "gross_cents": net + vat,
+        "currency": currency,
+        "total_cents": ((net + vat) * rate + RATE_SCALE // 2) // RATE_SCALE,
+    }
+
+
+class QuoteBatch:
+    """Many quotes flattened into parallel integer columns.
+
+    Line items of every quote sit end to end in ``price_index`` and
+    ``quantities``; quote ``i`` owns the lines from ``starts[i]`` up to
+    ``starts[i + 1]``.
+    """
+
+    def __init__(self, specs: List[Dict], rates: Dict[str, int]):
+        starts, price_index, quantities = [], [], []
+        discounts, vat, quote_rates, currencies = [], [], [], []
+        self.longest = 0
+        for spec in specs:
+            starts.append(len(price_index))
+            items = spec["items"]
+            for item in items:
+                price_index.append(
+                    unit_index(item["service"], item.get("tier", "standard"))
+                )
+                quantities.append(quantity(item))
+            if len(items) > self.longest:
+                self.longest = len(items)
+            discounts.append(discount_bps(spec))
+            vat.append(1 if spec.get("vat", True) else 0)
+            currency, rate = currency_rate(spec, rates)
+            currencies.append(currency)
+            quote_rates.append(rate)
+        self.size = len(specs)
+        self.starts = array("q", starts)
+        self.price_index = array("q", price_index)
+        self.quantities = array("q", quantities)
+        self.discount_bps = array("q", discounts)
+        self.vat = array("q", vat)
+        self.rates = array("q", quote_rates)
+        self.currencies = currencies
+
+    def scenario(self, discount_pct=None, vat=None, currency=None, rates=None):
+        """Copy of this batch with the same line items but one discount, VAT
+        setting or currency applied to every quote, for what-if pricing
+        without encoding the quotes again."""
+        other = copy.copy(self)
+        if discount_pct is not None:
+            other.discount_bps = array("q", [percent_bps(discount_pct)]) * self.size
+        if vat is not None:
+            other.vat = array("q", [1 if vat else 0]) * self.size
+        if currency is not None:
+            rates = rate_table() if rates is None else rates
+            code, rate = currency_rate({"currency": currency}, rates)
+            other.currencies = [code] * self.size
+            other.rates = array("q", [rate]) * self.size
+        return other
+
+    def fits_int64(self) -> bool:
+        """Whether no intermediate value can overflow a 64-bit integer."""
+        if not self.price_index:
+            return True
+        largest_line = max(self.quantities) * max(PRICE_TABLE)
+        return largest_line * self.longest * 2 * max(max(self.rates), 10000) < 2**63
+
+
+def _price_columns_python(batch: QuoteBatch) -> Dict[str, List[int]]:
+    ends = list(batch.starts[1:]) + [len(batch.price_index)]
+    columns = {name: [] for name in ("subtotal", "bundle", "discount", "net", "vat")}
+    totals = []
+    for i, (start, end) in enumerate(zip(batch.starts, ends)):
+        subtotal, services = 0, 0
+        for line in range(start, end):
+            index = batch.price_index[line]
+            subtotal += PRICE_TABLE[index] * batch.quantities[line]
+            services |= SERVICE_BITS[index]
+        bundle = apply_bps(subtotal, BUNDLE_BPS_BY_MASK[services])
+        discount = apply_bps(subtotal - bundle, batch.discount_bps[i])
+        net = subtotal - bundle - discount
+        vat = apply_bps(net, VAT_BPS) if batch.vat[i] else 0
+        for name, value in zip(columns, (subtotal, bundle, discount, net, vat)):
+            columns[name].append(value)
+        totals.append(((net + vat) * batch.rates[i] + RATE_SCALE // 2) // RATE_SCALE)
+    columns["total"] = totals
+    return columns
+
+
+def _price_columns_numpy(batch: QuoteBatch) -> Dict[str, List[int]]:
+    import numpy as np
+
+    table = np.asarray(PRICE_TABLE, dtype=np.int64)
+    index = np.frombuffer(batch.price_index, dtype=np.int64)
+    quantities = np.frombuffer(batch.quantities, dtype=np.int64)
+    starts = np.frombuffer(batch.starts, dtype=np.int64)
+    counts = np.diff(np.append(starts, len(index)))
+
+    # Sum each quote's lines; the trailing zero keeps reduceat in bounds for
+    # empty quotes at the end, and empty quotes are zeroed afterwards.
+    lines = np.append(table[index] * quantities, 0)
+    subtotal = np.add.reduceat(lines, starts) if len(starts) else lines[:0]
+    subtotal[counts == 0] = 0
+
+    # OR together the bit of each line's service to get the quote's set of
+    # services, which indexes straight into the bundle discount.
+    bits = np.append(np.asarray(SERVICE_BITS, dtype=np.int64)[index], 0)
+    services = np.bitwise_or.reduceat(bits, starts) if len(starts) else bits[:0]
+    services[counts == 0] = 0
+    bundle_bps = np.asarray(BUNDLE_BPS_BY_MASK, dtype=np.int64)[services]
+
+    bundle = (subtotal * bundle_bps + 5000) // 10000
+    discount = (
+        (subtotal - bundle) * np.frombuffer(batch.discount_bps, dtype=np.int64) + 5000
+    ) // 10000
+    net = subtotal - bundle - discount
+    vat = ((net * VAT_BPS + 5000) // 10000) * np.frombuffer(batch.vat, dtype=np.int64)
+    rates = np.frombuffer(batch.rates, dtype=np.int64)
+    total = ((net + vat) * rates + RATE_SCALE // 2) // RATE_SCALE
+    return {
+        "subtotal": subtotal.tolist(),
+        "bundle": bundle.tolist(),
+        "discount": discount.tolist(),
+        "net": net.tolist(),
+        "vat": vat.tolist(),
+        "total": total.tolist(),
+    }
+
+
+def price_columns(batch: QuoteBatch, engine: str = None) -> Dict[str, List[int]]:
+    """Amounts for every quote in ``batch``, one list per amount.
+
+    ``engine`` is "numpy" or "python"; by default numpy is used when it is
+    installed and the amounts are small enough for 64-bit arithmetic.
+    """
+    if engine is None:
+        engine = "numpy" if NUMPY_AVAILABLE and batch.fits_int64() else "python"
+    if engine == "numpy":
+        return _price_columns_numpy(batch)
+    if engine == "python":
+        return _price_columns_python(batch)
+    raise ValueError(f"Unknown pricing engine: {engine}")
+
+
+def quote_many(specs: List[Dict], rates: Dict = None, engine: str = None) -> List[Dict]:
+    """``[quote(spec, rates) for spec in specs]``, computed a column at a time."""
+    rates = rate_table() if rates is None else rates
+    batch = QuoteBatch(specs, rates)
+    columns = price_columns(batch, engine)
+    return [
+        {
+            "subtotal_cents": subtotal,
+            "bundle_discount_cents": bundle,
+            "discount_cents": discount,
+            "net_cents": net,
+            "vat_cents": vat,
+            "gross_cents": net + vat,
+            "currency": currency,
+            "total_cents": total,
+        }
+        for subtotal, bundle, discount, net, vat, total, currency in zip(
+            columns["subtotal"],
+            columns["bundle"],
+            columns["discount"],
+            columns["net"],
+            columns["vat"],
+            columns["total"],
+            batch.currencies,
+        )
+    ]
+
+
+def random_quotes(count: int, currencies, seed: int = 7) -> List[Dict]:
+    """Reproducible what-if scenarios for benchmarking."""
+    import random
+
+    rng = random.Random(seed)
+    quotes = []
+    for _ in range(count):
+        quotes.append(
+            {
+                "items": [
+                    {
+                        "service": rng.choice(SERVICES),
+                        "tier": rng.choice(TIERS),
+                        "quantity": rng.randint(1, 3),
+                    }
+                    for _ in range(rng.randint(1, 4))
+                ],
+                "discount_pct": rng.choice([0, 0, 5, 7.5, 12.5, 20]),
+                "vat": rng.random() < 0.9,
+                "currency": rng.choice(currencies),
+            }
+        )
+    return quotes
+
+
+def benchmark(count: int = 100_000):
+    """Time the scalar path against each batch engine on the same quotes and
+    check that every engine gives identical results. ``pricing_s`` leaves
+    out turning the quotes into columns and the columns back into dicts."""
+    import time
+
+    engines = ["python"]
+    if NUMPY_AVAILABLE:
+        import numpy  # noqa: F401  (keep the import out of the timings)
+
+        engines.append("numpy")
+
+    rates = rate_table({"USD": 0.0542, "EUR": 0.0498, "GBP": 0.0427, "BWP": 0.7391})
+    specs = random_quotes(count, sorted(rates))
+
+    start = time.perf_counter()
+    expected = [quote(spec, rates) for spec in specs]
+    scalar = time.perf_counter() - start
+    report = {
+        "quotes": count,
+        "scalar_s": round(scalar, 3),
+        "scalar_quotes_per_s": round(count / scalar),
+    }
+
+    start = time.perf_counter()
+    batch = QuoteBatch(specs, rates)
+    report["encode_s"] = round(time.perf_counter() - start, 3)
+
+    what_if = [
+        batch.scenario(discount_pct=pct, currency=code, rates=rates)
+        for pct in (0, 5, 10, 15, 20)
+        for code in rates
+    ]
+
+    for engine in engines:
+        start = time.perf_counter()
+        price_columns(batch, engine)
+        pricing = time.perf_counter() - start
+        start = time.perf_counter()
+        for scenario in what_if:
+            price_columns(scenario, engine)
+        scenarios = time.perf_counter() - start
+        start = time.perf_counter()
+        results = quote_many(specs, rates, engine)
+        elapsed = time.perf_counter() - start
+        report[engine] = {
+            "pricing_s": round(pricing, 4),
+            "pricing_quotes_per_s": round(count / pricing),
+            "end_to_end_s": round(elapsed, 3),
+            f"what_if_{len(what_if)}_scenarios_s": round(scenarios, 3),
+            "speedup": round(scalar / elapsed, 2),
+            "matches_scalar": results == expected,
+        }
+    return report
+
+
+def main():
+    import sys
+
+    args = sys.argv[1:]
+    if args and args[0] == "quote" and len(args) > 1:
+        spec = {"items": []}
+        rest = iter(args[1:])
+        for arg in rest:
+            if arg == "--discount":
+                spec["discount_pct"] = float(next(rest))
+            elif arg == "--currency":
+                spec["currency"] = next(rest)
+            elif arg == "--no-vat":
+                spec["vat"] = False
+            else:
+                item, _, qty = arg.partition("x")
+                service, _, tier = item.partition(":")
+                spec["items"].append(
+                    {
+                        "service": service,
+                        "tier": tier or "standard",
+                        "quantity": int(qty or 1),
+                    }
+                )
+        try:
+            print(json.dumps(quote(spec), indent=2))
+        except ValueError as e:
+            print(json.dumps({"error": str(e)}, indent=2))
+    elif args and args[0] == "batch" and len(args) > 1:
+        with open(args[1]) as f:
+            specs = json.load(f)
+        print(json.dumps(quote_many(specs), indent=2))
+    elif args and args[0] == "bench":
+        count = int(args[1]) if len(args) > 1 else 100_000
+        print(json.dumps(benchmark(count), indent=2))
+    else:
+        print("Usage:")
+        print("  python pricing.py quote <service[:tier][xqty]> ... [--discount pct]")
+        print("                    [--currency CODE] [--no-vat]  - Quote a package")
+        print("  python pricing.py batch <quotes.json>           - Quote many packages")
+        print("  python pricing.py bench [quotes]                - Scalar vs batch")
+        print(f"\nExchange rates (units per rand) are read from {FX_RATES_FILE}")
+
+
+if __name__ == "__main__":
+    main()
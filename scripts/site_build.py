@@ -0,0 +1,594 @@
+#!/usr/bin/env python3
+"""
+EvansMathibe Agency - Site Builder
+Renders gallery, video, blog index and project pages into the website and
+regenerates sitemap.xml, rebuilding only the outputs whose inputs changed
+"""
+
+import hashlib
+import html
+import json
+import os
+import re
+import shutil
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List
+
+from asset_cache import file_digest
+from image_derivatives import DERIVED_SUBDIR, load_metadata
+from video_manager import VIDEO_FORMATS, VideoManager
+
+AGENCY_ROOT = Path("/home/ev/EvansMathibe_Agency")
+WEBSITE_DIR = AGENCY_ROOT / "website"
+# The site is also published from docs/, kept as a copy of website/.
+MIRROR_DIRS = [AGENCY_ROOT / "docs"]
+GALLERIES_DIR = AGENCY_ROOT / "assets" / "galleries"
+MANIFEST_FILE = AGENCY_ROOT / "data" / "site_build.json"
+
+SITE_URL = "https://evansxm.github.io/evansmathibe-agency/"
+# Hand-kept pages that are not meant to be found through search engines.
+UNLISTED_PAGES = {"analytics.html", "test.html"}
+
+TITLE_PATTERN = re.compile(r"<title>(.*?)</title>", re.S | re.I)
+DESCRIPTION_PATTERN = re.compile(
+    r'<meta\s+name="description"\s+content="(.*?)"', re.S | re.I
+)
+
+PAGE_TEMPLATE = """<!DOCTYPE html>
+<html lang="en">
+<head>
+    <meta charset="UTF-8">
+    <meta name="viewport" content="width=device-width, initial-scale=1.0">
+    <title>{title} | EvansMathibe Agency</title>
+    <meta name="description" content="{description}">
+    <link rel="icon" type="image/png" href="{root}favicon.png">
+    <link href="https://fonts.googleapis.com/css2?family=Outfit:wght@300;400;500;600;700&family=Playfair+Display:wght@400;500;600;700&display=swap" rel="stylesheet">
+    <link href="https://cdn.jsdelivr.net/npm/bootstrap@5.3.2/dist/css/bootstrap.min.css" rel="stylesheet">
+    <style>
+        :root {{ --primary-dark: #5B0A0A; --burgundy: #4A0404; --accent-pink: #FFB6B4; --off-white: #F8F8F8; }}
+        body {{ font-family: 'Outfit', sans-serif; background: var(--off-white); color: #1a1a1a; }}
+        h1, h2, h3 {{ font-family: 'Playfair Display', serif; color: var(--burgundy); }}
+        .navbar {{ background: rgba(91, 10, 10, 0.95); padding: 1rem 0; }}
+        .navbar a {{ color: var(--accent-pink); text-decoration: none; }}
+        .gallery-grid {{ display: grid; grid-template-columns: repeat(auto-fill, minmax(260px, 1fr)); gap: 1rem; }}
+        .gallery-masonry {{ columns: 3 260px; column-gap: 1rem; }}
+        .gallery-masonry img {{ margin-bottom: 1rem; }}
+        .gallery-grid img, .gallery-masonry img {{ width: 100%; border-radius: 10px; }}
+    </style>
+</head>
+<body>
+    <nav class="navbar"><div class="container">
+        <a href="{root}index.html"><img src="{root}logo.png" alt="EvansMathibe Logo" style="height: 45px; margin-right: 10px;">EvansMathibe</a>
+    </div></nav>
+    <main class="container py-5">
+        <h1 class="mb-4">{title}</h1>
+{body}
+    </main>
+</body>
+</html>
+"""
+
+
+def value_digest(value) -> str:
+    data = json.dumps(value, sort_keys=True, default=str).encode()
+    return hashlib.sha256(data).hexdigest()
+
+
+def slugify(name: str) -> str:
+    return re.sub(r"[^a-z0-9]+", "-", name.lower()).strip("-") or "page"
+
+
+def render_page(title: str, body: str, description: str = "", depth: int = 0) -> str:
+    return PAGE_TEMPLATE.format(
+        title=html.escape(title),
+        description=html.escape(description or title),
+        root="../" * depth,
+        body=body,
+    )
+
+
+def page_summary(path: Path) -> Dict:
+    """Title and description of a hand-written page."""
+    with open(path, encoding="utf-8", errors="replace") as f:
+        head = f.read(8192)
+    title = TITLE_PATTERN.search(head)
+    description = DESCRIPTION_PATTERN.search(head)
+    return {
+        "title": (
+            html.unescape(title.group(1).split("|")[0].strip()) if title else path.stem
+        ),
+        "description": html.unescape(description.group(1)) if description else "",
+    }
+
+
+class SiteBuilder:
+    """Builds generated pages into ``site_dir`` incrementally.
+
+    Each output is declared with the files it reads and the data values it
+    renders (video names, project records and so on). ``MANIFEST_FILE``
+    keeps, per output, the size, mtime and digest of every input file, the
+    digest of every value and the digest of what was written. An output is
+    rebuilt only when one of those changed, when the output itself was
+    edited or deleted, or when this module changed. A file whose mtime
+    moved but whose content did not just has its manifest entry refreshed.
+    Gallery pages use the srcset metadata of ``image_derivatives`` for
+    images that have derivatives, so deriving images after a build and then
+    building again upgrades them to ``<picture>`` elements. Outputs that
+    are no longer declared are deleted. ``sitemap.xml`` is declared last,
+    over every page in the site, so it is regenerated in the same pass
+    whenever a page appears or disappears. Gallery images are copied to
+    ``images/gallery/<gallery slug>/``, so galleries never overwrite each
+    other's images. Outputs and image derivatives are then copied into
+    each of ``mirror_dirs`` wherever the copy is missing or stale.
+    """
+
+    def __init__(
+        self,
+        site_dir: Path = WEBSITE_DIR,
+        galleries_dir: Path = GALLERIES_DIR,
+        manifest_file: Path = MANIFEST_FILE,
+        history=None,
+        mirror_dirs: List[Path] = None,
+    ):
+        self.site_dir = Path(site_dir)
+        self.mirror_dirs = [Path(d) for d in mirror_dirs or []]
+        self.galleries_dir = Path(galleries_dir)
+        self.videos_dir = self.site_dir / "videos"
+        self.manifest_file = Path(manifest_file)
+        self.history = history
+        self.manifest = self._load_manifest()
+        self._builder_digest = file_digest(__file__)
+
+    def _load_manifest(self) -> Dict:
+        try:
+            with open(self.manifest_file) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {"outputs": {}}
+
+    def _save_manifest(self):
+        self.manifest_file.parent.mkdir(parents=True, exist_ok=True)
+        tmp_file = self.manifest_file.with_suffix(".tmp")
+        with open(tmp_file, "w") as f:
+            f.write(json.dumps(self.manifest, separators=(",", ":")))
+        os.replace(tmp_file, self.manifest_file)
+
+    # Targets
+
+    def _gallery_targets(self, targets: Dict):
+        if not self.galleries_dir.exists():
+            return
+        derived = load_metadata(self.site_dir)["images"]
+        for gallery_file in sorted(self.galleries_dir.glob("*.json")):
+            try:
+                with open(gallery_file) as f:
+                    gallery = json.load(f)
+            except (OSError, ValueError):
+                continue
+            slug = slugify(gallery_file.stem)
+            images, sources = [], {}
+            for image in gallery.get("images", []):
+                source = Path(image)
+                if not source.is_file():
+                    continue
+                # Same-named images from different folders get a suffix.
+                name, n = source.name, 1
+                while sources.setdefault(name, source) != source:
+                    n += 1
+                    name = f"{source.stem}-{n}{source.suffix}"
+                output = f"images/gallery/{slug}/{name}"
+                targets[output] = {
+                    "files": [source],
+                    "values": {},
+                    "render": lambda source=source: source.read_bytes(),
+                }
+                images.append(f"{slug}/{name}")
+            page = {
+                "name": gallery.get("name", gallery_file.stem),
+                "layout": gallery.get("layout", "grid"),
+                "images": images,
+                "srcset": {
+                    name: derived[f"images/gallery/{name}"]["srcset"]
+                    for name in images
+                    if derived.get(f"images/gallery/{name}", {}).get("srcset")
+                },
+            }
+            targets[f"galleries/{slug}.html"] = {
+                "files": [],
+                "values": {"gallery": page},
+                "render": lambda page=page: self.render_gallery(page),
+            }
+
+    def _video_targets(self, targets: Dict):
+        if not self.videos_dir.exists():
+            return
+        names = sorted(
+            entry.name
+            for entry in os.scandir(self.videos_dir)
+            if os.path.splitext(entry.name)[1].lower() in VIDEO_FORMATS
+        )
+        if names:
+            targets["videos.html"] = {
+                "files": [],
+                "values": {"videos": names},
+                "render": lambda: self.render_videos(names),
+            }
+
+    def _blog_targets(self, targets: Dict):
+        sources = sorted(self.site_dir.glob("blog/*/page1.html"))
+        sources += sorted(self.site_dir.glob("articles/*.html"))
+        if sources:
+            targets["blog/index.html"] = {
+                "files": sources,
+                "values": {},
+                "render": lambda: self.render_blog_index(sources),
+            }
+
+    def _project_targets(self, targets: Dict):
+        history = self.history
+        if history is None:
+            from task_history import DATA_FILE, open_history
+
+            if not (
+                DATA_FILE.exists()
+                or DATA_FILE.with_suffix("").exists()
+                or DATA_FILE.with_suffix(".db").exists()
+            ):
+                return
+            history = self.history = open_history()
+        projects = [p for p in history.get_projects() if isinstance(p, dict)]
+        if projects:
+            targets["projects.html"] = {
+                "files": [],
+                "values": {"projects": projects},
+                "render": lambda: self.render_projects(projects),
+            }
+
+    def _sitemap_target(self, targets: Dict):
+        # Generated pages still on disk but no longer declared are about to
+        # be deleted, so they are left out.
+        stale = set(self.manifest["outputs"]) - set(targets)
+        pages = set(p for p in targets if p.endswith(".html"))
+        for directory, dirs, files in os.walk(self.site_dir):
+            dirs[:] = [d for d in dirs if d not in ("images", "videos")]
+            for name in files:
+                if name.endswith(".html"):
+                    path = os.path.join(directory, name)
+                    pages.add(os.path.relpath(path, self.site_dir).replace(os.sep, "/"))
+        pages = sorted(
+            (p for p in pages if p not in UNLISTED_PAGES and p not in stale),
+            key=lambda p: (p != "index.html", p),
+        )
+        targets["sitemap.xml"] = {
+            "files": [],
+            "values": {"pages": pages},
+            "render": lambda: self.render_sitemap(pages),
+        }
+
+    def targets(self) -> Dict[str, Dict]:
+        """``{output path relative to the site: declaration}``."""
+        targets = {}
+        self._gallery_targets(targets)
+        self._video_targets(targets)
+        self._blog_targets(targets)
+        self._project_targets(targets)
+        self._sitemap_target(targets)
+        return targets
+
+    # Rendering
+
+    def render_gallery(self, gallery: Dict) -> str:
+        layout = "gallery-masonry" if gallery["layout"] == "masonry" else "gallery-grid"
+        alt = html.escape(gallery["name"])
+        images = []
+        for name in gallery["images"]:
+            img = (
+                f'<img src="../images/gallery/{html.escape(name)}" alt="{alt}" '
+                'loading="lazy">'
+            )
+            srcset = gallery.get("srcset", {}).get(name)
+            if srcset:
+                # Derivative paths are relative to the site root.
+                sources = "".join(
+                    f'<source type="{mime}" sizes="(min-width: 768px) 33vw, 100vw" '
+                    f'srcset="{html.escape(", ".join("../" + s for s in urls.split(", ")))}">'
+                    for mime, urls in srcset.items()
+                )
+                img = f"<picture>{sources}{img}</picture>"
+            images.append("            " + img)
+        body = (
+            f'        <div class="{layout}">\n' + "\n".join(images) + "\n        </div>"
+        )
+        return render_page(gallery["name"], body, depth=1)
+
+    def render_videos(self, names: List[str]) -> str:
+        body = "\n".join(
+            f'        <section class="mb-5"><h2>{html.escape(Path(name).stem)}</h2>\n'
+            f"{VideoManager.get_html_embed_code(html.escape(name), autoplay=False)}"
+            "\n        </section>"
+            for name in names
+        )
+        return render_page("Videos", body)
+
+    def render_blog_index(self, sources: List[Path]) -> str:
+        entries = []
+        for source in sources:
+            summary = page_summary(source)
+            href = os.path.relpath(source, self.site_dir / "blog").replace(os.sep, "/")
+            entries.append(
+                f'        <article class="mb-4"><h2><a href="{html.escape(href)}">'
+                f'{html.escape(summary["title"])}</a></h2>\n'
+                f'            <p>{html.escape(summary["description"])}</p></article>'
+            )
+        return render_page("Blog", "\n".join(entries), depth=1)
+
+    def render_projects(self, projects: List[Dict]) -> str:
+        rows = []
+        for project in projects:
+            status = project.get("payment_status") or project.get("status", "")
+            rows.append(
+                f'            <tr><td>{html.escape(str(project.get("name", "")))}</td>'
+                f"<td>{html.escape(str(project.get('client', '')))}</td>"
+                f"<td>{html.escape(str(status))}</td></tr>"
+            )
+        body = (
+            '        <table class="table">\n'
+            "            <tr><th>Project</th><th>Client</th><th>Status</th></tr>\n"
+            + "\n".join(rows)
+            + "\n        </table>"
+        )
+        return render_page("Projects", body)
+
+    def render_sitemap(self, pages: List[str]) -> str:
+        entries = []
+        for page in pages:
+            if page == "index.html":
+                loc, freq, priority = SITE_URL, "weekly", "1.0"
+            elif page.startswith("blog/") and page != "blog/index.html":
+                loc, freq, priority = SITE_URL + page, "monthly", "0.9"
+            elif page.startswith("articles/"):
+                loc, freq, priority = SITE_URL + page, "monthly", "0.8"
+            else:
+                loc, freq, priority = SITE_URL + page, "weekly", "0.7"
+            entries.append(
+                f"  <url>\n    <loc>{html.escape(loc)}</loc>\n"
+                f"    <changefreq>{freq}</changefreq>\n"
+                f"    <priority>{priority}</priority>\n  </url>"
+            )
+        return (
+            '<?xml version="1.0" encoding="UTF-8"?>\n'
+            '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n'
+            + "\n".join(entries)
+            + "\n</urlset>\n"
+        )
+
+    # Dependency tracking
+
+    def _fingerprint(self, path: Path, previous):
+        """``[size, mtime_ns, digest]``, hashing only if size or mtime moved."""
+        st = os.stat(path)
+        if previous and previous[0] == st.st_size and previous[1] == st.st_mtime_ns:
+            return previous
+        return [st.st_size, st.st_mtime_ns, file_digest(path)]
+
+    def _inputs(self, target: Dict, previous: Dict) -> Dict:
+        old_files = previous.get("files", {})
+        return {
+            "files": {
+                str(path): self._fingerprint(path, old_files.get(str(path)))
+                for path in target["files"]
+            },
+            "values": {
+                name: value_digest(value) for name, value in target["values"].items()
+            },
+            "builder": self._builder_digest,
+        }
+
+    @staticmethod
+    def _same_inputs(old: Dict, new: Dict) -> bool:
+        if old.get("builder") != new["builder"] or old.get("values") != new["values"]:
+            return False
+        old_files = old.get("files", {})
+        return old_files.keys() == new["files"].keys() and all(
+            old_files[path][2] == fingerprint[2]
+            for path, fingerprint in new["files"].items()
+        )
+
+    def _output_intact(self, output: Path, record: Dict) -> bool:
+        try:
+            st = os.stat(output)
+        except FileNotFoundError:
+            return False
+        return [st.st_size, st.st_mtime_ns] == record.get("output", [None, None])[:2]
+
+    def build(self, force: bool = False, dry_run: bool = False) -> Dict:
+        """Bring every generated output up to date."""
+        start = time.perf_counter()
+        outputs = self.manifest.setdefault("outputs", {})
+        report = {"built": [], "unchanged": 0, "removed": []}
+        targets = self.targets()
+
+        for name, target in targets.items():
+            record = outputs.get(name, {})
+            inputs = self._inputs(target, record.get("inputs", {}))
+            output = self.site_dir / name
+            if (
+                not force
+                and self._same_inputs(record.get("inputs", {}), inputs)
+                and self._output_intact(output, record)
+            ):
+                record["inputs"] = inputs  # keep refreshed mtimes
+                report["unchanged"] += 1
+                continue
+            report["built"].append(name)
+            if dry_run:
+                continue
+            content = target["render"]()
+            if isinstance(content, str):
+                content = content.encode("utf-8")
+            digest = hashlib.sha256(content).hexdigest()
+            if not (output.exists() and record.get("output", [0, 0, ""])[2] == digest):
+                output.parent.mkdir(parents=True, exist_ok=True)
+                tmp_file = output.with_name(output.name + ".tmp")
+                tmp_file.write_bytes(content)
+                os.replace(tmp_file, output)
+            st = os.stat(output)
+            outputs[name] = {
+                "inputs": inputs,
+                "output": [st.st_size, st.st_mtime_ns, digest],
+            }
+
+        for name in [n for n in outputs if n not in targets]:
+            report["removed"].append(name)
+            if dry_run:
+                continue
+            for root in [self.site_dir] + self.mirror_dirs:
+                try:
+                    (root / name).unlink()
+                except FileNotFoundError:
+                    pass
+            del outputs[name]
+
+        if not dry_run:
+            self._save_manifest()
+            if self.mirror_dirs:
+                report["mirrored"] = self._mirror(list(targets))
+        report["seconds"] = round(time.perf_counter() - start, 4)
+        return report
+
+    def _mirror(self, names: List[str]) -> int:
+        """Copy ``names`` and the image derivatives into every mirror root
+        where the copy differs in size or mtime; returns the files copied."""
+        derived = self.site_dir / DERIVED_SUBDIR
+        if derived.exists():
+            names = names + [
+                (DERIVED_SUBDIR / entry.name).as_posix()
+                for entry in os.scandir(derived)
+                if entry.is_file()
+            ]
+        copied = 0
+        for root in self.mirror_dirs:
+            for name in names:
+                source, copy = self.site_dir / name, root / name
+                st = os.stat(source)
+                try:
+                    current = os.stat(copy)
+                except FileNotFoundError:
+                    current = None
+                if current and (current.st_size, current.st_mtime_ns) == (
+                    st.st_size,
+                    st.st_mtime_ns,
+                ):
+                    continue
+                copy.parent.mkdir(parents=True, exist_ok=True)
+                tmp_file = copy.with_name(copy.name + ".tmp")
+                shutil.copy2(source, tmp_file)
+                os.replace(tmp_file, copy)
+                copied += 1
+            # Derivatives image_derivatives removed from the site go too.
+            if (root / DERIVED_SUBDIR).exists():
+                wanted = set(names)
+                for entry in os.scandir(root / DERIVED_SUBDIR):
+                    if (DERIVED_SUBDIR / entry.name).as_posix() not in wanted:
+                        os.unlink(entry.path)
+        return copied
+
+
+def benchmark(articles: int = 200, galleries: int = 50, images_per_gallery: int = 20):
+    """Full build, no-op rebuild and one-gallery rebuild of a synthetic site."""
+    import tempfile
+
+    from task_history import TaskHistory
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        site = tmp / "website"
+        for i in range(articles):
+            page = site / "articles" / f"article-{i}.html"
+            page.parent.mkdir(parents=True, exist_ok=True)
+            page.write_text(
+                f"<html><head><title>Article {i} | EvansMathibe Agency</title>"
+                f'<meta name="description" content="About {i}"></head></html>'
+            )
+        (site / "videos").mkdir(parents=True)
+        for i in range(10):
+            (site / "videos" / f"reel-{i}.mp4").write_bytes(b"\0" * 1024)
+        images = tmp / "images"
+        images.mkdir()
+        for g in range(galleries):
+            paths = []
+            for i in range(images_per_gallery):
+                path = images / f"g{g}-{i}.png"
+                path.write_bytes(os.urandom(4096))
+                paths.append(str(path))
+            gallery_file = tmp / "galleries" / f"gallery_{g}.json"
+            gallery_file.parent.mkdir(exist_ok=True)
+            gallery_file.write_text(
+                json.dumps({"name": f"Gallery {g}", "images": paths})
+            )
+        history = TaskHistory(tmp / "agency_data.json")
+        history.update_project_payments(
+            [
+                {
+                    "project": "Launch",
+                    "status": "paid",
+                    "event_id": "evt_1",
+                    "amount": 100,
+                }
+            ]
+        )
+
+        def run(**kwargs):
+            builder = SiteBuilder(
+                site, tmp / "galleries", tmp / "manifest.json", history
+            )
+            return builder.build(**kwargs)
+
+        full = run()
+        noop = run()
+        # Touch without changing content, then change one gallery for real.
+        os.utime(images / "g0-0.png")
+        touched = run()
+        gallery_file = tmp / "galleries" / "gallery_1.json"
+        gallery = json.loads(gallery_file.read_text())
+        gallery["images"].pop()
+        gallery_file.write_text(json.dumps(gallery))
+        changed = run()
+        return {
+            "outputs": full["unchanged"] + len(full["built"]),
+            "full_build_s": full["seconds"],
+            "noop_rebuild_s": noop["seconds"],
+            "noop_built": len(noop["built"]),
+            "touched_only_built": len(touched["built"]),
+            "one_gallery_changed_s": changed["seconds"],
+            "one_gallery_changed_built": changed["built"],
+            "one_gallery_changed_removed": changed["removed"],
+        }
+
+
+def main():
+    args = [a for a in sys.argv[1:] if not a.startswith("--")]
+    command = args[0] if args else ""
+
+    if command == "build":
+        mirrors = [d for d in MIRROR_DIRS if d.exists()]
+        report = SiteBuilder(mirror_dirs=mirrors).build(force="--force" in sys.argv)
+        print(json.dumps(report, indent=2))
+    elif command == "status":
+        print(json.dumps(SiteBuilder().build(dry_run=True), indent=2))
+    elif command == "bench":
+        print(json.dumps(benchmark(), indent=2))
+    else:
+        print("Usage:")
+        print(
+            "  python site_build.py build [--force]  - Rebuild changed pages and sitemap"
+        )
+        print("  python site_build.py status           - Show what a build would do")
+        print("  python site_build.py bench            - Time full and no-op builds")
+        print(f"\nSite: {WEBSITE_DIR} (mirrored to {', '.join(map(str, MIRROR_DIRS))})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+EvansMathibe Agency - Startup Benchmark
+Measures how long each CLI entry point takes to import, using
+``python -X importtime``, and keeps a history so regressions show up
+"""
+
+import json
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+AGENCY_ROOT = Path("/home/ev/EvansMathibe_Agency")
+HISTORY_FILE = AGENCY_ROOT / "data" / "startup_bench.jsonl"
+
+ENTRY_POINTS = {
+    "agency": REPO_ROOT / "agents" / "agency.py",
+    "video_manager": REPO_ROOT / "scripts" / "video_manager.py",
+    "visual_manager": REPO_ROOT / "scripts" / "visual_manager.py",
+    "payment": REPO_ROOT / "scripts" / "payment.py",
+    "task_history": REPO_ROOT / "scripts" / "task_history.py",
+}
+
+
+def import_profile(module: str, directory: Path):
+    """``(total_us, [(self_us, name), ...])`` for one fresh import of ``module``."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=directory,
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+    total, imports = None, []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:") :].split("|")
+        imports.append((int(self_us), name.strip()))
+        if name.strip() == module:
+            total = int(cumulative_us)
+    return total, imports
+
+
+def benchmark(runs: int = 5, top: int = 5):
+    report = {}
+    for module, path in ENTRY_POINTS.items():
+        totals, slowest = [], {}
+        start = time.perf_counter()
+        for _ in range(runs):
+            total, imports = import_profile(module, path.parent)
+            totals.append(total)
+            for self_us, name in imports:
+                slowest[name] = min(self_us, slowest.get(name, self_us))
+        wall = (time.perf_counter() - start) / runs
+        report[module] = {
+            "import_ms": round(statistics.median(totals) / 1000, 1),
+            "process_ms": round(wall * 1000, 1),
+            "slowest": [
+                [name, round(us / 1000, 1)]
+                for name, us in sorted(slowest.items(), key=lambda i: -i[1])[:top]
+            ],
+        }
+    return report
+
+
+def last_saved():
+    try:
+        with open(HISTORY_FILE) as f:
+            lines = f.read().splitlines()
+        return json.loads(lines[-1]) if lines else None
+    except (OSError, ValueError):
+        return None
+
+
+def save(report):
+    HISTORY_FILE.parent.mkdir(parents=True, exist_ok=True)
+    with open(HISTORY_FILE, "a") as f:
+        f.write(json.dumps({"time": time.time(), "results": report}) + "\n")
+
+
+def main():
+    args = [a for a in sys.argv[1:] if a != "--save"]
+    runs = int(args[0]) if args else 5
+    previous = last_saved()
+    report = benchmark(runs)
+
+    for module, row in report.items():
+        line = f"{module:<16} import {row['import_ms']:>7.1f}ms  process {row['process_ms']:>7.1f}ms"
+        before = previous and previous["results"].get(module)
+        if before:
+            line += f"  ({row['import_ms'] - before['import_ms']:+.1f}ms vs last saved)"
+        print(line)
+        print("    slowest: " + ", ".join(f"{n} {ms}ms" for n, ms in row["slowest"]))
+
+    if "--save" in sys.argv:
+        save(report)
+        print(f"Saved to {HISTORY_FILE}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,490 @@
+#!/usr/bin/env python3
+"""
+EvansMathibe Agency - Stripe Webhook Receiver
+Verifies and durably records Stripe events, acknowledges them straight
+away and applies them to the task history and project payment status in
+the background
+"""
+
+import hashlib
+import hmac
+import json
+import os
+import queue
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Dict, List
+
+AGENCY_ROOT = Path("/home/ev/EvansMathibe_Agency")
+WEBHOOK_DIR = AGENCY_ROOT / "data" / "webhooks"
+WEBHOOK_PORT = 8787
+
+SIGNATURE_TOLERANCE = 300  # seconds, as in Stripe's own libraries
+BATCH_SIZE = 1000
+
+# Event type -> project payment status it sets.
+PAYMENT_STATUSES = {
+    "checkout.session.completed": "paid",
+    "checkout.session.async_payment_succeeded": "paid",
+    "checkout.session.async_payment_failed": "failed",
+    "checkout.session.expired": "expired",
+    "payment_intent.payment_failed": "failed",
+    "charge.refunded": "refunded",
+}
+
+
+def sign_payload(payload: bytes, secret: str, timestamp: int = None) -> str:
+    """``Stripe-Signature`` header value for ``payload``."""
+    timestamp = int(time.time()) if timestamp is None else timestamp
+    signed = f"{timestamp}.".encode() + payload
+    digest = hmac.new(secret.encode(), signed, hashlib.sha256).hexdigest()
+    return f"t={timestamp},v1={digest}"
+
+
+def verify_signature(
+    payload: bytes, header: str, secret: str, tolerance: int = SIGNATURE_TOLERANCE
+) -> bool:
+    """Check a ``Stripe-Signature`` header the way Stripe's SDKs do: any
+    ``v1`` HMAC-SHA256 of ``"<t>.<payload>"`` must match and ``t`` must be
+    within ``tolerance`` seconds of now."""
+    try:
+        items = [part.split("=", 1) for part in header.split(",")]
+        timestamp = int(next(v for k, v in items if k == "t"))
+    except (AttributeError, ValueError, StopIteration):
+        return False
+    if tolerance and abs(time.time() - timestamp) > tolerance:
+        return False
+    signed = f"{timestamp}.".encode() + payload
+    expected = hmac.new(secret.encode(), signed, hashlib.sha256).hexdigest()
+    return any(k == "v1" and hmac.compare_digest(v, expected) for k, v in items)
+
+
+class EventStore:
+    """Append-only record of received and processed event ids.
+
+    ``events.jsonl`` holds every accepted event and ``processed.log`` the ids
+    whose effects have been applied. Both are appended in batches with one
+    fsync per batch. Anything received but not processed when the service
+    stopped is handed back by ``pending()`` on the next start.
+    """
+
+    def __init__(self, directory: Path = WEBHOOK_DIR):
+        self.directory = Path(directory)
+        self.events_file = self.directory / "events.jsonl"
+        self.processed_file = self.directory / "processed.log"
+        self.seen = set()
+        self.processed = set()
+        self._unprocessed = []
+        self._load()
+
+    def _load(self):
+        if self.processed_file.exists():
+            with open(self.processed_file) as f:
+                self.processed.update(line.strip() for line in f if line.strip())
+        if self.events_file.exists():
+            with open(self.events_file) as f:
+                for line in f:
+                    try:
+                        event = json.loads(line)
+                    except ValueError:
+                        continue  # torn final line from a crash mid-write
+                    self.seen.add(event["id"])
+                    if event["id"] not in self.processed:
+                        self._unprocessed.append(event)
+
+    def pending(self) -> List[Dict]:
+        events, self._unprocessed = self._unprocessed, []
+        return events
+
+    @staticmethod
+    def _append(path: Path, lines: List[str]):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "a") as f:
+            f.write("".join(lines))
+            f.flush()
+            os.fsync(f.fileno())
+
+    def record(self, events: List[Dict]):
+        self._append(
+            self.events_file,
+            [json.dumps(e, separators=(",", ":")) + "\n" for e in events],
+        )
+
+    def mark_processed(self, event_ids: List[str]):
+        self._append(self.processed_file, [f"{i}\n" for i in event_ids])
+        self.processed.update(event_ids)
+
+
+def payment_update(event: Dict):
+    """Project payment change carried by ``event``, or None."""
+    status = PAYMENT_STATUSES.get(event.get("type"))
+    obj = event.get("data", {}).get("object", {})
+    metadata = obj.get("metadata") or {}
+    project = metadata.get("project") or metadata.get("client")
+    if status is None or not project:
+        return None
+    amount = obj.get("amount_total", obj.get("amount"))
+    return {
+        "project": project,
+        "status": status,
+        "event_id": event["id"],
+        "amount": amount / 100 if amount is not None else None,
+        "service": metadata.get("service"),
+    }
+
+
+def task_entry(event: Dict, update: Dict):
+    amount = f" R{update['amount']:,.2f}" if update.get("amount") else ""
+    service = f" for {update['service']}" if update.get("service") else ""
+    return (
+        f"Payment {update['status']}:{amount}{service} ({update['project']})",
+        f"Stripe {event['type']} {event['id']}",
+    )
+
+
+class WebhookService:
+    """Receives Stripe events over HTTP and applies them in the background.
+
+    Request threads only verify the signature and parse the event; a
+    single writer thread dedupes by id and appends batches with one fsync,
+    and each request is acknowledged once its batch is on disk. A worker
+    thread then applies the new events to the task history and project
+    payment status, a batch at a time, before marking them processed.
+    Because the writer is the only thread that checks and records ids, a
+    burst of redeliveries can never let the same event through twice.
+    A batch that fails is retried one event at a time; events that still
+    fail are reported on stderr and left unprocessed, so the next start
+    replays them.
+    """
+
+    def __init__(
+        self,
+        secret: str,
+        history=None,
+        directory: Path = WEBHOOK_DIR,
+        host: str = "127.0.0.1",
+        port: int = WEBHOOK_PORT,
+    ):
+        self.secret = secret
+        self.history = history
+        self.store = EventStore(directory)
+        self.address = (host, port)
+        self.stats = {
+            "accepted": 0,
+            "duplicate": 0,
+            "rejected": 0,
+            "processed": 0,
+            "failed": 0,
+        }
+        self.failed = set()
+        self._recovered = set()
+        self._incoming = queue.SimpleQueue()
+        self._work = queue.SimpleQueue()
+        self._idle = threading.Condition()
+        self._threads = []
+        self._server = None
+
+    def _history(self):
+        if self.history is None:
+            from task_history import open_history
+
+            self.history = open_history()
+        return self.history
+
+    # Request side
+
+    def receive(self, payload: bytes, signature: str):
+        """``(http_status, reply)`` for one webhook delivery."""
+        if not verify_signature(payload, signature or "", self.secret):
+            self.stats["rejected"] += 1
+            return 400, {"error": "Invalid signature"}
+        try:
+            event = json.loads(payload)
+            event_id = event["id"]
+        except (ValueError, KeyError, TypeError):
+            self.stats["rejected"] += 1
+            return 400, {"error": "Malformed event"}
+        if event_id in self.store.seen:
+            self.stats["duplicate"] += 1
+            return 200, {"received": True, "duplicate": True}
+        done = threading.Event()
+        slot = {"event": event, "done": done}
+        self._incoming.put(slot)
+        done.wait()
+        if slot.get("error"):
+            return 500, {"error": slot["error"]}
+        return 200, {"received": True, "duplicate": slot["duplicate"]}
+
+    def _drain(self, source: queue.SimpleQueue, first):
+        batch = [first]
+        while len(batch) < BATCH_SIZE:
+            try:
+                batch.append(source.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _write_loop(self):
+        while True:
+            batch = self._drain(self._incoming, self._incoming.get())
+            if None in batch:
+                batch = [slot for slot in batch if slot is not None]
+                stop = True
+            else:
+                stop = False
+            fresh = []
+            for slot in batch:
+                event_id = slot["event"]["id"]
+                slot["duplicate"] = event_id in self.store.seen
+                if not slot["duplicate"]:
+                    self.store.seen.add(event_id)
+                    fresh.append(slot["event"])
+            try:
+                if fresh:
+                    self.store.record(fresh)
+            except OSError as e:
+                for event in fresh:
+                    self.store.seen.discard(event["id"])
+                for slot in batch:
+                    slot["error"] = f"Could not record event: {e}"
+                fresh = []
+            self.stats["accepted"] += len(fresh)
+            self.stats["duplicate"] += len(batch) - len(fresh)
+            for event in fresh:
+                self._work.put(event)
+            for slot in batch:
+                slot["done"].set()
+            if stop:
+                self._work.put(None)
+                return
+
+    # Processing side
+
+    def process(self, events: List[Dict]):
+        """Apply a batch of events and mark them processed."""
+        history = self._history()
+        updates = [(e, payment_update(e)) for e in events]
+        updates = [(e, u) for e, u in updates if u is not None]
+        if updates:
+            recovered = {e["id"] for e in events} & self._recovered
+            entries = [
+                task_entry(e, u)
+                for e, u in updates
+                if e["id"] not in recovered or not history.search_tasks(e["id"])
+            ]
+            if entries:
+                history.add_tasks(entries)
+            history.update_project_payments([u for _, u in updates])
+        self.store.mark_processed([e["id"] for e in events])
+        self.stats["processed"] += len(events)
+
+    def _process_safely(self, batch: List[Dict]):
+        try:
+            self.process(batch)
+            return
+        except Exception as e:
+            error = e
+        if len(batch) > 1:
+            # Part of the batch may have been applied; treating the events as
+            # recovered keeps their tasks from being added twice.
+            self._recovered.update(e["id"] for e in batch)
+            for event in batch:
+                try:
+                    self.process([event])
+                except Exception as e:
+                    self._failed(event, e)
+        else:
+            self._failed(batch[0], error)
+
+    def _failed(self, event: Dict, error: Exception):
+        self.failed.add(event["id"])
+        self.stats["failed"] += 1
+        print(
+            f"Could not process {event['id']}: {type(error).__name__}: {error}",
+            file=sys.stderr,
+        )
+
+    def _work_loop(self):
+        while True:
+            batch = self._drain(self._work, self._work.get())
+            stop = None in batch
+            batch = [e for e in batch if e is not None]
+            if batch:
+                self._process_safely(batch)
+            with self._idle:
+                self._idle.notify_all()
+            if stop:
+                return
+
+    def wait_idle(self, timeout: float = 30.0) -> bool:
+        """Block until every accepted event has been processed or has failed."""
+        deadline = time.monotonic() + timeout
+        with self._idle:
+            while len(self.store.processed | self.failed) < len(self.store.seen):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not self._idle.wait(remaining):
+                    return False
+        return True
+
+    # Lifecycle
+
+    def start(self):
+        service = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # Headers and body go out in separate writes; without this
+            # each keep-alive reply waits on the client's delayed ACK.
+            disable_nagle_algorithm = True
+
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                payload = self.rfile.read(length)
+                if self.path.rstrip("/") != "/webhook":
+                    status, reply = 404, {"error": "Not found"}
+                else:
+                    status, reply = service.receive(
+                        payload, self.headers.get("Stripe-Signature")
+                    )
+                body = json.dumps(reply).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        class Server(ThreadingHTTPServer):
+            daemon_threads = True
+            request_queue_size = 256
+
+        pending = self.store.pending()
+        self._recovered = {e["id"] for e in pending}
+        for event in pending:
+            self._work.put(event)
+        self._server = Server(self.address, Handler)
+        self.address = self._server.server_address
+        for target in (self._write_loop, self._work_loop, self._server.serve_forever):
+            thread = threading.Thread(target=target, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def stop(self):
+        """Stop accepting requests, then finish writing and processing."""
+        self._server.shutdown()
+        self._server.server_close()
+        self._incoming.put(None)
+        for thread in self._threads:
+            thread.join()
+
+
+def benchmark(events: int = 5000, clients: int = 32, duplicates: float = 0.2):
+    """Fire a burst of signed events, some redelivered, at a temporary
+    service and check each unique event was processed exactly once."""
+    import http.client
+    import statistics
+    import tempfile
+    from concurrent.futures import ThreadPoolExecutor
+
+    from task_history import TaskHistory
+
+    secret = "whsec_benchmark"
+    with tempfile.TemporaryDirectory() as tmp:
+        history = TaskHistory(Path(tmp) / "agency_data.json")
+        service = WebhookService(
+            secret, history, Path(tmp) / "webhooks", port=0
+        ).start()
+        host, port = service.address
+        unique = [
+            {
+                "id": f"evt_{i:06d}",
+                "type": "checkout.session.completed",
+                "data": {
+                    "object": {
+                        "amount_total": 500000,
+                        "metadata": {"project": f"Project {i % 50}"},
+                    }
+                },
+            }
+            for i in range(events)
+        ]
+        deliveries = unique + unique[: int(events * duplicates)]
+        local = threading.local()
+
+        def deliver(event):
+            if not hasattr(local, "conn"):
+                local.conn = http.client.HTTPConnection(host, port)
+            payload = json.dumps(event).encode()
+            start = time.perf_counter()
+            local.conn.request(
+                "POST",
+                "/webhook",
+                payload,
+                {"Stripe-Signature": sign_payload(payload, secret)},
+            )
+            response = local.conn.getresponse()
+            response.read()
+            return time.perf_counter() - start, response.status
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=clients) as pool:
+            results = list(pool.map(deliver, deliveries))
+        elapsed = time.perf_counter() - start
+        service.wait_idle()
+        service.stop()
+
+        latencies = sorted(r[0] for r in results)
+        payments = sum(len(p["payment_events"]) for p in history.get_projects() if p)
+        return {
+            "deliveries": len(deliveries),
+            "unique_events": events,
+            "events_per_s": round(len(deliveries) / elapsed),
+            "ack_p50_ms": round(statistics.median(latencies) * 1000, 2),
+            "ack_p99_ms": round(latencies[int(len(latencies) * 0.99)] * 1000, 2),
+            "non_200": sum(1 for r in results if r[1] != 200),
+            "tasks_added": len(history.get_tasks(0)),
+            "payments_applied": payments,
+            "processed_once": service.stats["processed"] == events == payments,
+        }
+
+
+def main():
+    import sys
+
+    if len(sys.argv) > 1 and sys.argv[1] == "serve":
+        from payment import get_payment_config
+
+        secret = os.environ.get("STRIPE_WEBHOOK_SECRET") or get_payment_config().get(
+            "webhook_secret"
+        )
+        if not secret:
+            print("Set STRIPE_WEBHOOK_SECRET or webhook_secret in stripe_config.json")
+            sys.exit(1)
+        port = int(sys.argv[2]) if len(sys.argv) > 2 else WEBHOOK_PORT
+        service = WebhookService(secret, port=port).start()
+        print(
+            f"Listening for Stripe webhooks on http://{service.address[0]}:{port}/webhook"
+        )
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            service.stop()
+            print(json.dumps(service.stats))
+    elif len(sys.argv) > 1 and sys.argv[1] == "bench":
+        events = int(sys.argv[2]) if len(sys.argv) > 2 else 5000
+        clients = int(sys.argv[3]) if len(sys.argv) > 3 else 32
+        print(json.dumps(benchmark(events, clients), indent=2))
+    else:
+        print("Usage:")
+        print("  python stripe_webhooks.py serve [port]            - Receive webhooks")
+        print("  python stripe_webhooks.py bench [events] [clients] - Burst test")
+
+
+if __name__ == "__main__":
+    main()
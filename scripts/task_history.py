@@ -4,70 +4,730 @@ EvansMathibe Agency - Task History & Data Cache System
 Tracks all tasks and allows recalling information
 """
 
+import fcntl
+import heapq
 import json
 import os
+import re
+import shutil
+import sqlite3
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import Counter
+from collections.abc import MutableMapping
+from contextlib import contextmanager
 from datetime import datetime
 from pathlib import Path
 
 DATA_FILE = Path("/home/ev/EvansMathibe_Agency/data/agency_data.json")
+DB_FILE = DATA_FILE.with_suffix(".db")
 
+# The journal is folded into the snapshot once it holds this many records.
+# Folding appends them to the snapshot in place, so its cost and the journal
+# a cold load replays stay bounded whatever the size of the history.
+COMPACT_RECORDS = 1000
+
+TOKEN_RE = re.compile(r"\w+")
+
+
+def intersect(positions, plist):
+    """Members of the set ``positions`` that appear in the ascending ``plist``."""
+    n = len(plist)
+    if len(positions) * 16 >= n:
+        return positions.intersection(plist)
+    # Probing a much longer list with bisect keeps the cost proportional to
+    # the smaller side.
+    return {
+        pos
+        for pos in positions
+        if (i := bisect_left(plist, pos)) < n and plist[i] == pos
+    }
+
+
+class SearchIndex:
+    """Inverted token index plus trigram index over task and details text.
+
+    Postings are positions in ``task_history`` (which is append-only), so new
+    tasks are indexed with plain appends. Keys are ``t:<token>`` for task
+    words, ``d:<token>`` for details words and ``g:<trigram>`` for trigrams.
+    On disk the key table is JSON and the postings are one packed uint32 blob,
+    so loading does not parse every posting.
+    """
+
+    VERSION = 2
 
-class TaskHistory:
     def __init__(self):
-        self.data = self._load_data()
+        self.postings = {}
+        self._blob = array("I")
+        self.indexed = 0
+        self.last_id = None
+
+    def get(self, key):
+        plist = self.postings.get(key, ())
+        if isinstance(plist, tuple) and plist:
+            offset, count = plist
+            return self._blob[offset : offset + count]
+        return plist
+
+    def _post(self, key, pos):
+        plist = self.postings.get(key)
+        if plist is None:
+            self.postings[key] = [pos]
+        elif isinstance(plist, list):
+            plist.append(pos)
+        else:
+            offset, count = plist
+            self.postings[key] = self._blob[offset : offset + count].tolist() + [pos]
+
+    def add(self, entry):
+        pos = self.indexed
+        task_text = entry.get("task", "").lower()
+        details_text = entry.get("details", "").lower()
+        for token in set(TOKEN_RE.findall(task_text)):
+            self._post("t:" + token, pos)
+        for token in set(TOKEN_RE.findall(details_text)):
+            self._post("d:" + token, pos)
+        text = f"{task_text}\n{details_text}"
+        for gram in {text[i : i + 3] for i in range(len(text) - 2)}:
+            self._post("g:" + gram, pos)
+        self.indexed += 1
+        self.last_id = entry.get("id")
+
+    def candidates(self, query: str):
+        """Positions that may contain ``query`` (at least 3 chars) as a substring."""
+        grams = {query[i : i + 3] for i in range(len(query) - 2)}
+        postings = sorted((self.get("g:" + g) for g in grams), key=len)
+        if not postings or not postings[0]:
+            return set()
+        result = set(postings[0])
+        for plist in postings[1:]:
+            result = intersect(result, plist)
+            if not result:
+                break
+        return result
+
+    def save(self, path):
+        path = Path(path)
+        blob_file = path.with_suffix(".bin")
+        blob = array("I")
+        table = {}
+        for key, plist in self.postings.items():
+            table[key] = [
+                len(blob),
+                len(plist) if isinstance(plist, list) else plist[1],
+            ]
+            blob.extend(self.get(key))
+        with open(str(blob_file) + ".tmp", "wb") as f:
+            blob.tofile(f)
+        with open(str(path) + ".tmp", "w") as f:
+            json.dump(
+                {
+                    "version": self.VERSION,
+                    "indexed": self.indexed,
+                    "last_id": self.last_id,
+                    "blob_size": len(blob),
+                    "postings": table,
+                },
+                f,
+                separators=(",", ":"),
+            )
+        os.replace(str(blob_file) + ".tmp", blob_file)
+        os.replace(str(path) + ".tmp", path)
+        self._blob = blob
+        self.postings = {key: tuple(v) for key, v in table.items()}
+
+    @classmethod
+    def load(cls, path):
+        path = Path(path)
+        index = cls()
+        try:
+            with open(path) as f:
+                raw = json.load(f)
+            with open(path.with_suffix(".bin"), "rb") as f:
+                index._blob.frombytes(f.read())
+        except (OSError, ValueError):
+            return cls()
+        if raw.get("version") != cls.VERSION or raw["blob_size"] != len(index._blob):
+            return cls()
+        index.postings = {key: tuple(v) for key, v in raw["postings"].items()}
+        index.indexed = raw["indexed"]
+        index.last_id = raw.get("last_id")
+        return index
+
+
+def read_journal(path, offset=0):
+    """Yield ``(record, end_offset)`` for each complete line after ``offset``."""
+    with open(path, "rb") as f:
+        f.seek(offset)
+        for line in f:
+            if not line.endswith(b"\n"):
+                return
+            try:
+                record = json.loads(line)
+            except ValueError:
+                return
+            offset += len(line)
+            yield record, offset
+
+
+class LazySections(MutableMapping):
+    """The agency document, reading each section file on first access.
+
+    Assigning a key only changes the in-memory copy; TaskHistory decides which
+    section files to write.
+    """
+
+    def __init__(self, history):
+        self._history = history
+        self.loaded = {}
+        self.stamps = {}
+
+    def __getitem__(self, name):
+        if name not in self.loaded:
+            if name != "task_history":
+                self.stamps[name] = self._history._section_stamp(name)
+            self.loaded[name] = self._history._load_section(name)
+        return self.loaded[name]
 
-    def _load_data(self):
-        if DATA_FILE.exists():
-            with open(DATA_FILE) as f:
+    def __setitem__(self, name, value):
+        self.loaded[name] = value
+
+    def __delitem__(self, name):
+        del self.loaded[name]
+        self.stamps.pop(name, None)
+
+    def __contains__(self, name):
+        if name in self.loaded or self._history._section_file(name).exists():
+            return True
+        # Until the first compaction, tasks exist only in the journal.
+        return name == "task_history" and self._history.journal_file.exists()
+
+    def __iter__(self):
+        names = set(self.loaded)
+        if self._history.sections_dir.exists():
+            names.update(p.stem for p in self._history.sections_dir.glob("*.json"))
+        if self._history.journal_file.exists():
+            names.add("task_history")
+        return iter(sorted(names))
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+
+class TaskHistory:
+    """Task history and agency data stored as independently loaded sections.
+
+    Every top-level key of ``agency_data.json`` lives in its own file under
+    ``agency_data/`` and is read only when first used, so ``info`` or
+    ``services`` never parse the task history. ``task_history.json`` is a
+    snapshot; each new task is appended as one JSON line to
+    ``task_history.journal`` and replayed on load, so adding a task no longer
+    rewrites the whole history. ``task_history.meta`` records the snapshot's
+    byte length, task count and last id, so a process that only adds tasks
+    reads the metadata and the short journal, never the snapshot, and folds
+    the journal in by appending to the snapshot's JSON array. Writers from
+    any number of processes serialize on ``.lock`` and catch up on each
+    other's records before allocating ids.
+
+    A single-file ``agency_data.json`` (with its journal, if any) is split
+    into sections the first time it is opened and left untouched.
+    """
+
+    def __init__(self, data_file: Path = DATA_FILE, compact_records=COMPACT_RECORDS):
+        self.data_file = Path(data_file)
+        self.compact_records = compact_records
+        self.sections_dir = self.data_file.with_suffix("")
+        self.snapshot_file = self.sections_dir / "task_history.json"
+        self.journal_file = self.sections_dir / "task_history.journal"
+        self.meta_file = self.sections_dir / "task_history.meta"
+        self.index_file = self.sections_dir / "task_history.idx"
+        self.lock_file = self.sections_dir / ".lock"
+        self._snapshot_id = None
+        self._journal_records = 0
+        self._journal_offset = 0
+        self._index = None
+        self._lock_held = False
+        if not self.sections_dir.exists() and self.data_file.exists():
+            self._split_legacy_file()
+        self.data = LazySections(self)
+
+    @contextmanager
+    def _locked(self, mode=fcntl.LOCK_EX):
+        """Hold the cross-process lock that serializes writers.
+
+        Readers take it shared so they never see a snapshot and a journal
+        from different compaction generations.
+        """
+        if self._lock_held or (
+            mode == fcntl.LOCK_SH and not self.sections_dir.exists()
+        ):
+            yield
+            return
+        self.sections_dir.mkdir(parents=True, exist_ok=True)
+        with open(self.lock_file, "a") as f:
+            fcntl.flock(f, mode)
+            self._lock_held = True
+            try:
+                yield
+            finally:
+                self._lock_held = False
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _split_legacy_file(self):
+        with open(self.data_file) as f:
+            document = json.load(f)
+        legacy_journal = self.data_file.with_suffix(".journal")
+        if legacy_journal.exists():
+            for record, _ in read_journal(legacy_journal):
+                self._apply(document, record)
+        staging = Path(f"{self.sections_dir}.{os.getpid()}.tmp")
+        staging.mkdir(parents=True)
+        for name, value in document.items():
+            indent = None if name == "task_history" else 2
+            self._write_json(staging / f"{name}.json", value, indent)
+        try:
+            os.rename(staging, self.sections_dir)
+        except OSError:
+            # Another process finished the split first.
+            shutil.rmtree(staging)
+
+    def _section_file(self, name):
+        return self.sections_dir / f"{name}.json"
+
+    @staticmethod
+    def _write_json(path, value, indent=2):
+        tmp_file = Path(f"{path}.tmp")
+        with open(tmp_file, "w") as f:
+            json.dump(value, f, indent=indent)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_file, path)
+
+    def _load_section(self, name):
+        if name == "task_history":
+            with self._locked(fcntl.LOCK_SH):
+                return self._load_tasks()
+        try:
+            with open(self._section_file(name)) as f:
                 return json.load(f)
-        return {
-            "task_history": [],
-            "agency_info": {},
-            "created_at": datetime.now().isoformat(),
-        }
+        except FileNotFoundError:
+            raise KeyError(name) from None
+
+    def _section_stamp(self, name):
+        try:
+            st = self._section_file(name).stat()
+        except FileNotFoundError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
+
+    def _snapshot_identity(self):
+        try:
+            st = self.snapshot_file.stat()
+        except FileNotFoundError:
+            return None
+        return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+    def _read_meta_file(self):
+        try:
+            with open(self.meta_file) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write_meta(self, tasks, last_id):
+        st = self.snapshot_file.stat()
+        meta = {"ino": st.st_ino, "bytes": st.st_size, "tasks": tasks}
+        meta["last_id"] = last_id
+        self._write_json(self.meta_file, meta, indent=None)
+        return meta
+
+    def _read_snapshot(self):
+        with open(self.snapshot_file, "rb") as f:
+            content = f.read()
+            ino = os.fstat(f.fileno()).st_ino
+        meta = self._read_meta_file()
+        if meta and meta["ino"] == ino and len(content) > meta["bytes"]:
+            # A fold that stopped part-way; its records are still journaled.
+            content = content[: meta["bytes"] - 1] + b"]"
+        return json.loads(content)
+
+    def _meta(self):
+        """The snapshot's metadata, rebuilt if missing or stale (lock held)."""
+        try:
+            st = self.snapshot_file.stat()
+        except FileNotFoundError:
+            return {"ino": None, "bytes": 0, "tasks": 0, "last_id": 0}
+        meta = self._read_meta_file()
+        if meta and meta["ino"] == st.st_ino and st.st_size >= meta["bytes"]:
+            if st.st_size > meta["bytes"]:
+                # Undo the part of an interrupted fold that reached the file.
+                with open(self.snapshot_file, "r+b") as f:
+                    f.truncate(meta["bytes"] - 1)
+                    f.seek(meta["bytes"] - 1)
+                    f.write(b"]")
+                    f.flush()
+                    os.fsync(f.fileno())
+            return meta
+        # Written before the metadata existed: parse the snapshot once.
+        with open(self.snapshot_file, "rb") as f:
+            content = f.read()
+        tasks = json.loads(content)
+        if not content.endswith(b"]"):
+            self._write_json(self.snapshot_file, tasks, indent=None)
+        return self._write_meta(len(tasks), tasks[-1]["id"] if tasks else 0)
+
+    def _load_tasks(self):
+        self._snapshot_id = self._snapshot_identity()
+        tasks = []
+        if self._snapshot_id is not None:
+            tasks = self._read_snapshot()
+        self._journal_records = 0
+        self._journal_offset = 0
+        self._replay_journal(tasks)
+        return tasks
+
+    def _replay_journal(self, tasks):
+        """Apply journal records past ``_journal_offset`` to ``tasks``."""
+        if not self.journal_file.exists():
+            return
+        state = {"task_history": tasks}
+        for record, offset in read_journal(self.journal_file, self._journal_offset):
+            self._apply(state, record)
+            self._journal_records += 1
+            self._journal_offset = offset
+        if "updated_at" in state:
+            self.data.loaded["updated_at"] = state["updated_at"]
+        if self._journal_offset != self.journal_file.stat().st_size:
+            # Drop a torn final record so later appends start on a clean line.
+            with open(self.journal_file, "r+b") as f:
+                f.truncate(self._journal_offset)
+
+    def _refresh(self):
+        """Catch up with writes made by other processes (lock must be held)."""
+        if self._snapshot_identity() != self._snapshot_id:
+            self.data.loaded["task_history"] = self._load_tasks()
+            self._index = None
+        else:
+            self._replay_journal(self.data["task_history"])
+            self._sync_index()
+
+    def refresh(self):
+        """Pick up changes other processes made since this object read them.
+
+        Long-lived holders such as the daemon call this before serving reads.
+        Loaded tasks catch up from the snapshot and journal; other sections
+        are dropped, to be read again, when their file changed.
+        """
+        with self._locked(fcntl.LOCK_SH):
+            if "task_history" in self.data.loaded:
+                self._refresh()
+            for name, stamp in list(self.data.stamps.items()):
+                if self._section_stamp(name) != stamp:
+                    self.data.loaded.pop(name, None)
+                    del self.data.stamps[name]
+
+    def _sync_index(self):
+        if self._index is not None:
+            for entry in self.data["task_history"][self._index.indexed :]:
+                self._index.add(entry)
+
+    @staticmethod
+    def _apply(data, record):
+        op = record.get("op")
+        if op == "task":
+            tasks = data.setdefault("task_history", [])
+            entry = record["entry"]
+            # Records already folded into the snapshot are skipped, which makes
+            # replay safe after a crash between snapshot write and journal reset.
+            if tasks and tasks[-1].get("id", 0) >= entry["id"]:
+                return
+            tasks.append(entry)
+        elif op == "agency_info":
+            # Only written by the single-file layout; see _split_legacy_file.
+            data.setdefault("agency_info", {}).update(record["fields"])
+        data["updated_at"] = record.get("at", data.get("updated_at"))
+
+    def _append(self, records):
+        """Durably append ``records`` with a single write and fsync (lock held)."""
+        payload = "".join(
+            json.dumps(record, separators=(",", ":")) + "\n" for record in records
+        ).encode()
+        with open(self.journal_file, "ab") as f:
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+        self._journal_offset += len(payload)
+        if "task_history" in self.data.loaded:
+            for record in records:
+                self._apply(self.data, record)
+            self._sync_index()
+        elif records:
+            self.data.loaded["updated_at"] = records[-1]["at"]
+        self._journal_records += len(records)
+        if self._journal_records >= self.compact_records:
+            self._fold_journal()
+
+    def _save_sections(self, **sections):
+        """Write only the named sections (lock must be held)."""
+        for name, value in sections.items():
+            self._write_json(self._section_file(name), value)
+            self.data.loaded[name] = value
+            self.data.stamps[name] = self._section_stamp(name)
+
+    def _compact(self):
+        """Rewrite the snapshot from the loaded tasks (lock held)."""
+        tasks = self.data["task_history"]
+        self._write_json(self.snapshot_file, tasks, indent=None)
+        self._write_meta(len(tasks), tasks[-1]["id"] if tasks else 0)
+        self._reset_journal()
+
+    def _fold_journal(self):
+        """Append the journal's tasks to the snapshot (lock held).
+
+        Only the journal is read: its entries are written over the snapshot's
+        closing bracket, then the metadata is updated, then the journal is
+        removed. A crash before the metadata update is undone by ``_meta``.
+        """
+        meta = self._meta()
+        entries = []
+        if self.journal_file.exists():
+            entries = [
+                record["entry"]
+                for record, _ in read_journal(self.journal_file)
+                if record.get("op") == "task"
+                and record["entry"]["id"] > meta["last_id"]
+            ]
+        if entries:
+            if meta["ino"] is None:
+                self._write_json(self.snapshot_file, entries, indent=None)
+            else:
+                tail = ", ".join(json.dumps(entry) for entry in entries) + "]"
+                with open(self.snapshot_file, "r+b") as f:
+                    f.seek(meta["bytes"] - 1)
+                    f.write(((", " if meta["tasks"] else "") + tail).encode())
+                    f.flush()
+                    os.fsync(f.fileno())
+            self._write_meta(meta["tasks"] + len(entries), entries[-1]["id"])
+        self._reset_journal()
+
+    def _reset_journal(self):
+        if self.journal_file.exists():
+            self.journal_file.unlink()
+        if "updated_at" in self.data.loaded:
+            self._save_sections(updated_at=self.data.loaded["updated_at"])
+        if "task_history" in self.data.loaded:
+            self._snapshot_id = self._snapshot_identity()
+        self._journal_records = 0
+        self._journal_offset = 0
+        if self._index is not None:
+            self._index.save(self.index_file)
+
+    def compact(self):
+        """Fold the journal into the snapshot and start a fresh journal."""
+        with self._locked():
+            if "task_history" in self.data.loaded:
+                self._refresh()
+            self._fold_journal()
+
+    def _get_index(self):
+        """Load the persisted search index and index any tasks it is missing."""
+        if self._index is not None:
+            return self._index
+        tasks = self.data["task_history"]
+        index = SearchIndex.load(self.index_file)
+        if index.indexed > len(tasks) or (
+            index.indexed and tasks[index.indexed - 1].get("id") != index.last_id
+        ):
+            index = SearchIndex()
+        behind = len(tasks) - index.indexed
+        for entry in tasks[index.indexed :]:
+            index.add(entry)
+        self._index = index
+        if behind >= COMPACT_RECORDS:
+            index.save(self.index_file)
+        return index
+
+    def export_data(self, path):
+        """Write the full history in the original agency_data.json layout."""
+        with open(path, "w") as f:
+            json.dump(dict(self.data), f, indent=2)
+
+    def import_data(self, path):
+        """Replace the current state with a document in the original layout."""
+        with open(path) as f:
+            self.import_document(json.load(f))
 
-    def _save_data(self):
-        with open(DATA_FILE, "w") as f:
-            json.dump(self.data, f, indent=2)
+    def import_document(self, document):
+        document = {"task_history": [], **document}
+        with self._locked():
+            for stale in self.sections_dir.glob("*.json"):
+                if stale.stem not in document:
+                    stale.unlink()
+            self.data.loaded.clear()
+            self.data.stamps.clear()
+            self._save_sections(
+                **{k: v for k, v in document.items() if k != "task_history"}
+            )
+            self.data.loaded["task_history"] = document["task_history"]
+            self._index = None
+            for stale in (self.index_file, self.index_file.with_suffix(".bin")):
+                if stale.exists():
+                    stale.unlink()
+            self._compact()
 
     def add_task(self, task: str, details: str = ""):
-        task_entry = {
-            "id": len(self.data.get("task_history", [])) + 1,
-            "date": datetime.now().strftime("%Y-%m-%d"),
-            "time": datetime.now().strftime("%H:%M:%S"),
-            "task": task,
-            "details": details,
-        }
-        if "task_history" not in self.data:
-            self.data["task_history"] = []
-        self.data["task_history"].append(task_entry)
-        self.data["updated_at"] = datetime.now().isoformat()
-        self._save_data()
-        return task_entry
+        return self.add_tasks([(task, details)])[0]
+
+    def add_tasks(self, batch):
+        """Add many tasks with one lock round-trip and one fsync.
+
+        ``batch`` holds task strings or ``(task, details)`` pairs. Ids continue
+        from the highest id on disk, so concurrent writers never share one.
+        Unless the tasks are already loaded, that id comes from the metadata
+        and the journal, so adding costs the same at any history size.
+        """
+        now = datetime.now()
+        date, time = now.strftime("%Y-%m-%d"), now.strftime("%H:%M:%S")
+        with self._locked():
+            if "task_history" in self.data.loaded:
+                self._refresh()
+                tasks = self.data["task_history"]
+                last_id = tasks[-1]["id"] if tasks else 0
+            else:
+                last_id = self._last_id()
+            next_id = last_id + 1
+            records = []
+            for n, item in enumerate(batch):
+                task, details = (item, "") if isinstance(item, str) else item
+                entry = {
+                    "id": next_id + n,
+                    "date": date,
+                    "time": time,
+                    "task": task,
+                    "details": details,
+                }
+                records.append({"op": "task", "entry": entry, "at": now.isoformat()})
+            if records:
+                self._append(records)
+        return [record["entry"] for record in records]
+
+    def _last_id(self):
+        """Highest task id on disk without loading the snapshot (lock held)."""
+        last_id = self._meta()["last_id"]
+        journaled = []
+        self._journal_records = 0
+        self._journal_offset = 0
+        self._replay_journal(journaled)
+        return max(last_id, journaled[-1]["id"] if journaled else 0)
 
     def get_tasks(self, limit: int = 10):
         tasks = self.data.get("task_history", [])
         return tasks[-limit:] if limit else tasks
 
-    def search_tasks(self, query: str):
+    def get_tasks_between(self, start_date: str, end_date: str):
+        """Tasks dated from ``start_date`` to ``end_date`` inclusive (YYYY-MM-DD)."""
+        tasks = self.data.get("task_history", [])
+        lo = bisect_left(tasks, start_date, key=lambda t: t["date"])
+        hi = bisect_right(tasks, end_date, key=lambda t: t["date"])
+        return tasks[lo:hi]
+
+    def get_tasks_page(self, after_id: int = 0, limit: int = 20):
+        """Up to ``limit`` tasks with an id greater than ``after_id``, oldest first.
+
+        Pass the id of the last task of one page as ``after_id`` to get the next.
+        """
+        tasks = self.data.get("task_history", [])
+        lo = bisect_right(tasks, after_id, key=lambda t: t["id"])
+        return tasks[lo : lo + limit]
+
+    def count_tasks_by_day(self, start_date: str = None, end_date: str = None):
+        tasks = self.data.get("task_history", [])
+        if start_date or end_date:
+            tasks = self.get_tasks_between(start_date or "", end_date or "9999-12-31")
+        return dict(Counter(t["date"] for t in tasks))
+
+    def search_tasks(self, query: str, limit: int = None):
+        """Tasks whose task or details text contains ``query``, best first.
+
+        Matches in the task title outrank matches in the details, whole-word
+        matches outrank partial ones, and ties go to the most recent task.
+        Queries shorter than three characters cannot use the trigram index
+        and fall back to a scan. With a ``limit``, candidates are scored
+        newest first and the search stops once the ``limit`` best results
+        all have the highest score any task can get.
+        """
         query = query.lower()
         tasks = self.data.get("task_history", [])
-        return [
-            t
-            for t in tasks
-            if query in t.get("task", "").lower()
-            or query in t.get("details", "").lower()
-        ]
+        if len(query) < 3:
+            index = None
+            positions = range(len(tasks))
+        else:
+            index = self._get_index()
+            positions = index.candidates(query)
+        if limit:
+            return self._top_matches(tasks, query, positions, index, limit)
+        scores = self._score(tasks, query, positions, index)
+        ranked = sorted(((points, pos) for pos, points in scores.items()), reverse=True)
+        return [tasks[pos] for _, pos in ranked]
+
+    @staticmethod
+    def _score(tasks, query, positions, index):
+        """Points of each position in ``positions`` whose task matches."""
+        scores = {}
+        for pos in positions:
+            t = tasks[pos]
+            points = (3 if query in t.get("task", "").lower() else 0) + (
+                1 if query in t.get("details", "").lower() else 0
+            )
+            if points:
+                scores[pos] = points
+        if index is not None:
+            for token in set(TOKEN_RE.findall(query)):
+                for prefix, weight in (("t:", 2), ("d:", 1)):
+                    for pos in intersect(set(scores), index.get(prefix + token)):
+                        scores[pos] += weight
+        return scores
+
+    def _top_matches(self, tasks, query, positions, index, limit, chunk=4096):
+        """The ``limit`` best matches, scoring ``chunk`` candidates at a time
+        from the newest and stopping once no older task can outrank them."""
+        best = 4
+        if index is not None:
+            best += 3 * len(set(TOKEN_RE.findall(query)))
+        positions = sorted(positions, reverse=True)
+        top = []
+        for start in range(0, len(positions), chunk):
+            scores = self._score(tasks, query, positions[start : start + chunk], index)
+            for entry in ((points, pos) for pos, points in scores.items()):
+                if len(top) < limit:
+                    heapq.heappush(top, entry)
+                elif entry > top[0]:
+                    heapq.heapreplace(top, entry)
+            if len(top) == limit and top[0][0] == best:
+                break
+        return [tasks[pos] for _, pos in sorted(top, reverse=True)]
 
     def get_agency_info(self):
         return self.data.get("agency_info", {})
 
     def update_agency_info(self, **kwargs):
-        if "agency_info" not in self.data:
-            self.data["agency_info"] = {}
-        self.data["agency_info"].update(kwargs)
-        self.data["updated_at"] = datetime.now().isoformat()
-        self._save_data()
+        with self._locked():
+            self.data.loaded.pop("agency_info", None)
+            info = self.data.get("agency_info", {})
+            info.update(kwargs)
+            self._save_sections(agency_info=info, updated_at=datetime.now().isoformat())
+
+    def update_project_payments(self, payments) -> int:
+        """Apply payment outcomes to the projects section in one write."""
+        with self._locked():
+            self.data.loaded.pop("projects", None)
+            projects = self.data.get("projects") or []
+            applied = apply_project_payments(projects, payments)
+            if applied:
+                self._save_sections(
+                    projects=projects, updated_at=datetime.now().isoformat()
+                )
+        return applied
 
     def get_service_areas(self):
         return self.data.get("service_areas", {})
@@ -82,22 +742,466 @@ class TaskHistory:
         return self.data.get("payment_info", {})
 
 
-def main():
+def apply_project_payments(projects, payments) -> int:
+    """Record payment outcomes on the matching projects, adding any project
+    not seen before. Events already applied to a project are skipped, so
+    replaying a payment is harmless. Returns how many were applied."""
+    by_name = {p.get("name"): p for p in projects if isinstance(p, dict)}
+    applied = 0
+    for payment in payments:
+        project = by_name.get(payment["project"])
+        if project is None:
+            project = by_name[payment["project"]] = {"name": payment["project"]}
+            projects.append(project)
+        events = project.setdefault("payment_events", [])
+        if payment["event_id"] in events:
+            continue
+        events.append(payment["event_id"])
+        project["payment_status"] = payment["status"]
+        if payment.get("amount") is not None and payment["status"] == "paid":
+            project["amount_paid"] = project.get("amount_paid", 0) + payment["amount"]
+        project["payment_updated_at"] = datetime.now().isoformat()
+        applied += 1
+    return applied
+
+
+def score_match(query: str, query_tokens, task):
+    """Rank score used by search_tasks for a task already known to match."""
+    task_text = task.get("task", "").lower()
+    details_text = task.get("details", "").lower()
+    points = (3 if query in task_text else 0) + (1 if query in details_text else 0)
+    points += 2 * len(query_tokens.intersection(TOKEN_RE.findall(task_text)))
+    points += len(query_tokens.intersection(TOKEN_RE.findall(details_text)))
+    return points
+
+
+class SQLiteTaskHistory(TaskHistory):
+    """TaskHistory stored in SQLite, for histories too large to load up front.
+
+    Tasks live in an indexed table and every other top-level key of the
+    original document is kept as a JSON value in ``sections``, so opening the
+    database costs the same no matter how long the history is.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS tasks (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            date TEXT NOT NULL,
+            time TEXT NOT NULL,
+            task TEXT NOT NULL,
+            details TEXT NOT NULL DEFAULT ''
+        );
+        CREATE INDEX IF NOT EXISTS tasks_date_time ON tasks (date, time);
+        CREATE TABLE IF NOT EXISTS sections (
+            name TEXT PRIMARY KEY,
+            value TEXT NOT NULL
+        );
+    """
+
+    def __init__(self, db_file: Path = DB_FILE):
+        self.db_file = Path(db_file)
+        # The daemon opens the history once and serves it from request
+        # threads, one at a time under its per-CLI lock.
+        self.conn = sqlite3.connect(self.db_file, timeout=30, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(self.SCHEMA)
+        self._migrate()
+
+    def _tables(self):
+        return {
+            row["name"]: row["sql"]
+            for row in self.conn.execute(
+                "SELECT name, sql FROM sqlite_master WHERE type = 'table'"
+            )
+        }
+
+    def _migrate(self):
+        """Move a ``tasks`` table created without AUTOINCREMENT (before ids
+        were made safe across processes) onto the current schema, so the ids
+        of deleted tasks are never handed out again.
+
+        The move is one transaction. An earlier version ran it without one,
+        so a crash could leave the rows in ``tasks_old`` next to a new, empty
+        ``tasks``; those rows are restored here, and tasks added since then
+        (whose ids were handed out again) are renumbered after them.
+        """
+        tables = self._tables()
+        if "tasks_old" not in tables and "AUTOINCREMENT" in tables["tasks"].upper():
+            return
+        # sqlite3 does not begin a transaction before DDL on its own.
+        self.conn.execute("BEGIN IMMEDIATE")
+        with self.conn:
+            tables = self._tables()
+            later = []
+            if "tasks_old" in tables:
+                later = self.conn.execute(
+                    "SELECT date, time, task, details FROM tasks ORDER BY id"
+                ).fetchall()
+                self.conn.execute("DROP TABLE tasks")
+            elif "AUTOINCREMENT" in tables["tasks"].upper():
+                return  # Another process migrated it first.
+            else:
+                self.conn.execute("ALTER TABLE tasks RENAME TO tasks_old")
+            self.conn.execute("DROP INDEX IF EXISTS tasks_date_time")
+            create_table, create_index = self.SCHEMA.split(";")[:2]
+            self.conn.execute(create_table)
+            self.conn.execute(create_index)
+            # Copying with explicit ids also records the highest one in
+            # sqlite_sequence.
+            self.conn.execute("INSERT INTO tasks SELECT * FROM tasks_old")
+            self.conn.executemany(
+                "INSERT INTO tasks (date, time, task, details) VALUES (?, ?, ?, ?)",
+                [tuple(row) for row in later],
+            )
+            self.conn.execute("DROP TABLE tasks_old")
+
+    @staticmethod
+    def _rows(cursor):
+        return [dict(row) for row in cursor]
+
+    def _section(self, name, default):
+        row = self.conn.execute(
+            "SELECT value FROM sections WHERE name = ?", (name,)
+        ).fetchone()
+        return json.loads(row["value"]) if row else default
+
+    def _set_sections(self, sections):
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO sections (name, value) VALUES (?, ?)",
+            [(name, json.dumps(value)) for name, value in sections.items()],
+        )
+
+    @property
+    def data(self):
+        """The whole database in the original agency_data.json layout."""
+        document = {
+            row["name"]: json.loads(row["value"])
+            for row in self.conn.execute("SELECT name, value FROM sections")
+        }
+        document["task_history"] = self.get_tasks(0)
+        return document
+
+    def refresh(self):
+        """Nothing is cached; every read queries the database."""
+
+    def compact(self):
+        self.conn.execute("VACUUM")
+
+    def import_document(self, document):
+        with self.conn:
+            self.conn.execute("DELETE FROM tasks")
+            self.conn.execute("DELETE FROM sections")
+            self.conn.executemany(
+                "INSERT INTO tasks (id, date, time, task, details) "
+                "VALUES (:id, :date, :time, :task, :details)",
+                ({"details": "", **t} for t in document.get("task_history", [])),
+            )
+            self._set_sections(
+                {k: v for k, v in document.items() if k != "task_history"}
+            )
+
+    def add_tasks(self, batch):
+        now = datetime.now()
+        date, time = now.strftime("%Y-%m-%d"), now.strftime("%H:%M:%S")
+        entries = []
+        # One transaction per batch: SQLite allocates AUTOINCREMENT ids under
+        # its write lock and syncs once at commit.
+        with self.conn:
+            for item in batch:
+                task, details = (item, "") if isinstance(item, str) else item
+                cursor = self.conn.execute(
+                    "INSERT INTO tasks (date, time, task, details) VALUES (?, ?, ?, ?)",
+                    (date, time, task, details),
+                )
+                entries.append(
+                    {
+                        "id": cursor.lastrowid,
+                        "date": date,
+                        "time": time,
+                        "task": task,
+                        "details": details,
+                    }
+                )
+            self._set_sections({"updated_at": now.isoformat()})
+        return entries
+
+    def get_tasks(self, limit: int = 10):
+        if not limit:
+            return self._rows(self.conn.execute("SELECT * FROM tasks ORDER BY id"))
+        rows = self._rows(
+            self.conn.execute("SELECT * FROM tasks ORDER BY id DESC LIMIT ?", (limit,))
+        )
+        return rows[::-1]
+
+    def get_tasks_between(self, start_date: str, end_date: str):
+        return self._rows(
+            self.conn.execute(
+                "SELECT * FROM tasks WHERE date BETWEEN ? AND ? ORDER BY date, time, id",
+                (start_date, end_date),
+            )
+        )
+
+    def get_tasks_page(self, after_id: int = 0, limit: int = 20):
+        return self._rows(
+            self.conn.execute(
+                "SELECT * FROM tasks WHERE id > ? ORDER BY id LIMIT ?",
+                (after_id, limit),
+            )
+        )
+
+    def count_tasks_by_day(self, start_date: str = None, end_date: str = None):
+        rows = self.conn.execute(
+            "SELECT date, COUNT(*) FROM tasks WHERE date BETWEEN ? AND ? "
+            "GROUP BY date ORDER BY date",
+            (start_date or "", end_date or "9999-12-31"),
+        )
+        return {date: count for date, count in rows}
+
+    def search_tasks(self, query: str, limit: int = None):
+        query = query.lower()
+        query_tokens = set(TOKEN_RE.findall(query))
+        matches = self._rows(
+            self.conn.execute(
+                "SELECT * FROM tasks WHERE instr(lower(task), ?) OR instr(lower(details), ?)",
+                (query, query),
+            )
+        )
+        ranked = ((score_match(query, query_tokens, t), t["id"], t) for t in matches)
+        if limit:
+            ranked = heapq.nlargest(limit, ranked, key=lambda r: r[:2])
+        else:
+            ranked = sorted(ranked, key=lambda r: r[:2], reverse=True)
+        return [t for _, _, t in ranked]
+
+    def get_agency_info(self):
+        return self._section("agency_info", {})
+
+    def update_agency_info(self, **kwargs):
+        info = self.get_agency_info()
+        info.update(kwargs)
+        with self.conn:
+            self._set_sections(
+                {"agency_info": info, "updated_at": datetime.now().isoformat()}
+            )
+
+    def update_project_payments(self, payments) -> int:
+        with self.conn:
+            projects = self._section("projects", []) or []
+            applied = apply_project_payments(projects, payments)
+            if applied:
+                self._set_sections(
+                    {"projects": projects, "updated_at": datetime.now().isoformat()}
+                )
+        return applied
+
+    def get_service_areas(self):
+        return self._section("service_areas", {})
+
+    def get_projects(self):
+        return self._section("projects", [])
+
+    def get_services(self):
+        return self._section("services", [])
+
+    def get_payment_info(self):
+        return self._section("payment_info", {})
+
+
+def open_history(data_file: Path = DATA_FILE):
+    """Open the SQLite history if it has been migrated, else the JSON one."""
+    db_file = Path(data_file).with_suffix(".db")
+    if db_file.exists():
+        return SQLiteTaskHistory(db_file)
+    return TaskHistory(data_file)
+
+
+def _stress_worker(args):
+    data_file, backend, count, batch_size, compact_records = args
+    if backend == "sqlite":
+        tracker = SQLiteTaskHistory(Path(data_file).with_suffix(".db"))
+    else:
+        tracker = TaskHistory(data_file, compact_records)
+    ids = []
+    pid = os.getpid()
+    n = 0
+    while n < count:
+        size = min(batch_size, count - n)
+        if size == 1:
+            ids.append(tracker.add_task(f"Stress task {pid}-{n}")["id"])
+        else:
+            batch = [f"Stress task {pid}-{n + i}" for i in range(size)]
+            ids.extend(t["id"] for t in tracker.add_tasks(batch))
+        n += size
+        batch_size = 1 if batch_size > 1 else 7
+    return ids
+
+
+def stress_test(processes=8, tasks_per_process=200, backend="json", compact_records=50):
+    """Have ``processes`` writers add ``tasks_per_process`` tasks each at once.
+
+    JSON writers fold their journal every ``compact_records`` records, so
+    they also race against folds.
+    """
+    import multiprocessing
+    import tempfile
+
+    with tempfile.TemporaryDirectory() as tmp:
+        data_file = Path(tmp) / "agency_data.json"
+        if backend == "sqlite":
+            SQLiteTaskHistory(data_file.with_suffix(".db"))
+        jobs = [
+            (str(data_file), backend, tasks_per_process, 1, compact_records)
+        ] * processes
+        with multiprocessing.Pool(processes) as pool:
+            returned = [i for ids in pool.map(_stress_worker, jobs) for i in ids]
+        tracker = open_history(data_file)
+        stored = [t["id"] for t in tracker.get_tasks(0)]
+
+    expected = processes * tasks_per_process
+    return {
+        "backend": backend,
+        "expected": expected,
+        "returned_unique": len(set(returned)),
+        "stored": len(stored),
+        "stored_unique": len(set(stored)),
+        "ok": len(set(returned)) == len(stored) == len(set(stored)) == expected
+        and set(returned) == set(stored),
+    }
+
+
+def benchmark_add_task(sizes=(1_000, 10_000, 100_000, 1_000_000), samples=1000):
+    """Time add_task against histories of increasing size.
+
+    Each sample opens the history afresh, as the ``add`` command does, after
+    one add that splits the fixture and writes the snapshot metadata.
+    """
+    import statistics
+    import tempfile
+    import time
+
+    results = []
+    for size in sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            data_file = Path(tmp) / "agency_data.json"
+            history = [
+                {
+                    "id": i + 1,
+                    "date": "2026-01-01",
+                    "time": "00:00:00",
+                    "task": f"Task {i + 1}",
+                    "details": "benchmark fixture",
+                }
+                for i in range(size)
+            ]
+            with open(data_file, "w") as f:
+                json.dump({"task_history": history, "agency_info": {}}, f)
+            del history
+
+            TaskHistory(data_file).add_task("Warm-up task")
+            timings = []
+            for i in range(samples):
+                start = time.perf_counter()
+                TaskHistory(data_file).add_task(f"Benchmark task {i}", "latency sample")
+                timings.append(time.perf_counter() - start)
+
+        timings.sort()
+        results.append(
+            {
+                "tasks": size,
+                "median_us": round(statistics.median(timings) * 1e6, 1),
+                "p99_us": round(timings[int(len(timings) * 0.99) - 1] * 1e6, 1),
+                "mean_us": round(statistics.mean(timings) * 1e6, 1),
+            }
+        )
+    return results
+
+
+def benchmark_search(size=100_000, queries=("design", "landing page", "brief 42")):
+    """Compare indexed search_tasks against the original linear scan."""
+    import random
+    import tempfile
+    import time
+
+    rng = random.Random(42)
+    words = "brand design photo shoot landing page client deploy campaign video edit".split()
+    words += [f"{rng.choice(words)}{n}" for n in range(5000)]
+    history = [
+        {
+            "id": i + 1,
+            "date": "2026-01-01",
+            "time": "00:00:00",
+            "task": " ".join(rng.choices(words, k=4)),
+            "details": f"brief {rng.randint(1, 500)} "
+            + " ".join(rng.choices(words, k=8)),
+        }
+        for i in range(size)
+    ]
+
+    def linear_scan(query):
+        query = query.lower()
+        return [
+            t
+            for t in history
+            if query in t.get("task", "").lower()
+            or query in t.get("details", "").lower()
+        ]
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        data_file = Path(tmp) / "agency_data.json"
+        with open(data_file, "w") as f:
+            json.dump({"task_history": history, "agency_info": {}}, f)
+        tracker = TaskHistory(data_file)
+        start = time.perf_counter()
+        tracker._get_index().save(tracker.index_file)
+        build_s = time.perf_counter() - start
+        tracker = TaskHistory(data_file)
+        start = time.perf_counter()
+        tracker._get_index()
+        load_s = time.perf_counter() - start
+
+        for query in queries:
+            start = time.perf_counter()
+            expected = linear_scan(query)
+            scan_s = time.perf_counter() - start
+            start = time.perf_counter()
+            found = tracker.search_tasks(query)
+            index_s = time.perf_counter() - start
+            start = time.perf_counter()
+            top = tracker.search_tasks(query, limit=10)
+            top_s = time.perf_counter() - start
+            assert {t["id"] for t in found} == {t["id"] for t in expected}
+            assert top == found[:10]
+            results.append(
+                {
+                    "query": query,
+                    "matches": len(found),
+                    "scan_ms": round(scan_s * 1000, 2),
+                    "index_ms": round(index_s * 1000, 2),
+                    "top10_ms": round(top_s * 1000, 2),
+                }
+            )
+    return build_s, load_s, results
+
+
+def main(argv=None, tracker=None):
     import sys
 
-    tracker = TaskHistory()
+    argv = sys.argv if argv is None else argv
+    tracker = tracker or open_history()
 
-    if len(sys.argv) > 1:
-        command = sys.argv[1]
+    if len(argv) > 1:
+        command = argv[1]
 
         if command == "add":
-            task = sys.argv[2] if len(sys.argv) > 2 else "New task"
-            details = sys.argv[3] if len(sys.argv) > 3 else ""
+            task = argv[2] if len(argv) > 2 else "New task"
+            details = argv[3] if len(argv) > 3 else ""
             result = tracker.add_task(task, details)
             print(f"Task added: {result}")
 
         elif command == "list":
-            limit = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+            limit = int(argv[2]) if len(argv) > 2 else 10
             tasks = tracker.get_tasks(limit)
             print("\n=== Task History ===")
             for t in reversed(tasks):
@@ -107,8 +1211,9 @@ def main():
                 print()
 
         elif command == "search":
-            query = sys.argv[2] if len(sys.argv) > 2 else ""
-            results = tracker.search_tasks(query)
+            query = argv[2] if len(argv) > 2 else ""
+            limit = int(argv[3]) if len(argv) > 3 else None
+            results = tracker.search_tasks(query, limit)
             print(f"Found {len(results)} tasks:")
             for t in results:
                 print(f"[{t['date']}] {t['task']}")
@@ -125,14 +1230,103 @@ def main():
             services = tracker.get_services()
             print(json.dumps(services, indent=2))
 
+        elif command == "range" and len(argv) > 3:
+            tasks = tracker.get_tasks_between(argv[2], argv[3])
+            print(f"Found {len(tasks)} tasks:")
+            for t in tasks:
+                print(f"[{t['date']} {t['time']}] {t['task']}")
+
+        elif command == "page":
+            after_id = int(argv[2]) if len(argv) > 2 else 0
+            limit = int(argv[3]) if len(argv) > 3 else 20
+            tasks = tracker.get_tasks_page(after_id, limit)
+            for t in tasks:
+                print(f"#{t['id']} [{t['date']}] {t['task']}")
+            if len(tasks) == limit:
+                print(
+                    f"\nNext page: python task_history.py page {tasks[-1]['id']} {limit}"
+                )
+
+        elif command == "daily":
+            counts = tracker.count_tasks_by_day(*argv[2:4])
+            for date, count in counts.items():
+                print(f"{date}  {count}")
+
+        elif command == "migrate-sqlite":
+            if isinstance(tracker, SQLiteTaskHistory):
+                print(f"Already using {tracker.db_file}")
+            else:
+                db = SQLiteTaskHistory(tracker.data_file.with_suffix(".db"))
+                db.import_document(tracker.data)
+                print(f"Migrated {len(tracker.get_tasks(0))} tasks to {db.db_file}")
+
+        elif command == "compact":
+            tracker.compact()
+            print(f"Compacted {len(tracker.get_tasks(0))} tasks")
+
+        elif command == "export" and len(argv) > 2:
+            tracker.export_data(argv[2])
+            print(f"Exported to {argv[2]}")
+
+        elif command == "import" and len(argv) > 2:
+            tracker.import_data(argv[2])
+            print(f"Imported {len(tracker.get_tasks(0))} tasks from {argv[2]}")
+
+        elif command == "bench":
+            sizes = [int(n) for n in argv[2:]] or [
+                1_000,
+                10_000,
+                100_000,
+                1_000_000,
+            ]
+            print("tasks       median_us   p99_us   mean_us")
+            for r in benchmark_add_task(sizes):
+                print(
+                    f"{r['tasks']:<11} {r['median_us']:<11} {r['p99_us']:<8} {r['mean_us']}"
+                )
+
+        elif command == "stress":
+            processes = int(argv[2]) if len(argv) > 2 else 8
+            per_process = int(argv[3]) if len(argv) > 3 else 200
+            backend = argv[4] if len(argv) > 4 else "json"
+            result = stress_test(processes, per_process, backend)
+            print(json.dumps(result, indent=2))
+            if not result["ok"]:
+                sys.exit(1)
+
+        elif command == "bench-search":
+            size = int(argv[2]) if len(argv) > 2 else 100_000
+            build_s, load_s, results = benchmark_search(size)
+            print(
+                f"Index over {size} tasks: built in {build_s:.2f}s, loads in {load_s:.3f}s"
+            )
+            print("query            matches   scan_ms   index_ms  top10_ms")
+            for r in results:
+                print(
+                    f"{r['query']:<16} {r['matches']:<9} {r['scan_ms']:<9} "
+                    f"{r['index_ms']:<9} {r['top10_ms']}"
+                )
+
         else:
             print("Commands:")
             print("  python task_history.py add <task> [details]")
             print("  python task_history.py list [limit]")
-            print("  python task_history.py search <query>")
+            print("  python task_history.py search <query> [limit]")
             print("  python task_history.py info")
             print("  python task_history.py projects")
             print("  python task_history.py services")
+            print("  python task_history.py range <start_date> <end_date>")
+            print("  python task_history.py page [after_id] [limit]")
+            print("  python task_history.py daily [start_date] [end_date]")
+            print("  python task_history.py migrate-sqlite")
+            print("  python task_history.py compact")
+            print("  python task_history.py export <path>")
+            print("  python task_history.py import <path>")
+            print("  python task_history.py bench [sizes...]")
+            print("  python task_history.py bench-search [size]")
+            print(
+                "  python task_history.py stress [processes] [tasks_each] [json|sqlite]"
+            )
     else:
         tasks = tracker.get_tasks(5)
         print("=== Recent Tasks ===")
@@ -141,4 +1335,7 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
+    from agency_daemon import forward
+
+    if not forward("task_history"):
+        main()
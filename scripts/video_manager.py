@@ -4,56 +4,309 @@ EvansMathibe Agency - Video Manager Agent
 Handles video processing, optimization, and deployment for the website
 """
 
+import errno
+import hashlib
 import os
 import json
+import shutil
+import signal
 import subprocess
-import requests
+import tempfile
+import threading
+import time
 from pathlib import Path
-from datetime import datetime
+
+from agency_metrics import METRICS, run_command
+from asset_cache import DerivedAssetCache
+from asset_probe import probe_videos_raw
+from asset_scanner import DirectoryScanner
 
 AGENCY_ROOT = Path("/home/ev/EvansMathibe_Agency")
 VIDEOS_DIR = AGENCY_ROOT / "website" / "videos"
-VIDEOS_DIR.mkdir(parents=True, exist_ok=True)
 
 MAX_FILE_SIZE = 100 * 1024 * 1024  # 100MB GitHub Pages limit
+VIDEO_FORMATS = [".mp4", ".webm", ".ogg", ".mov"]
+# Each ingest stages in its own directory inside the videos dir, so renames
+# are atomic and concurrent ingests never touch each other's files.
+INGEST_PREFIX = ".ingest-"
+COPY_CHUNK_SIZE = 1024 * 1024
+# copy_file_range/sendfile errors that mean "not supported for these files".
+ZERO_COPY_UNSUPPORTED = {
+    errno.EXDEV,
+    errno.EINVAL,
+    errno.ENOSYS,
+    errno.EOPNOTSUPP,
+    errno.EBADF,
+}
+
+
+def copy_file(src_fd: int, dst_fd: int, size: int):
+    """Copy ``size`` bytes between open files and return ``(method, sha256)``.
+
+    The copy stays in the kernel with ``copy_file_range`` or ``sendfile``
+    when the files allow it, and then there is no hash. Otherwise it is
+    copied in chunks, hashing each chunk on the way through.
+    """
+    for method in ("copy_file_range", "sendfile"):
+        if not hasattr(os, method):
+            continue
+        copied = 0
+        try:
+            while copied < size:
+                if method == "copy_file_range":
+                    n = os.copy_file_range(
+                        src_fd, dst_fd, size - copied, copied, copied
+                    )
+                else:
+                    n = os.sendfile(dst_fd, src_fd, copied, size - copied)
+                if n == 0:
+                    break
+                copied += n
+        except OSError as e:
+            if copied == 0 and e.errno in ZERO_COPY_UNSUPPORTED:
+                continue
+            raise
+        if copied != size:
+            raise OSError("Source changed size while copying")
+        return method, None
+
+    sha = hashlib.sha256()
+    buffer = bytearray(COPY_CHUNK_SIZE)
+    view = memoryview(buffer)
+    os.lseek(src_fd, 0, os.SEEK_SET)
+    copied = 0
+    while n := os.readv(src_fd, [buffer]):
+        sha.update(view[:n])
+        written = 0
+        while written < n:
+            written += os.write(dst_fd, view[written:n])
+        copied += n
+    if copied != size:
+        raise OSError("Source changed size while copying")
+    return "chunked", sha.hexdigest()
+
+
+def _claim(staged: Path, dst: Path):
+    """Move ``staged`` to ``dst``, raising FileExistsError if ``dst`` exists."""
+    try:
+        os.link(staged, dst)
+    except FileExistsError:
+        raise
+    except OSError:
+        # No hard links here (e.g. exFAT): reserve the name, then replace it.
+        os.close(os.open(dst, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644))
+        os.replace(staged, dst)
+    else:
+        os.unlink(staged)
 
 
 class VideoManager:
-    def __init__(self):
+    def __init__(self, cache: DerivedAssetCache = None, videos_dir: Path = VIDEOS_DIR):
+        self.cache = cache or DerivedAssetCache()
+        self.videos_dir = Path(videos_dir)
+        self.scanner = DirectoryScanner()
         self.videos = self._scan_videos()
 
     def _scan_videos(self):
-        videos = []
-        for ext in [".mp4", ".webm", ".ogg", ".mov"]:
-            for v in VIDEOS_DIR.glob(f"*{ext}"):
-                videos.append(
-                    {
-                        "name": v.name,
-                        "path": str(v),
-                        "size": v.stat().st_size,
-                        "size_mb": round(v.stat().st_size / (1024 * 1024), 2),
-                    }
+        groups = self.scanner.by_extension(self.videos_dir, VIDEO_FORMATS)
+        return [self._entry(v) for ext in VIDEO_FORMATS for v in groups[ext]]
+
+    @staticmethod
+    def _entry(v):
+        return {
+            "name": v["name"],
+            "path": v["path"],
+            "size": v["size"],
+            "size_mb": round(v["size"] / (1024 * 1024), 2),
+        }
+
+    def add_video(self, video_path, quality="medium"):
+        return self.add_videos([video_path], quality)[0]
+
+    def add_videos(self, video_paths, quality="medium", workers=None):
+        """Ingest many videos at once, e.g. everything on a camera card.
+
+        Directories are searched recursively for videos. A clip whose content
+        is already in the library is reported as a duplicate and not copied;
+        sizes are compared first, so only clips with a same-sized match are
+        hashed. Clips over ``MAX_FILE_SIZE`` are compressed into the library
+        through one ``CompressionQueue`` instead of being rejected. Each file
+        gets its own result, in input order.
+        """
+        sources = []
+        cards = DirectoryScanner(cache_file=None)
+        for path in video_paths:
+            if os.path.isdir(path):
+                groups = cards.by_extension(path, VIDEO_FORMATS, recursive=True)
+                found = [v["path"] for ext in VIDEO_FORMATS for v in groups[ext]]
+                sources.extend(sorted(found))
+            else:
+                sources.append(str(path))
+
+        self.videos_dir.mkdir(parents=True, exist_ok=True)
+        staging = Path(tempfile.mkdtemp(prefix=INGEST_PREFIX, dir=self.videos_dir))
+        try:
+            results = self._ingest_all(sources, staging, quality, workers)
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+        self.cache.save()
+        return results
+
+    def _ingest_all(self, sources, staging, quality, workers):
+        by_size = {}
+        for v in self.videos:
+            by_size.setdefault(v["size"], []).append(v["path"])
+        taken = {v["name"] for v in self.videos}
+        results, compress = [], []
+        for src in sources:
+            result = self._ingest(src, len(results), staging, by_size, taken, quality)
+            if result.get("status") == "compress":
+                compress.append(len(results))
+            results.append(result)
+
+        if compress:
+            queue = CompressionQueue(self, workers)
+            queue.submit_all(
+                (results[i]["source"], results[i]["staging"], quality) for i in compress
+            )
+            for i, outcome in zip(compress, queue.wait()):
+                results[i] = self._compressed(results[i], outcome)
+        return results
+
+    def _ingest(self, src, index, staging, by_size, taken, quality):
+        """Copy one clip into the library, or prepare its compression job."""
+        try:
+            src_fd = os.open(src, os.O_RDONLY)
+        except FileNotFoundError:
+            return {"error": "File not found", "source": src}
+        except OSError as e:
+            return {"error": str(e), "source": src}
+        try:
+            st = os.fstat(src_fd)
+            if st.st_size == 0:
+                return {"error": "Empty file", "source": src}
+            name = Path(src).name
+            if st.st_size > MAX_FILE_SIZE:
+                output = staging / f"{index}.mp4"
+                _, _, key = self._compress_command(src, output, quality)
+                known = self.cache.entry(key)
+                duplicate = known and self._find_copy(
+                    known["size"], known["digest"], by_size
                 )
-        return videos
+                if duplicate:
+                    return self._duplicate(src, duplicate)
+                return {
+                    "status": "compress",
+                    "source": src,
+                    "staging": str(output),
+                    "name": f"{Path(name).stem}.mp4",
+                }
 
-    def add_video(self, video_path):
-        src = Path(video_path)
-        if not src.exists():
-            return {"error": "File not found"}
+            digest = None
+            if by_size.get(st.st_size):
+                digest = self.cache.digest(src)
+                duplicate = self._find_copy(st.st_size, digest, by_size)
+                if duplicate:
+                    return self._duplicate(src, duplicate)
 
-        size_mb = src.stat().st_size / (1024 * 1024)
-        if size_mb > 100:
-            return {"error": f"File too large: {size_mb}MB. Max 100MB for GitHub Pages"}
+            tmp = staging / f"{index}{Path(name).suffix}"
+            dst_fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+            try:
+                method, copied_digest = copy_file(src_fd, dst_fd, st.st_size)
+            finally:
+                os.close(dst_fd)
+        except OSError as e:
+            return {"error": str(e), "source": src}
+        finally:
+            os.close(src_fd)
 
-        dst = VIDEOS_DIR / src.name
-        import shutil
+        os.utime(tmp, ns=(st.st_atime_ns, st.st_mtime_ns))
+        dst = self._place(tmp, name, taken)
+        digest = digest or copied_digest
+        if digest:
+            self.cache.remember(dst, digest)
+        by_size.setdefault(st.st_size, []).append(str(dst))
+        return {
+            "status": "success",
+            "video": dst.name,
+            "size_mb": round(st.st_size / (1024 * 1024), 2),
+            "method": method,
+            "source": src,
+        }
 
-        shutil.copy2(src, dst)
+    def _find_copy(self, size, digest, by_size):
+        """Library path holding exactly this content, or None."""
+        for path in by_size.get(size, []):
+            try:
+                if self.cache.digest(path) == digest:
+                    return path
+            except OSError:
+                continue
+        return None
 
-        return {"status": "success", "video": dst.name, "size_mb": round(size_mb, 2)}
+    def _duplicate(self, src, existing):
+        return {"status": "duplicate", "video": Path(existing).name, "source": src}
+
+    def _place(self, staged: Path, name: str, taken) -> Path:
+        """Move a staged file into the library without replacing another clip.
+
+        ``taken`` only knows this process's clips, so the name is claimed on
+        disk too: hard-linking fails if another process created it meanwhile.
+        """
+        stem, ext = Path(name).stem, Path(name).suffix
+        n = 1
+        while True:
+            if name not in taken:
+                dst = self.videos_dir / name
+                try:
+                    _claim(staged, dst)
+                    break
+                except FileExistsError:
+                    pass
+            taken.add(name)
+            n += 1
+            name = f"{stem}-{n}{ext}"
+        taken.add(name)
+        size = dst.stat().st_size
+        self.videos.append(self._entry({"name": name, "path": str(dst), "size": size}))
+        return dst
+
+    def _compressed(self, job, outcome):
+        staged = Path(job["staging"])
+        if outcome.get("status") != "success":
+            staged.unlink(missing_ok=True)
+            return dict(outcome, source=job["source"])
+        size = staged.stat().st_size
+        if size > MAX_FILE_SIZE:
+            staged.unlink()
+            return {
+                "error": f"Still too large after compression: {size / (1024 * 1024):.1f}MB",
+                "source": job["source"],
+            }
+        dst = self._place(staged, job["name"], {v["name"] for v in self.videos})
+        return {
+            "status": "success",
+            "video": dst.name,
+            "size_mb": round(size / (1024 * 1024), 2),
+            "method": "compressed",
+            "cached": outcome.get("cached", False),
+            "source": job["source"],
+        }
 
     def compress_video(self, input_path, output_path=None, quality="medium"):
         """Compress video for web"""
+        cmd, output_path, key = self._compress_command(input_path, output_path, quality)
+        if self.cache.restore(key, output_path):
+            return {"status": "success", "output": str(output_path), "cached": True}
+        try:
+            run_command(cmd, check=True, capture_output=True)
+            self.cache.store(key, output_path)
+            return {"status": "success", "output": str(output_path)}
+        except subprocess.CalledProcessError as e:
+            return {"error": str(e)}
+
+    def _compress_command(self, input_path, output_path=None, quality="medium"):
+        """ffmpeg command, output path and cache key for one compress job."""
         if output_path is None:
             input_path = Path(input_path)
             output_path = input_path.stem + "_compressed.mp4"
@@ -61,6 +314,15 @@ class VideoManager:
         # Quality presets
         crf_values = {"high": 23, "medium": 28, "low": 32}
         crf = crf_values.get(quality, 28)
+        key = self.cache.key(
+            input_path,
+            "compress",
+            output_path,
+            vcodec="libx264",
+            crf=crf,
+            preset="fast",
+            acodec="aac",
+        )
 
         cmd = [
             "ffmpeg",
@@ -78,14 +340,14 @@ class VideoManager:
             "+faststart",
             str(output_path),
         ]
-
-        try:
-            subprocess.run(cmd, check=True, capture_output=True)
-            return {"status": "success", "output": str(output_path)}
-        except subprocess.CalledProcessError as e:
-            return {"error": str(e)}
+        return cmd, output_path, key
 
     def create_thumbnail(self, video_path, output_path, timestamp="00:00:01"):
+        key = self.cache.key(
+            video_path, "thumbnail", output_path, timestamp=timestamp, size="320x180"
+        )
+        if self.cache.restore(key, output_path):
+            return {"status": "success", "thumbnail": str(output_path), "cached": True}
         cmd = [
             "ffmpeg",
             "-i",
@@ -99,7 +361,8 @@ class VideoManager:
             str(output_path),
         ]
         try:
-            subprocess.run(cmd, check=True, capture_output=True)
+            run_command(cmd, check=True, capture_output=True)
+            self.cache.store(key, output_path)
             return {"status": "success", "thumbnail": str(output_path)}
         except subprocess.CalledProcessError as e:
             return {"error": str(e)}
@@ -116,23 +379,229 @@ class VideoManager:
             str(video_path),
         ]
         try:
-            result = subprocess.run(cmd, capture_output=True, text=True)
+            result = run_command(cmd, capture_output=True, text=True)
             return json.loads(result.stdout)
         except:
             return {"error": "Could not get video info"}
 
+    def get_videos_info(self, video_paths, workers=None):
+        """ffprobe output for many videos, probed concurrently."""
+        return {
+            path: probe or {"error": "Could not get video info"}
+            for path, probe in probe_videos_raw(video_paths, workers).items()
+        }
+
     def list_videos(self):
         return self.videos
 
-    def get_html_embed_code(self, video_name, autoplay=True):
+    @staticmethod
+    def get_html_embed_code(video_name, autoplay=True):
         base_url = "videos"
-        code = f'''<video {"autoplay" if autoplay else ""} loop muted playsinline controls style="width:100%;border-radius:10px;">
+        code = f"""<video {"autoplay" if autoplay else ""} loop muted playsinline controls style="width:100%;border-radius:10px;">
     <source src="{base_url}/{video_name}" type="video/mp4">
     Your browser does not support the video tag.
-</video>'''
+</video>"""
         return code
 
 
+class CompressionQueue:
+    """Compresses many videos at once, one ffmpeg process per worker.
+
+    A failed job is reported in its own result and does not stop the others.
+    ``progress`` is called as ``progress(done, total, result)`` whenever a job
+    finishes, and ``cancel()`` drops queued jobs and stops running ones.
+    """
+
+    def __init__(self, manager=None, workers=None, progress=None):
+        from concurrent.futures import ThreadPoolExecutor
+
+        self.manager = manager or VideoManager()
+        self.workers = workers or max(1, (os.cpu_count() or 2) // 2)
+        self.progress = progress
+        self.futures = []
+        self.total = 0
+        self.done = 0
+        self._executor = ThreadPoolExecutor(max_workers=self.workers)
+        self._lock = threading.Lock()
+        self._running = set()
+        self._cancelled = threading.Event()
+
+    def submit_all(self, jobs):
+        """Queue ``(input_path, output_path, quality)`` jobs as one batch."""
+        jobs = list(jobs)
+        # Count the whole batch first so progress totals are right from the start.
+        with self._lock:
+            self.total += len(jobs)
+        return [self._submit(*job) for job in jobs]
+
+    def submit(self, input_path, output_path=None, quality="medium"):
+        with self._lock:
+            self.total += 1
+        return self._submit(input_path, output_path, quality)
+
+    def _submit(self, input_path, output_path, quality):
+        future = self._executor.submit(self._run, input_path, output_path, quality)
+        future.input_path = str(input_path)
+        future.add_done_callback(self._finished)
+        self.futures.append(future)
+        return future
+
+    def _run(self, input_path, output_path, quality):
+        if self._cancelled.is_set():
+            return {"status": "cancelled", "input": str(input_path)}
+        cmd, output_path, key = self.manager._compress_command(
+            input_path, output_path, quality
+        )
+        if self.manager.cache.restore(key, output_path):
+            return {
+                "status": "success",
+                "input": str(input_path),
+                "output": str(output_path),
+                "cached": True,
+            }
+        start = time.perf_counter()
+        try:
+            proc = subprocess.Popen(
+                cmd,
+                stdin=subprocess.DEVNULL,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.PIPE,
+                text=True,
+            )
+        except OSError as e:
+            METRICS.observe("subprocess", cmd[0], time.perf_counter() - start, True)
+            return {"error": str(e), "input": str(input_path)}
+        with self._lock:
+            self._running.add(proc)
+            # cancel() may have run between the check above and Popen; it
+            # sets the flag before taking the lock, so one of the two sees it.
+            if self._cancelled.is_set():
+                proc.send_signal(signal.SIGTERM)
+        try:
+            _, stderr = proc.communicate()
+        finally:
+            with self._lock:
+                self._running.discard(proc)
+            METRICS.observe(
+                "subprocess",
+                cmd[0],
+                time.perf_counter() - start,
+                proc.returncode != 0,
+            )
+        if self._cancelled.is_set() and proc.returncode != 0:
+            return {"status": "cancelled", "input": str(input_path)}
+        if proc.returncode != 0:
+            return {
+                "error": f"ffmpeg exited with status {proc.returncode}",
+                "stderr": stderr.strip().splitlines()[-1:],
+                "input": str(input_path),
+            }
+        self.manager.cache.store(key, output_path)
+        return {
+            "status": "success",
+            "input": str(input_path),
+            "output": str(output_path),
+        }
+
+    def _finished(self, future):
+        with self._lock:
+            self.done += 1
+            done = self.done
+        if self.progress:
+            self.progress(done, self.total, self._result(future))
+
+    @staticmethod
+    def _result(future):
+        if future.cancelled():
+            return {"status": "cancelled", "input": future.input_path}
+        return future.result()
+
+    def cancel(self):
+        self._cancelled.set()
+        for future in self.futures:
+            future.cancel()
+        with self._lock:
+            for proc in self._running:
+                proc.send_signal(signal.SIGTERM)
+
+    def wait(self):
+        """Block until every job has finished and return their results in order."""
+        self._executor.shutdown(wait=True)
+        self.manager.cache.save()
+        return [self._result(f) for f in self.futures]
+
+
+def compress_all(manager=None, quality="medium", workers=None, progress=None):
+    """Compress every video in VIDEOS_DIR that has no ``_compressed`` copy yet."""
+    queue = CompressionQueue(manager, workers, progress)
+    jobs = []
+    for video in queue.manager.list_videos():
+        src = Path(video["path"])
+        output = src.with_name(f"{src.stem}_compressed.mp4")
+        if src.stem.endswith("_compressed") or output.exists():
+            continue
+        jobs.append((src, output, quality))
+    queue.submit_all(jobs)
+    try:
+        return queue.wait()
+    except KeyboardInterrupt:
+        queue.cancel()
+        return queue.wait()
+
+
+def benchmark(clips=40, clip_mb=8, duplicates=10):
+    """Ingest a synthetic camera card into an empty library, against copying
+    and hashing every file, then ingest the same card again."""
+    from asset_cache import file_digest
+
+    with tempfile.TemporaryDirectory() as tmp:
+        card = Path(tmp) / "card" / "DCIM"
+        card.mkdir(parents=True)
+        for i in range(clips):
+            # Recorded clips differ in length, so almost never in size.
+            size = clip_mb * 1024 * 1024 + i * 4099
+            (card / f"C{i:04d}.MP4").write_bytes(os.urandom(size))
+        for i in range(duplicates):
+            shutil.copy2(card / f"C{i:04d}.MP4", card / f"COPY{i:04d}.MP4")
+        total_mb = (clips + duplicates) * clip_mb
+
+        naive_dir = Path(tmp) / "naive"
+        naive_dir.mkdir()
+        start = time.perf_counter()
+        seen = set()
+        for src in sorted(card.iterdir()):
+            digest = file_digest(src)
+            if digest not in seen:
+                seen.add(digest)
+                shutil.copy2(src, naive_dir / src.name)
+        naive = time.perf_counter() - start
+
+        cache = DerivedAssetCache(Path(tmp) / "cache")
+        manager = VideoManager(cache, Path(tmp) / "videos")
+        start = time.perf_counter()
+        results = manager.add_videos([card.parent])
+        ingest = time.perf_counter() - start
+        start = time.perf_counter()
+        again = manager.add_videos([card.parent])
+        repeat = time.perf_counter() - start
+
+    methods = {}
+    for r in results:
+        key = r.get("method") or r.get("status") or "error"
+        methods[key] = methods.get(key, 0) + 1
+    return {
+        "files": clips + duplicates,
+        "megabytes": total_mb,
+        "hash_and_copy_s": round(naive, 3),
+        "ingest_s": round(ingest, 3),
+        "ingest_mb_per_s": round(total_mb / ingest, 1),
+        "speedup": round(naive / ingest, 2),
+        "results": methods,
+        "reingest_s": round(repeat, 3),
+        "reingest_duplicates": sum(r.get("status") == "duplicate" for r in again),
+    }
+
+
 def main():
     import sys
 
@@ -151,13 +620,43 @@ def main():
             result = manager.add_video(sys.argv[2])
             print(json.dumps(result, indent=2))
 
+        elif command == "ingest" and len(sys.argv) > 2:
+            results = manager.add_videos(sys.argv[2:])
+            for r in results:
+                outcome = r.get("status") or f"error: {r['error']}"
+                print(f"  {r['source']}: {outcome} {r.get('video', '')}".rstrip())
+            added = sum(1 for r in results if r.get("status") == "success")
+            print(f"\nIngested {added}/{len(results)} videos")
+
+        elif command == "bench":
+            print(json.dumps(benchmark(), indent=2))
+
         elif command == "compress" and len(sys.argv) > 2:
             quality = sys.argv[3] if len(sys.argv) > 3 else "medium"
             result = manager.compress_video(sys.argv[2], quality=quality)
+            manager.cache.save()
             print(json.dumps(result, indent=2))
 
+        elif command == "compress-all":
+            quality = sys.argv[2] if len(sys.argv) > 2 else "medium"
+            workers = int(sys.argv[3]) if len(sys.argv) > 3 else None
+
+            def report(done, total, result):
+                name = Path(result["input"]).name
+                outcome = result.get("status") or f"error: {result['error']}"
+                if result.get("cached"):
+                    outcome += " (cached)"
+                print(f"[{done}/{total}] {name}: {outcome}")
+
+            results = compress_all(manager, quality, workers, report)
+            ok = sum(1 for r in results if r.get("status") == "success")
+            print(f"\nCompressed {ok}/{len(results)} videos")
+
         elif command == "info" and len(sys.argv) > 2:
-            info = manager.get_video_info(sys.argv[2])
+            if len(sys.argv) > 3:
+                info = manager.get_videos_info(sys.argv[2:])
+            else:
+                info = manager.get_video_info(sys.argv[2])
             print(json.dumps(info, indent=2))
 
         elif command == "code" and len(sys.argv) > 2:
@@ -168,9 +667,12 @@ def main():
             print("Video Manager Commands:")
             print("  python video_manager.py list")
             print("  python video_manager.py add <video_path>")
+            print("  python video_manager.py ingest <path or card dir> [more...]")
             print("  python video_manager.py compress <video_path> [quality]")
-            print("  python video_manager.py info <video_path>")
+            print("  python video_manager.py compress-all [quality] [workers]")
+            print("  python video_manager.py info <video_path> [more paths...]")
             print("  python video_manager.py code <video_name>")
+            print("  python video_manager.py bench")
     else:
         videos = manager.list_videos()
         print(f"Videos: {len(videos)} found")
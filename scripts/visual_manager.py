@@ -11,46 +11,182 @@ from pathlib import Path
 from datetime import datetime
 from typing import List, Dict, Optional
 
+from agency_metrics import run_command
+from asset_cache import DerivedAssetCache, file_digest
+from asset_probe import probe_assets
+from asset_scanner import DirectoryScanner
+
 AGENCY_ROOT = Path("/home/ev/EvansMathibe_Agency")
 ASSETS_DIR = AGENCY_ROOT / "assets"
 IMAGES_DIR = ASSETS_DIR / "images"
 VIDEOS_DIR = ASSETS_DIR / "videos"
 GALLERIES_DIR = ASSETS_DIR / "galleries"
 
-for d in [ASSETS_DIR, IMAGES_DIR, VIDEOS_DIR, GALLERIES_DIR]:
-    d.mkdir(parents=True, exist_ok=True)
-
 SUPPORTED_IMAGE_FORMATS = [".jpg", ".jpeg", ".png", ".gif", ".webp", ".svg", ".bmp"]
 SUPPORTED_VIDEO_FORMATS = [".mp4", ".mov", ".avi", ".mkv", ".webm"]
 
 
 class VisualAssetsManager:
-    def __init__(self):
+    def __init__(self, cache: DerivedAssetCache = None):
+        self.cache = cache or DerivedAssetCache()
+        self.scanner = DirectoryScanner()
         self.assets_index = self._load_index()
 
+    @staticmethod
+    def _index_stamp():
+        try:
+            st = os.stat(ASSETS_DIR / "index.json")
+        except FileNotFoundError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
+
     def _load_index(self) -> Dict:
         index_file = ASSETS_DIR / "index.json"
+        self._stamp = self._index_stamp()
         if index_file.exists():
             with open(index_file) as f:
                 return json.load(f)
         return {"images": [], "videos": [], "galleries": [], "last_updated": None}
 
+    def refresh(self):
+        """Re-read the index if another process rewrote it since it was loaded,
+        so a long-lived manager never saves over their changes."""
+        if self._index_stamp() != self._stamp:
+            self.assets_index = self._load_index()
+
     def _save_index(self):
         self.assets_index["last_updated"] = datetime.now().isoformat()
-        with open(ASSETS_DIR / "index.json", "w") as f:
+        ASSETS_DIR.mkdir(parents=True, exist_ok=True)
+        tmp_file = ASSETS_DIR / "index.json.tmp"
+        with open(tmp_file, "w") as f:
             json.dump(self.assets_index, f, indent=2)
-
-    def scan_directory(self, directory: Path):
+        os.replace(tmp_file, ASSETS_DIR / "index.json")
+        self._stamp = self._index_stamp()
+
+    def refresh_index(self, asset_type: str = "all") -> Dict:
+        """Bring the asset index up to date with IMAGES_DIR and VIDEOS_DIR.
+
+        Only files that are new or whose size or mtime changed are hashed and
+        probed, all in one batch; deleted files are dropped. Returns the number
+        of assets added, changed and removed.
+        """
+        assets = self.assets_index.setdefault("assets", {})
+        changes = {"added": 0, "changed": 0, "removed": 0}
+        to_probe = []
+        sources = [
+            ("image", IMAGES_DIR, SUPPORTED_IMAGE_FORMATS),
+            ("video", VIDEOS_DIR, SUPPORTED_VIDEO_FORMATS),
+        ]
+        for kind, directory, formats in sources:
+            if asset_type not in ["all", kind + "s"]:
+                continue
+            seen = set()
+            for entry in self.scanner.scan(directory):
+                if entry["ext"] not in formats:
+                    continue
+                path = entry["path"]
+                try:
+                    # The scanner's listing can predate an in-place rewrite,
+                    # so each file still gets one stat of its own.
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                seen.add(path)
+                record = assets.get(path)
+                if (
+                    record
+                    and record["size"] == st.st_size
+                    and record["mtime"] == st.st_mtime
+                ):
+                    continue
+                changes["changed" if record else "added"] += 1
+                assets[path] = {
+                    "type": kind,
+                    "name": entry["name"],
+                    "extension": entry["ext"],
+                    "size": st.st_size,
+                    "mtime": st.st_mtime,
+                    "modified": datetime.fromtimestamp(st.st_mtime).isoformat(),
+                    "hash": file_digest(path),
+                }
+                to_probe.append(path)
+            for path in [p for p, r in assets.items() if r["type"] == kind]:
+                if path not in seen:
+                    del assets[path]
+                    changes["removed"] += 1
+
+        for path, info in probe_assets(to_probe).items():
+            assets[path].update(info)
+
+        self.assets_index["images"] = sorted(
+            p for p, r in assets.items() if r["type"] == "image"
+        )
+        self.assets_index["videos"] = sorted(
+            p for p, r in assets.items() if r["type"] == "video"
+        )
+        if any(changes.values()) or not self.assets_index.get("last_updated"):
+            self._save_index()
+        return changes
+
+    def query_assets(
+        self,
+        asset_type: str = None,
+        min_size: int = None,
+        max_size: int = None,
+        modified_after: str = None,
+        modified_before: str = None,
+        min_width: int = None,
+        min_height: int = None,
+        max_width: int = None,
+        max_height: int = None,
+    ) -> List[Dict]:
+        """Filter the indexed assets without touching the filesystem.
+
+        Dates are ISO strings (``2026-03-01`` or a full timestamp). Assets
+        whose dimensions are unknown never match a dimension filter.
+        """
+        after = (
+            datetime.fromisoformat(modified_after).timestamp()
+            if modified_after
+            else None
+        )
+        before = (
+            datetime.fromisoformat(modified_before).timestamp()
+            if modified_before
+            else None
+        )
+        bounds = [
+            ("size", min_size, max_size),
+            ("width", min_width, max_width),
+            ("height", min_height, max_height),
+            ("mtime", after, before),
+        ]
+        results = []
+        for path, record in self.assets_index.get("assets", {}).items():
+            if asset_type and record["type"] != asset_type.rstrip("s"):
+                continue
+            matched = True
+            for field, low, high in bounds:
+                value = record.get(field)
+                if (low is not None or high is not None) and value is None:
+                    matched = False
+                elif low is not None and value < low:
+                    matched = False
+                elif high is not None and value > high:
+                    matched = False
+            if matched:
+                results.append({"path": path, **record})
+        return results
+
+    def scan_directory(self, directory: Path, recursive: bool = False):
         images_found = []
         videos_found = []
 
-        for ext in SUPPORTED_IMAGE_FORMATS:
-            images_found.extend(list(directory.glob(f"*{ext}")))
-            images_found.extend(list(directory.glob(f"*{ext.upper()}")))
-
-        for ext in SUPPORTED_VIDEO_FORMATS:
-            videos_found.extend(list(directory.glob(f"*{ext}")))
-            videos_found.extend(list(directory.glob(f"*{ext.upper()}")))
+        for entry in self.scanner.scan(directory, recursive):
+            if entry["ext"] in SUPPORTED_IMAGE_FORMATS:
+                images_found.append(Path(entry["path"]))
+            elif entry["ext"] in SUPPORTED_VIDEO_FORMATS:
+                videos_found.append(Path(entry["path"]))
 
         return images_found, videos_found
 
@@ -75,7 +211,7 @@ class VisualAssetsManager:
                 str(quality),
                 str(output_file),
             ]
-            subprocess.run(cmd, check=True, capture_output=True)
+            run_command(cmd, check=True, capture_output=True)
             return {
                 "status": "success",
                 "input": str(input_file),
@@ -87,6 +223,9 @@ class VisualAssetsManager:
     def create_thumbnail(
         self, input_path: str, output_path: str, size: str = "400x300"
     ):
+        key = self.cache.key(input_path, "thumbnail", output_path, size=size)
+        if self.cache.restore(key, output_path):
+            return {"status": "success", "thumbnail": str(output_path), "cached": True}
         try:
             cmd = [
                 "convert",
@@ -99,7 +238,8 @@ class VisualAssetsManager:
                 size,
                 str(output_path),
             ]
-            subprocess.run(cmd, check=True, capture_output=True)
+            run_command(cmd, check=True, capture_output=True)
+            self.cache.store(key, output_path)
             return {"status": "success", "thumbnail": str(output_path)}
         except subprocess.CalledProcessError as e:
             return {"error": str(e)}
@@ -107,6 +247,11 @@ class VisualAssetsManager:
     def create_video_thumbnail(
         self, video_path: str, output_path: str, timestamp: str = "00:00:01"
     ):
+        key = self.cache.key(
+            video_path, "video_thumbnail", output_path, timestamp=timestamp
+        )
+        if self.cache.restore(key, output_path):
+            return {"status": "success", "thumbnail": str(output_path), "cached": True}
         try:
             cmd = [
                 "ffmpeg",
@@ -118,7 +263,8 @@ class VisualAssetsManager:
                 "1",
                 str(output_path),
             ]
-            subprocess.run(cmd, check=True, capture_output=True)
+            run_command(cmd, check=True, capture_output=True)
+            self.cache.store(key, output_path)
             return {"status": "success", "thumbnail": str(output_path)}
         except subprocess.CalledProcessError as e:
             return {"error": str(e)}
@@ -135,7 +281,7 @@ class VisualAssetsManager:
                 "fast",
                 str(output_path),
             ]
-            subprocess.run(cmd, check=True, capture_output=True)
+            run_command(cmd, check=True, capture_output=True)
             return {"status": "success", "output": str(output_path)}
         except subprocess.CalledProcessError as e:
             return {"error": str(e)}
@@ -148,6 +294,7 @@ class VisualAssetsManager:
             "created": datetime.now().isoformat(),
         }
 
+        GALLERIES_DIR.mkdir(parents=True, exist_ok=True)
         gallery_file = GALLERIES_DIR / f"{name.lower().replace(' ', '_')}.json"
         with open(gallery_file, "w") as f:
             json.dump(gallery_data, f, indent=2)
@@ -174,29 +321,22 @@ class VisualAssetsManager:
         }
 
         if path.suffix.lower() in SUPPORTED_IMAGE_FORMATS:
-            try:
-                result = subprocess.run(
-                    ["identify", "-format", "%wx%h", str(path)],
-                    capture_output=True,
-                    text=True,
-                    check=True,
-                )
-                info["dimensions"] = result.stdout.strip()
-            except:
-                pass
+            record = self.assets_index.get("assets", {}).get(str(path.resolve()))
+            st = path.stat()
+            if not (
+                record
+                and record["size"] == st.st_size
+                and record["mtime"] == st.st_mtime
+                and "width" in record
+            ):
+                record = probe_assets([str(path)]).get(str(path))
+            if record:
+                info["dimensions"] = f"{record['width']}x{record['height']}"
 
         return info
 
     def list_assets(self, asset_type: str = "all") -> Dict:
-        if asset_type in ["all", "images"]:
-            images, _ = self.scan_directory(IMAGES_DIR)
-            self.assets_index["images"] = [str(p) for p in images]
-
-        if asset_type in ["all", "videos"]:
-            _, videos = self.scan_directory(VIDEOS_DIR)
-            self.assets_index["videos"] = [str(p) for p in videos]
-
-        self._save_index()
+        self.refresh_index(asset_type)
 
         return {
             "images": self.assets_index["images"],
@@ -205,40 +345,58 @@ class VisualAssetsManager:
         }
 
 
-def main():
+def main(argv=None, manager=None):
     import sys
 
-    manager = VisualAssetsManager()
+    argv = sys.argv if argv is None else argv
+    manager = manager or VisualAssetsManager()
 
-    if len(sys.argv) > 1:
-        command = sys.argv[1]
+    if len(argv) > 1:
+        command = argv[1]
 
         if command == "list":
             assets = manager.list_assets()
             print(json.dumps(assets, indent=2))
 
         elif command == "scan":
-            path = sys.argv[2] if len(sys.argv) > 2 else "."
-            images, videos = manager.scan_directory(Path(path))
+            path = argv[2] if len(argv) > 2 else "."
+            recursive = "-r" in argv[3:]
+            images, videos = manager.scan_directory(Path(path), recursive)
             print(f"Found {len(images)} images and {len(videos)} videos")
 
-        elif command == "info" and len(sys.argv) > 2:
-            info = manager.get_asset_info(sys.argv[2])
+        elif command == "refresh":
+            changes = manager.refresh_index()
+            print(json.dumps(changes, indent=2))
+
+        elif command == "query":
+            # e.g. query asset_type=image min_width=1200 modified_after=2026-01-01
+            filters = dict(arg.split("=", 1) for arg in argv[2:])
+            for key in filters:
+                if key.startswith(("min_", "max_")):
+                    filters[key] = int(filters[key])
+            for asset in manager.query_assets(**filters):
+                dims = f"{asset.get('width')}x{asset.get('height')}"
+                print(f"{asset['path']}  {asset['size']}B  {dims}")
+
+        elif command == "info" and len(argv) > 2:
+            info = manager.get_asset_info(argv[2])
             print(json.dumps(info, indent=2))
 
-        elif command == "gallery" and len(sys.argv) > 2:
-            name = sys.argv[2]
-            images = sys.argv[3:] if len(sys.argv) > 3 else []
+        elif command == "gallery" and len(argv) > 2:
+            name = argv[2]
+            images = argv[3:] if len(argv) > 3 else []
             if images:
                 result = manager.create_gallery(name, images)
                 print(json.dumps(result, indent=2))
             else:
                 print(
-                    "Usage: python visual_manager.py gallery <name> <image1> <image2> ..."
+                    "Usage: python visual_manager.py gallery "
+                    "<name> <image1> <image2> ..."
                 )
 
-        elif command == "thumbnail" and len(sys.argv) > 3:
-            result = manager.create_thumbnail(sys.argv[2], sys.argv[3])
+        elif command == "thumbnail" and len(argv) > 3:
+            result = manager.create_thumbnail(argv[2], argv[3])
+            manager.cache.save()
             print(json.dumps(result, indent=2))
 
     else:
@@ -247,12 +405,18 @@ def main():
         print("Commands:")
         print("  python visual_manager.py list                    - List all assets")
         print(
-            "  python visual_manager.py scan <path>             - Scan directory for assets"
+            "  python visual_manager.py scan <path> [-r]        - "
+            "Scan directory for assets"
         )
+        print("  python visual_manager.py refresh                 - Update asset index")
+        print("  python visual_manager.py query [key=value ...]   - Filter asset index")
         print("  python visual_manager.py info <file>              - Get asset info")
         print("  python visual_manager.py gallery <name> <imgs>   - Create gallery")
         print("  python visual_manager.py thumbnail <in> <out>    - Create thumbnail")
 
 
 if __name__ == "__main__":
-    main()
+    from agency_daemon import forward
+
+    if not forward("visual_manager"):
+        main()
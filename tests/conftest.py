@@ -0,0 +1,20 @@
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+# Tests must not write metrics under the production agency root at exit.
+os.environ.setdefault("AGENCY_METRICS", "0")
+
+for package in ("scripts", "agents"):
+    sys.path.insert(0, str(ROOT / package))
+
+
+@pytest.fixture(autouse=True, scope="session")
+def agent_logs(tmp_path_factory):
+    """Keep agent log files out of the production agency root."""
+    import agent_log
+
+    agent_log.PIPELINE.log_dir = tmp_path_factory.mktemp("logs")
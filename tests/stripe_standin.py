@@ -0,0 +1,162 @@
+"""A local stand-in for the parts of the Stripe API payment.py uses.
+
+Objects live in memory. Requests carrying an Idempotency-Key that was seen
+before get the first response again, as Stripe does. ``fail`` queues error
+responses for the next requests to a path.
+"""
+
+import itertools
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+
+class StripeStandIn:
+    def __init__(self):
+        self.objects = {}
+        self.requests = []
+        self.failures = {}
+        self.idempotent = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, args=(0.05,), daemon=True
+        )
+
+    @property
+    def url(self):
+        host, port = self._server.server_address
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def fail(self, path, status, headers=None, times=1):
+        """Answer the next ``times`` requests to ``path`` with ``status``."""
+        self.failures.setdefault(path, []).extend([(status, headers or {})] * times)
+
+    def count(self, method, path):
+        return sum(1 for r in self.requests if r[:2] == (method, path))
+
+    def of_type(self, kind):
+        return [o for o in self.objects.values() if o["object"] == kind]
+
+    def _new(self, kind, prefix, **fields):
+        obj = {"id": f"{prefix}_{next(self._ids)}", "object": kind, **fields}
+        self.objects[obj["id"]] = obj
+        return obj
+
+    def _handler(self):
+        standin = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def log_message(self, *args):
+                pass
+
+            def _reply(self, status, body, headers=None):
+                payload = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def do_GET(self):
+                self._dispatch("GET")
+
+            def do_POST(self):
+                self._dispatch("POST")
+
+            def _dispatch(self, method):
+                url = urlsplit(self.path)
+                length = int(self.headers.get("Content-Length") or 0)
+                body = self.rfile.read(length).decode()
+                params = dict(parse_qsl(url.query or body, keep_blank_values=True))
+                key = self.headers.get("Idempotency-Key")
+                with standin._lock:
+                    standin.requests.append((method, url.path, params, key))
+                    queued = standin.failures.get(url.path)
+                    if queued:
+                        status, headers = queued.pop(0)
+                        error = {"type": "api_error", "message": f"HTTP {status}"}
+                        if status == 429:
+                            error["type"] = "rate_limit_error"
+                        return self._reply(status, {"error": error}, headers)
+                    if key and key in standin.idempotent:
+                        return self._reply(200, standin.idempotent[key])
+                    status, response = standin._route(method, url.path, params)
+                    if key and status == 200:
+                        standin.idempotent[key] = response
+                return self._reply(status, response)
+
+        return Handler
+
+    def _route(self, method, path, params):
+        parts = path.strip("/").split("/")[1:]
+        if method == "GET" and parts == ["prices"]:
+            keys = {v for k, v in params.items() if k.startswith("lookup_keys")}
+            found = [
+                dict(p, product=self.objects[p["product"]])
+                for p in self.of_type("price")
+                if p.get("lookup_key") in keys and p["active"]
+            ]
+            return 200, {"object": "list", "data": found, "has_more": False}
+        if method != "POST":
+            return 404, {"error": {"type": "invalid_request_error"}}
+        if len(parts) >= 2 and parts[-1] in self.objects:
+            obj = self.objects[parts[-1]]
+            for field, value in params.items():
+                obj[field] = {"true": True, "false": False}.get(value, value)
+            return 200, obj
+        if parts == ["products"]:
+            return 200, self._new(
+                "product",
+                "prod",
+                name=params["name"],
+                description=params.get("description"),
+            )
+        if parts == ["prices"]:
+            if params.get("transfer_lookup_key") == "true":
+                for price in self.of_type("price"):
+                    if price.get("lookup_key") == params["lookup_key"]:
+                        price["lookup_key"] = None
+            return 200, self._new(
+                "price",
+                "price",
+                product=params["product"],
+                unit_amount=int(params["unit_amount"]),
+                currency=params["currency"],
+                lookup_key=params.get("lookup_key"),
+                active=True,
+            )
+        if parts == ["payment_links"]:
+            link = self._new("payment_link", "plink", active=True)
+            link["price"] = params["line_items[0][price]"]
+            link["url"] = f"https://buy.stripe.test/{link['id']}"
+            return 200, link
+        if parts == ["checkout", "sessions"]:
+            session = self._new(
+                "checkout.session",
+                "cs",
+                amount_total=int(params["line_items[0][price_data][unit_amount]"]),
+                metadata={
+                    k[len("metadata[") : -1]: v
+                    for k, v in params.items()
+                    if k.startswith("metadata[")
+                },
+            )
+            session["url"] = f"https://checkout.stripe.test/{session['id']}"
+            return 200, session
+        return 404, {"error": {"type": "invalid_request_error"}}
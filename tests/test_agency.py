@@ -0,0 +1,39 @@
+from agency import EvansMathibeAgent
+from agency_metrics import METRICS
+
+
+class SampleAgent(EvansMathibeAgent):
+    rate = 3
+
+    def __init__(self):
+        super().__init__("Sample", "testing")
+
+    def work(self, n):
+        return n * 2
+
+    @staticmethod
+    def parse(text):
+        return text.split(",")
+
+    @classmethod
+    def create(cls):
+        return cls()
+
+    @property
+    def label(self):
+        return f"{self.name} ({self.role})"
+
+
+def test_agent_methods_keep_their_binding_and_are_timed():
+    agent = SampleAgent.create()
+    assert isinstance(agent, SampleAgent)
+    assert agent.parse("a,b") == SampleAgent.parse("a,b") == ["a", "b"]
+    assert agent.work(2) == 4
+    assert agent.label == "Sample (testing)"
+    assert isinstance(vars(SampleAgent)["label"], property)
+
+    timed = METRICS.snapshot()["SampleAgent"]
+    assert timed["create"]["calls"] == 1
+    assert timed["parse"]["calls"] == 2
+    assert timed["work"]["calls"] == 1
+    assert "label" not in timed
@@ -0,0 +1,79 @@
+import threading
+import time
+from contextlib import contextmanager
+
+import pytest
+
+import agency_daemon
+import visual_manager
+from agency import ProjectMonitorAgent
+from task_history import SQLiteTaskHistory
+
+
+@pytest.fixture
+def daemon(tmp_path, monkeypatch):
+    monkeypatch.setattr(visual_manager, "ASSETS_DIR", tmp_path / "assets")
+    monkeypatch.setattr(visual_manager, "GALLERIES_DIR", tmp_path / "galleries")
+    daemon = agency_daemon.AgencyDaemon(tmp_path / "agency.sock")
+    db = SQLiteTaskHistory(tmp_path / "agency_data.db")
+    db.add_tasks(["Shoot product photos", "Edit launch video"])
+    daemon.objects["task_history"] = db
+    daemon.objects["visual_manager"] = visual_manager.VisualAssetsManager()
+    daemon.objects["agency"].agents["monitor"] = ProjectMonitorAgent(tmp_path / "mon")
+    return daemon
+
+
+@contextmanager
+def serving(daemon):
+    # Started inside the test, since serve() swaps sys.stdout, which pytest
+    # also replaces between setup and the test itself.
+    thread = threading.Thread(target=daemon.serve, daemon=True)
+    thread.start()
+    for _ in range(100):
+        if daemon.socket_path.exists():
+            break
+        time.sleep(0.01)
+    try:
+        yield daemon.socket_path
+    finally:
+        agency_daemon.request({"op": "shutdown"}, daemon.socket_path, timeout=5)
+        thread.join(5)
+
+
+def test_sqlite_history_is_served_from_request_threads(daemon, tmp_path):
+    message = {"op": "cli", "cli": "task_history", "argv": ["", "list", "5"]}
+    with serving(daemon) as socket_path:
+        first = agency_daemon.request(message, socket_path, timeout=5)
+        SQLiteTaskHistory(tmp_path / "agency_data.db").add_task("Added by cron")
+        second = agency_daemon.request(message, socket_path, timeout=5)
+    assert first["code"] == 0, first
+    assert "Shoot product photos" in first["stdout"]
+    assert "Edit launch video" in first["stdout"]
+    assert "Added by cron" in second["stdout"]
+
+
+def test_gallery_added_elsewhere_is_seen_and_kept(daemon, tmp_path):
+    image = tmp_path / "cover.png"
+    image.write_bytes(b"png")
+    assert daemon.call("visual", "create_gallery", ["Daemon", [str(image)]])["result"]
+    visual_manager.VisualAssetsManager().create_gallery("Direct run", [str(image)])
+
+    daemon.call("visual", "create_gallery", ["Later", [str(image)]])
+    galleries = visual_manager.VisualAssetsManager().assets_index["galleries"]
+    assert [g.rsplit("/", 1)[-1] for g in galleries] == [
+        "daemon.json",
+        "direct_run.json",
+        "later.json",
+    ]
+
+
+def test_projects_saved_elsewhere_are_served(daemon, tmp_path):
+    other = ProjectMonitorAgent(tmp_path / "mon")
+    other.track_project("Launch", ["brief", "shoot"])
+    other.update_progress("Launch", "brief")
+
+    status = daemon.call("agent.monitor", "get_status", ["Launch"])["result"]
+    assert status["progress"] == "1/2"
+
+    (tmp_path / "mon" / "launch.json").unlink()
+    assert daemon.call("agent.monitor", "get_all_statuses")["result"] == []
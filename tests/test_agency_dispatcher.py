@@ -0,0 +1,43 @@
+import asyncio
+import threading
+import time
+
+from agency import AgencyDispatcher
+
+
+class FakeAgency:
+    def get_agent(self, role):
+        return object()
+
+
+def test_timed_out_calls_keep_their_role_slot():
+    running, peak = [0], [0]
+    lock = threading.Lock()
+
+    def slow(agent):
+        with lock:
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+        time.sleep(0.2)
+        with lock:
+            running[0] -= 1
+
+    async def main():
+        dispatcher = AgencyDispatcher(FakeAgency(), limits={"coding": 1})
+        for _ in range(3):
+            dispatcher.submit("coding", slow, timeout=0.05)
+        return await dispatcher.gather()
+
+    results = asyncio.run(main())
+    assert all("Timed out" in r["error"] for r in results)
+    assert peak[0] == 1
+
+
+def test_explicit_zero_timeout_is_not_the_default():
+    async def main():
+        dispatcher = AgencyDispatcher(FakeAgency(), timeout=5)
+        dispatcher.submit("coding", lambda agent: time.sleep(0.2), timeout=0)
+        return await dispatcher.gather()
+
+    (result,) = asyncio.run(main())
+    assert result["error"] == "Timed out after 0s"
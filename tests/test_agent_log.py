@@ -0,0 +1,64 @@
+import builtins
+import threading
+
+from agent_log import LogPipeline, log_filename
+
+
+def test_broken_console_keeps_the_writer_alive(tmp_path, monkeypatch):
+    pipeline = LogPipeline(tmp_path, console=True)
+
+    def broken_pipe(*args, **kwargs):
+        raise BrokenPipeError(32, "Broken pipe")
+
+    monkeypatch.setattr(builtins, "print", broken_pipe)
+    pipeline.emit("Writer", "first")
+    assert pipeline.flush()
+    pipeline.emit("Writer", "second")
+    assert pipeline.flush()
+    assert pipeline._thread.is_alive()
+    lines = (tmp_path / log_filename("Writer")).read_text().splitlines()
+    assert [line.rsplit(" ", 1)[-1] for line in lines] == ["first", "second"]
+    pipeline.close()
+
+
+def test_unencodable_echo_is_skipped(tmp_path, monkeypatch):
+    pipeline = LogPipeline(tmp_path, console=True)
+
+    def ascii_console(text, *args, **kwargs):
+        text.encode("ascii")
+
+    monkeypatch.setattr(builtins, "print", ascii_console)
+    pipeline.emit("Writer", "café")
+    assert pipeline.flush()
+    assert "café" in (tmp_path / log_filename("Writer")).read_text()
+    pipeline.close()
+
+
+def test_failed_batch_is_counted_and_later_batches_written(tmp_path, monkeypatch):
+    pipeline = LogPipeline(tmp_path, console=False)
+    append = pipeline._append
+    failures = iter([RuntimeError("disk went away")])
+
+    def flaky_append(filename, text):
+        for error in failures:
+            raise error
+        append(filename, text)
+
+    monkeypatch.setattr(pipeline, "_append", flaky_append)
+    pipeline.emit("Writer", "lost")
+    assert pipeline.flush()
+    pipeline.emit("Writer", "kept")
+    assert pipeline.flush()
+    assert pipeline.dropped == 1
+    assert (tmp_path / log_filename("Writer")).read_text().endswith("kept\n")
+    pipeline.close()
+
+
+def test_flush_reports_a_dead_writer(tmp_path):
+    pipeline = LogPipeline(tmp_path, console=False)
+    pipeline._thread = threading.Thread(target=lambda: None)
+    pipeline._thread.start()
+    pipeline._thread.join()
+    assert pipeline.flush()
+    pipeline._queue.put((0.0, "Writer", "INFO", "stranded"))
+    assert not pipeline.flush()
@@ -0,0 +1,79 @@
+import io
+import json
+
+import pytest
+
+from analytics_archive import AnalyticsStore, iter_json_values
+
+
+def write_snapshot(archive, day, hour, page_views, timestamp="$DATE"):
+    name = f"analytics_{day}_{hour:02d}-00-00.json"
+    snapshot = {"timestamp": timestamp, "type": "automated_archive"}
+    snapshot["page_views"] = page_views
+    (archive / name).write_text(json.dumps(snapshot, indent=2))
+    return archive / name
+
+
+@pytest.fixture
+def archive(tmp_path):
+    archive = tmp_path / "archive"
+    archive.mkdir()
+    for n, day in enumerate(["2026-03-01", "2026-03-02", "2026-04-01"]):
+        for hour in (6, 18):
+            write_snapshot(archive, day, hour, 10 * n + hour)
+    return archive
+
+
+def test_values_are_read_a_chunk_at_a_time():
+    text = '[{"a": 1}, {"b": "' + "x" * 100 + '"}]\n{"c": 2}{"d": [3]}\n'
+    values = [{"a": 1}, {"b": "x" * 100}, {"c": 2}, {"d": [3]}]
+    for chunk_size in (1, 5, 64, 1 << 16):
+        assert list(iter_json_values(io.StringIO(text), chunk_size)) == values
+    with pytest.raises(ValueError):
+        list(iter_json_values(io.StringIO('[{"a": 1}, {"b"'), 4))
+
+
+def rollups(store):
+    return {level: store.rollup(level) for level in ("hour", "day", "month")}
+
+
+def test_torn_compaction_is_undone(tmp_path, archive, monkeypatch):
+    AnalyticsStore(tmp_path / "store", archive).compact()
+    # A compaction that appended to its partitions and rewrote the rollups,
+    # then died before committing state.json.
+    write_snapshot(archive, "2026-03-02", 21, 1000)
+    write_snapshot(archive, "2026-03-05", 9, 2000)
+    write = AnalyticsStore._write
+
+    def crash_on_state(path, value):
+        if path.name == "state.json":
+            raise OSError("disk full")
+        write(path, value)
+
+    monkeypatch.setattr(AnalyticsStore, "_write", staticmethod(crash_on_state))
+    with pytest.raises(OSError):
+        AnalyticsStore(tmp_path / "store", archive).compact()
+    monkeypatch.undo()
+    torn = AnalyticsStore(tmp_path / "store", archive)
+    assert torn.rollup("month")["2026-03"]["snapshots"] == 6
+    assert torn.pending()
+
+    assert torn.compact()["compacted"] == 2
+    clean = AnalyticsStore(tmp_path / "clean", archive)
+    clean.compact()
+    assert list(torn.query()) == list(clean.query())
+    reopened = AnalyticsStore(tmp_path / "store", archive)
+    assert rollups(reopened) == rollups(clean)
+    assert reopened.stats()["bytes"] == clean.stats()["bytes"]
+
+
+def test_removed_snapshots_are_forgotten(tmp_path, archive):
+    store = AnalyticsStore(tmp_path / "store", archive)
+    assert store.compact(remove=True)["compacted"] == 6
+    assert len(store.state["files"]) == 6
+
+    write_snapshot(archive, "2026-04-02", 6, 5)
+    store = AnalyticsStore(tmp_path / "store", archive)
+    assert store.compact()["compacted"] == 1
+    assert store.state["files"] == ["analytics_2026-04-02_06-00-00.json"]
+    assert store.rollup("month")["2026-04"]["snapshots"] == 3
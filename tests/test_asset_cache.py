@@ -0,0 +1,75 @@
+from asset_cache import DerivedAssetCache
+
+
+def produce(tmp_path, name, content):
+    path = tmp_path / name
+    path.write_bytes(content)
+    return path
+
+
+def test_processes_keep_each_others_entries(tmp_path):
+    first = DerivedAssetCache(tmp_path / "cache")
+    second = DerivedAssetCache(tmp_path / "cache")
+    # Both load the empty index before either one writes.
+    assert first.stats()["entries"] == second.stats()["entries"] == 0
+    a = produce(tmp_path, "a.mp4", b"a" * 100)
+    b = produce(tmp_path, "b.mp4", b"b" * 100)
+    key_a = first.key(a, "compress", a)
+    key_b = second.key(b, "compress", b)
+    first.store(key_a, a)
+    second.store(key_b, b)
+    first.save()
+    second.save()
+
+    reopened = DerivedAssetCache(tmp_path / "cache")
+    assert reopened.entry(key_a) and reopened.entry(key_b)
+    assert str(a.resolve()) in reopened.index["digests"]
+
+
+def test_digests_of_removed_files_are_pruned(tmp_path):
+    cache = DerivedAssetCache(tmp_path / "cache")
+    kept = produce(tmp_path, "kept.mp4", b"k")
+    gone = produce(tmp_path, "gone.mp4", b"g")
+    cache.digest(kept)
+    cache.digest(gone)
+    gone.unlink()
+    cache.save()
+
+    digests = DerivedAssetCache(tmp_path / "cache").index["digests"]
+    assert list(digests) == [str(kept.resolve())]
+
+
+def test_eviction_applies_to_merged_index(tmp_path):
+    first = DerivedAssetCache(tmp_path / "cache", max_bytes=150)
+    second = DerivedAssetCache(tmp_path / "cache", max_bytes=150)
+    old = produce(tmp_path, "old.mp4", b"o" * 100)
+    new = produce(tmp_path, "new.mp4", b"n" * 100)
+    key_old = first.key(old, "compress", old)
+    first.store(key_old, old)
+    first.save()
+    key_new = second.key(new, "compress", new)
+    second.store(key_new, new)
+    second.save()
+
+    reopened = DerivedAssetCache(tmp_path / "cache")
+    assert reopened.entry(key_old) is None
+    assert reopened.entry(key_new)
+    assert not (tmp_path / "cache" / key_old[:2] / key_old).exists()
+
+
+def test_restore_and_store_wait_for_save(tmp_path):
+    cache = DerivedAssetCache(tmp_path / "cache")
+    outputs = [produce(tmp_path, f"{n}.jpg", bytes([n]) * 10) for n in range(50)]
+    keys = [cache.key(path, "thumbnail", path) for path in outputs]
+    for key, path in zip(keys, outputs):
+        cache.store(key, path)
+    assert not cache.index_file.exists()
+    cache.save()
+    saved = cache.index_file.stat().st_mtime_ns
+
+    for key, path in zip(keys, outputs):
+        assert cache.restore(key, path)
+    assert cache.index_file.stat().st_mtime_ns == saved
+    cache.save()
+    reopened = DerivedAssetCache(tmp_path / "cache")
+    assert all(reopened.entry(key) for key in keys)
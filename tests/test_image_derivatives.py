@@ -0,0 +1,140 @@
+import os
+import struct
+import sys
+
+import pytest
+
+import image_derivatives
+from image_derivatives import DERIVED_SUBDIR, DerivativeBuilder, srcsets, target_widths
+
+# Stands in for ImageMagick: lists WebP as writable and writes each output
+# as that many bytes as its width, logging every encode.
+STUB_TOOL = """#!{python}
+import sys
+
+args = sys.argv[1:]
+if args[:2] == ["-list", "format"]:
+    print("     WEBP* WEBP      rw+   WebP Image Format")
+    sys.exit(0)
+with open({log!r}, "a") as log:
+    log.write(args[0] + "\\n")
+for i, arg in enumerate(args):
+    if arg == "-resize":
+        width = int(args[i + 1].rstrip("x"))
+    if arg == "-write":
+        with open(args[i + 1], "wb") as out:
+            out.write(b"x" * width)
+"""
+
+
+def png(path, width, height, extra=b""):
+    """A PNG header that asset_probe can size; no pixels are needed."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(
+        b"\x89PNG\r\n\x1a\n"
+        + struct.pack(">I", 13)
+        + b"IHDR"
+        + struct.pack(">II", width, height)
+        + extra
+    )
+
+
+def test_target_widths():
+    assert target_widths(100) == [100]
+    assert target_widths(640) == [320, 640]
+    assert target_widths(700) == [320, 640, 700]
+    assert target_widths(1920) == image_derivatives.WIDTHS
+    assert target_widths(4000) == image_derivatives.WIDTHS
+
+
+def test_srcsets_order_and_encoding():
+    variants = [
+        {"src": "images/derived/my photo,1-640w.jpg", "width": 640, "format": "jpg"},
+        {"src": "images/derived/a-640w.webp", "width": 640, "format": "webp"},
+        {"src": "images/derived/my photo,1-320w.jpg", "width": 320, "format": "jpg"},
+        {"src": "images/derived/a-320w.avif", "width": 320, "format": "avif"},
+        {"src": "images/derived/a-320w.webp", "width": 320, "format": "webp"},
+    ]
+    sets = srcsets(variants)
+    assert list(sets) == ["image/avif", "image/webp", "image/jpeg"]
+    assert sets["image/webp"] == (
+        "images/derived/a-320w.webp 320w, images/derived/a-640w.webp 640w"
+    )
+    assert sets["image/jpeg"] == (
+        "images/derived/my%20photo%2C1-320w.jpg 320w, "
+        "images/derived/my%20photo%2C1-640w.jpg 640w"
+    )
+    assert srcsets([]) == {}
+
+
+@pytest.fixture
+def site(tmp_path, monkeypatch):
+    tool = tmp_path / "convert"
+    tool.write_text(
+        STUB_TOOL.format(python=sys.executable, log=str(tmp_path / "encodes.log"))
+    )
+    tool.chmod(0o755)
+    monkeypatch.setattr(image_derivatives, "imagemagick", lambda: str(tool))
+    site = tmp_path / "website"
+    png(site / "images" / "hero.png", 1000, 500)
+    png(site / "images" / "gallery" / "logo.png", 200, 200)
+    return site
+
+
+def encodes(site):
+    log = site.parent / "encodes.log"
+    return log.read_text().splitlines() if log.exists() else []
+
+
+def test_build_skips_unchanged_images(site):
+    report = DerivativeBuilder(site, workers=1).build()
+    assert (report["images"], report["derived"], report["errors"]) == (2, 2, [])
+    info = DerivativeBuilder(site).metadata["images"]["images/hero.png"]
+    assert [(v["format"], v["width"]) for v in info["variants"]] == [
+        ("webp", 320),
+        ("webp", 640),
+        ("webp", 960),
+        ("webp", 1000),
+        ("png", 320),
+        ("png", 640),
+        ("png", 960),
+        ("png", 1000),
+    ]
+    assert info["srcset"]["image/webp"].endswith("-1000w.webp 1000w")
+    assert all((site / v["src"]).exists() for v in info["variants"])
+    assert len(encodes(site)) == 2
+
+    # Same size and mtime: nothing is sent to the pool.
+    report = DerivativeBuilder(site, workers=1).build()
+    assert (report["derived"], report["unchanged"]) == (0, 2)
+    assert report["images_per_s"] is None
+    assert len(encodes(site)) == 2
+
+    # A new mtime alone is caught by the content hash in the worker.
+    os.utime(site / "images" / "hero.png", ns=(1, 1))
+    report = DerivativeBuilder(site, workers=1).build()
+    assert (report["derived"], report["unchanged"]) == (0, 2)
+    assert report["images_per_s"] == 0
+    assert len(encodes(site)) == 2
+
+    png(site / "images" / "hero.png", 1000, 500, b"changed")
+    report = DerivativeBuilder(site, workers=1).build()
+    assert (report["derived"], report["unchanged"]) == (1, 1)
+    assert encodes(site)[-1] == str(site / "images" / "hero.png")
+
+
+def test_build_removes_orphaned_derivatives(site):
+    DerivativeBuilder(site, workers=1).build()
+    derived = site / DERIVED_SUBDIR
+    (derived / "stale-320w.webp").write_bytes(b"old")
+    logo = DerivativeBuilder(site).metadata["images"]["images/gallery/logo.png"]
+
+    (site / "images" / "gallery" / "logo.png").unlink()
+    report = DerivativeBuilder(site, workers=1).build()
+    assert report["removed_files"] == len(logo["variants"]) + 1
+    assert not any((site / v["src"]).exists() for v in logo["variants"])
+    metadata = DerivativeBuilder(site).metadata["images"]
+    assert list(metadata) == ["images/hero.png"]
+    assert all(
+        (site / v["src"]).exists() for v in metadata["images/hero.png"]["variants"]
+    )
@@ -0,0 +1,180 @@
+import json
+
+import pytest
+
+stripe = pytest.importorskip("stripe")
+
+import payment
+from stripe_standin import StripeStandIn
+
+
+@pytest.fixture
+def standin(monkeypatch):
+    server = StripeStandIn().start()
+    monkeypatch.setenv("STRIPE_API_BASE", server.url)
+    # The handler does its own retries; the SDK's would hide them.
+    monkeypatch.setattr(stripe, "max_network_retries", 0)
+    yield server
+    server.stop()
+
+
+def catalog_handler(tmp_path):
+    handler = payment.StripePaymentHandler("sk_test_standin")
+    handler._catalog = payment.StripeCatalog(handler.stripe, tmp_path / "catalog.json")
+    return handler
+
+
+def test_sync_creates_then_leaves_catalog_unchanged(tmp_path, standin):
+    handler = catalog_handler(tmp_path)
+    tiers = sum(len(s["prices"]) for s in payment.SERVICES_PRICING.values())
+
+    assert handler.catalog.sync()["created"] == tiers
+    assert len(standin.of_type("product")) == len(standin.of_type("price")) == tiers
+    with open(tmp_path / "catalog.json") as f:
+        entry = json.load(f)["entries"]["photography:basic"]
+    price = standin.objects[entry["price_id"]]
+    assert price["unit_amount"] == entry["unit_amount"] == 500000
+    assert price["lookup_key"] == "photography_basic"
+    assert standin.objects[entry["product_id"]]["name"] == entry["name"]
+
+    again = catalog_handler(tmp_path).catalog.sync()
+    assert again["unchanged"] == tiers
+    assert len(standin.of_type("price")) == tiers
+
+
+def test_lost_catalog_adopts_prices_by_lookup_key(tmp_path, standin):
+    catalog_handler(tmp_path).catalog.sync()
+    (tmp_path / "catalog.json").unlink()
+    requests_before = len(standin.requests)
+
+    report = catalog_handler(tmp_path).catalog.sync()
+    assert report["adopted"] == sum(report.values())
+    assert standin.count("POST", "/v1/products") == standin.count("POST", "/v1/prices")
+    assert all(r[0] == "GET" for r in standin.requests[requests_before:])
+    with open(tmp_path / "catalog.json") as f:
+        entries = json.load(f)["entries"]
+    assert entries["film:premium"]["price_id"] in standin.objects
+
+
+def test_changed_price_replaces_price_and_link(tmp_path, standin, monkeypatch):
+    handler = catalog_handler(tmp_path)
+    first = handler.create_payment_link("design", "basic")
+    assert handler.create_payment_link("design", "basic") == first
+    assert standin.count("POST", "/v1/payment_links") == 1
+
+    prices = dict(payment.SERVICES_PRICING["design"]["prices"], basic=3500)
+    monkeypatch.setitem(
+        payment.SERVICES_PRICING,
+        "design",
+        dict(payment.SERVICES_PRICING["design"], prices=prices),
+    )
+    second = handler.create_payment_link("design", "basic")
+    assert second["price"] == 3500 and second["url"] != first["url"]
+    old_link, new_link = standin.of_type("payment_link")
+    assert old_link["active"] is False and new_link["active"] is True
+    old_price, new_price = standin.of_type("price")
+    assert old_price["active"] is False
+    with open(tmp_path / "catalog.json") as f:
+        entry = json.load(f)["entries"]["design:basic"]
+    assert (entry["price_id"], entry["link_url"]) == (new_price["id"], second["url"])
+
+
+def test_failed_retirement_keeps_new_price_for_retry(tmp_path, standin, monkeypatch):
+    handler = catalog_handler(tmp_path)
+    first = handler.create_payment_link("design", "basic")
+    link_id = handler.catalog.entries["design:basic"]["link_id"]
+
+    prices = dict(payment.SERVICES_PRICING["design"]["prices"], basic=3500)
+    monkeypatch.setitem(
+        payment.SERVICES_PRICING,
+        "design",
+        dict(payment.SERVICES_PRICING["design"], prices=prices),
+    )
+    standin.fail(f"/v1/payment_links/{link_id}", 400)
+    assert "error" in handler.create_payment_link("design", "basic")
+    with open(tmp_path / "catalog.json") as f:
+        entry = json.load(f)["entries"]["design:basic"]
+    new_price = standin.of_type("price")[-1]
+    assert entry["price_id"] == new_price["id"] and "link_id" not in entry
+    assert entry["retire"] == [["PaymentLink", link_id]]
+
+    second = catalog_handler(tmp_path).create_payment_link("design", "basic")
+    assert second["price"] == 3500 and second["url"] != first["url"]
+    assert standin.count("POST", "/v1/prices") == 2
+    assert standin.objects[link_id]["active"] is False
+    with open(tmp_path / "catalog.json") as f:
+        assert "retire" not in json.load(f)["entries"]["design:basic"]
+
+
+def test_unknown_tier_falls_back_to_standard(tmp_path, standin):
+    handler = catalog_handler(tmp_path)
+    link = handler.create_payment_link("pr", "platinum")
+    assert link["price"] == payment.SERVICES_PRICING["pr"]["prices"]["standard"]
+    assert handler.create_payment_link("pr", "standard") == link
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    delays = []
+    monkeypatch.setattr(payment.time, "sleep", delays.append)
+    return delays
+
+
+QUOTES = [
+    {"service": "photography", "tier": "basic", "client": "Acme", "project": "Launch"},
+    {"service": "film", "tier": "premium", "client": "Birch"},
+    {"service": "design", "client": "Cedar"},
+]
+
+
+def test_rate_limit_waits_for_retry_after(standin, sleeps):
+    handler = payment.StripePaymentHandler("sk_test_standin")
+    standin.fail("/v1/checkout/sessions", 429, {"Retry-After": "2"})
+
+    batch = handler.create_checkout_sessions(QUOTES[:1], workers=1)
+    (result,) = batch["results"]
+    assert result["attempts"] == 2 and result["session_id"]
+    assert sleeps == [2.0]
+    session = standin.objects[result["session_id"]]
+    assert session["metadata"] == {
+        "service": "photography",
+        "tier": "basic",
+        "client": "Acme",
+        "project": "Launch",
+    }
+
+
+def test_server_errors_are_retried_with_the_same_key(standin, sleeps):
+    handler = payment.StripePaymentHandler("sk_test_standin")
+    standin.fail("/v1/checkout/sessions", 500, times=2)
+
+    batch = handler.create_checkout_sessions(QUOTES[:1], workers=1)
+    assert batch["created"] == 1 and batch["results"][0]["attempts"] == 3
+    assert len(sleeps) == 2
+    keys = {r[3] for r in standin.requests if r[1] == "/v1/checkout/sessions"}
+    assert len(keys) == 1 and None not in keys
+    assert len(standin.of_type("checkout.session")) == 1
+
+
+def test_rerunning_a_batch_returns_the_same_sessions(standin):
+    handler = payment.StripePaymentHandler("sk_test_standin")
+    first = handler.create_checkout_sessions(QUOTES, workers=3, batch_id="b-1")
+    again = handler.create_checkout_sessions(QUOTES, workers=3, batch_id="b-1")
+
+    assert first["created"] == again["created"] == 3
+    assert [r["session_id"] for r in again["results"]] == [
+        r["session_id"] for r in first["results"]
+    ]
+    assert len(standin.of_type("checkout.session")) == 3
+    other = handler.create_checkout_sessions(QUOTES[:1], batch_id="b-2")
+    assert other["results"][0]["session_id"] != first["results"][0]["session_id"]
+
+
+def test_single_session_retries_with_a_generated_key(standin, sleeps):
+    handler = payment.StripePaymentHandler("sk_test_standin")
+    standin.fail("/v1/checkout/sessions", 503)
+
+    result = handler.create_checkout_session("pr", "basic", retries=2)
+    assert result["session_id"]
+    keys = [r[3] for r in standin.requests if r[1] == "/v1/checkout/sessions"]
+    assert len(keys) == 2 and keys[0] is not None and keys[0] == keys[1]
@@ -0,0 +1,48 @@
+import pytest
+
+import pricing
+
+RATES = pricing.rate_table({"USD": 0.0542, "EUR": 0.0498, "BWP": 0.7391})
+
+
+@pytest.fixture(params=["python", "numpy"])
+def engine(request):
+    if request.param == "numpy":
+        pytest.importorskip("numpy")
+    return request.param
+
+
+def test_batch_engines_match_scalar_quotes(engine):
+    specs = pricing.random_quotes(2000, sorted(RATES))
+    # Quotes with no lines, at the start, middle and end of the batch.
+    specs[0]["items"] = specs[1000]["items"] = specs[-1]["items"] = []
+    expected = [pricing.quote(spec, RATES) for spec in specs]
+    assert pricing.quote_many(specs, RATES, engine) == expected
+
+
+def test_scenarios_match_scalar_quotes(engine):
+    specs = pricing.random_quotes(500, sorted(RATES), seed=11)
+    batch = pricing.QuoteBatch(specs, RATES)
+    columns = pricing.price_columns(
+        batch.scenario(discount_pct=12.5, vat=False, currency="eur", rates=RATES),
+        engine,
+    )
+    what_if = [
+        dict(spec, discount_pct=12.5, vat=False, currency="EUR") for spec in specs
+    ]
+    assert columns["total"] == [
+        pricing.quote(spec, RATES)["total_cents"] for spec in what_if
+    ]
+
+
+def test_empty_batch(engine):
+    assert pricing.quote_many([], RATES, engine) == []
+
+
+@pytest.mark.parametrize("qty", [True, False, -1, 1.5, "2"])
+def test_quantity_must_be_a_whole_number(qty):
+    spec = {"items": [{"service": "design", "tier": "basic", "quantity": qty}]}
+    with pytest.raises(ValueError):
+        pricing.quote(spec, RATES)
+    with pytest.raises(ValueError):
+        pricing.quote_many([spec], RATES)
@@ -0,0 +1,55 @@
+import json
+
+from site_build import SiteBuilder
+
+
+def write_gallery(tmp, slug, images):
+    gallery_file = tmp / "galleries" / f"{slug}.json"
+    gallery_file.parent.mkdir(exist_ok=True)
+    gallery_file.write_text(json.dumps({"name": slug, "images": images}))
+
+
+def builder(tmp, mirrors=()):
+    return SiteBuilder(
+        tmp / "website", tmp / "galleries", tmp / "manifest.json", None, mirrors
+    )
+
+
+def test_galleries_keep_same_named_images_apart(tmp_path):
+    for folder in ("a", "b"):
+        (tmp_path / folder).mkdir()
+        (tmp_path / folder / "cover.png").write_bytes(folder.encode())
+    write_gallery(tmp_path, "first", [str(tmp_path / "a" / "cover.png")])
+    write_gallery(
+        tmp_path,
+        "second",
+        [str(tmp_path / "b" / "cover.png"), str(tmp_path / "a" / "cover.png")],
+    )
+    builder(tmp_path).build()
+
+    gallery = tmp_path / "website" / "images" / "gallery"
+    assert (gallery / "first" / "cover.png").read_bytes() == b"a"
+    assert (gallery / "second" / "cover.png").read_bytes() == b"b"
+    assert (gallery / "second" / "cover-2.png").read_bytes() == b"a"
+    page = (tmp_path / "website" / "galleries" / "second.html").read_text()
+    assert "../images/gallery/second/cover-2.png" in page
+
+
+def test_outputs_are_mirrored_and_removed(tmp_path):
+    (tmp_path / "cover.png").write_bytes(b"png")
+    write_gallery(tmp_path, "launch", [str(tmp_path / "cover.png")])
+    docs = tmp_path / "docs"
+    report = builder(tmp_path, [docs]).build()
+    assert report["mirrored"] == len(report["built"])
+    for name in report["built"]:
+        assert (docs / name).read_bytes() == (tmp_path / "website" / name).read_bytes()
+
+    assert builder(tmp_path, [docs]).build()["mirrored"] == 0
+    (docs / "galleries" / "launch.html").unlink()
+    assert builder(tmp_path, [docs]).build()["mirrored"] == 1
+
+    (tmp_path / "galleries" / "launch.json").unlink()
+    report = builder(tmp_path, [docs]).build()
+    assert "galleries/launch.html" in report["removed"]
+    assert not (docs / "galleries" / "launch.html").exists()
+    assert not (docs / "images" / "gallery" / "launch" / "cover.png").exists()
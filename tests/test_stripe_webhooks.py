@@ -0,0 +1,135 @@
+import http.client
+import json
+
+import pytest
+
+from stripe_webhooks import EventStore, WebhookService, sign_payload
+from task_history import TaskHistory
+
+SECRET = "whsec_test"
+
+
+def event(n, project="Launch", amount=500000):
+    return {
+        "id": f"evt_{n}",
+        "type": "checkout.session.completed",
+        "data": {"object": {"amount_total": amount, "metadata": {"project": project}}},
+    }
+
+
+def deliver(service, payload, signature):
+    conn = http.client.HTTPConnection(*service.address)
+    conn.request("POST", "/webhook", payload, {"Stripe-Signature": signature})
+    response = conn.getresponse()
+    reply = json.loads(response.read())
+    conn.close()
+    return response.status, reply
+
+
+def send(service, evt):
+    payload = json.dumps(evt).encode()
+    return deliver(service, payload, sign_payload(payload, SECRET))
+
+
+@pytest.fixture
+def history(tmp_path):
+    return TaskHistory(tmp_path / "agency_data.json")
+
+
+@pytest.fixture
+def start(tmp_path, history):
+    services = []
+
+    def start(history=history):
+        service = WebhookService(SECRET, history, tmp_path / "webhooks", port=0)
+        services.append(service.start())
+        return service
+
+    yield start
+    for service in services:
+        if service._server.socket.fileno() != -1:
+            service.stop()
+
+
+def payment_events(history, project="Launch"):
+    (found,) = [p for p in history.get_projects() if p["name"] == project]
+    return found["payment_events"]
+
+
+def test_rejects_bad_and_stale_signatures(start):
+    service = start()
+    payload = json.dumps(event(1)).encode()
+
+    assert deliver(service, payload, sign_payload(payload, "whsec_other"))[0] == 400
+    assert deliver(service, payload, "t=1,v1=deadbeef")[0] == 400
+    stale = sign_payload(payload, SECRET, timestamp=1_000_000)
+    assert deliver(service, payload, stale)[0] == 400
+    assert service.stats["rejected"] == 3 and service.stats["accepted"] == 0
+
+
+def test_redelivered_event_is_processed_once(start, history):
+    service = start()
+    assert send(service, event(1)) == (200, {"received": True, "duplicate": False})
+    assert send(service, event(1)) == (200, {"received": True, "duplicate": True})
+    assert service.wait_idle(10)
+
+    assert len(history.get_tasks(0)) == 1
+    assert len(payment_events(history)) == 1
+    assert service.stats["processed"] == 1
+
+
+def test_unprocessed_events_are_replayed_after_restart(tmp_path, start, history):
+    # A crash after the task was added but before the event was marked
+    # processed: the replay must not add the task again.
+    store = EventStore(tmp_path / "webhooks")
+    store.record([event(1), event(2)])
+    history.add_task("Payment paid: R5,000.00 (Launch)", "Stripe x evt_1")
+
+    service = start()
+    assert service.wait_idle(10)
+    assert [t["details"].split()[-1] for t in history.get_tasks(0)] == [
+        "evt_1",
+        "evt_2",
+    ]
+    assert EventStore(tmp_path / "webhooks").pending() == []
+    assert send(service, event(2))[1]["duplicate"] is True
+
+
+class FlakyHistory:
+    """Fails the first ``failures`` payment updates."""
+
+    def __init__(self, history, failures):
+        self.history = history
+        self.failures = failures
+
+    def __getattr__(self, name):
+        return getattr(self.history, name)
+
+    def update_project_payments(self, payments):
+        if self.failures:
+            self.failures -= 1
+            raise OSError("disk full")
+        return self.history.update_project_payments(payments)
+
+
+def test_failures_do_not_stop_the_worker(tmp_path, start, history, capsys):
+    service = start(FlakyHistory(history, failures=1))
+    send(service, event(1))
+    assert service.wait_idle(10)
+    assert service.failed == {"evt_1"}
+    assert "evt_1: OSError: disk full" in capsys.readouterr().err
+
+    send(service, event(2))
+    send(service, event(3, amount="not a number"))
+    assert service.wait_idle(10)
+    assert service.failed == {"evt_1", "evt_3"}
+    assert payment_events(history) == ["evt_2"]
+    service.stop()
+
+    # Failed events stay unprocessed and are applied on the next start.
+    pending = EventStore(tmp_path / "webhooks").pending()
+    assert [e["id"] for e in pending] == ["evt_1", "evt_3"]
+    restarted = start()
+    assert restarted.wait_idle(10)
+    assert restarted.failed == {"evt_3"}
+    assert payment_events(history) == ["evt_2", "evt_1"]
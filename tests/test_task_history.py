@@ -0,0 +1,180 @@
+import json
+import sqlite3
+
+import pytest
+
+from task_history import SQLiteTaskHistory, TaskHistory, stress_test
+
+
+def journal_only_store(tmp_path):
+    data_file = tmp_path / "agency_data.json"
+    writer = TaskHistory(data_file)
+    writer.add_tasks(["first", "second", ("third", "details")])
+    assert not writer.snapshot_file.exists()
+    return data_file
+
+
+def test_export_from_journal_only_store(tmp_path):
+    tracker = TaskHistory(journal_only_store(tmp_path))
+    assert "task_history" in tracker.data
+    export = tmp_path / "export.json"
+    tracker.export_data(export)
+    with open(export) as f:
+        tasks = json.load(f)["task_history"]
+    assert [t["task"] for t in tasks] == ["first", "second", "third"]
+
+
+def test_migrate_from_journal_only_store(tmp_path):
+    tracker = TaskHistory(journal_only_store(tmp_path))
+    db = SQLiteTaskHistory(tmp_path / "agency_data.db")
+    db.import_document(tracker.data)
+    assert [t["task"] for t in db.get_tasks(0)] == ["first", "second", "third"]
+
+
+def test_refresh_sees_other_processes_writes(tmp_path):
+    data_file = tmp_path / "agency_data.json"
+    warm = TaskHistory(data_file)
+    warm.add_task("from daemon")
+    warm.update_agency_info(name="Old name")
+    assert warm.get_agency_info()["name"] == "Old name"
+
+    other = TaskHistory(data_file)
+    other.add_task("from cron")
+    other.update_agency_info(name="New name")
+
+    warm.refresh()
+    assert [t["task"] for t in warm.get_tasks(0)] == ["from daemon", "from cron"]
+    assert [t["task"] for t in warm.search_tasks("cron")] == ["from cron"]
+    assert warm.get_agency_info()["name"] == "New name"
+
+
+def test_refresh_after_other_process_compacts(tmp_path):
+    data_file = tmp_path / "agency_data.json"
+    warm = TaskHistory(data_file)
+    warm.add_tasks(["one", "two"])
+    assert len(warm.get_tasks(0)) == 2
+
+    other = TaskHistory(data_file)
+    other.add_task("three")
+    other.compact()
+
+    warm.refresh()
+    assert [t["id"] for t in warm.get_tasks(0)] == [1, 2, 3]
+
+
+def test_cold_add_reads_neither_snapshot_nor_whole_history(tmp_path, monkeypatch):
+    data_file = tmp_path / "agency_data.json"
+    for n in range(7):
+        TaskHistory(data_file, compact_records=3).add_task(f"task {n}")
+
+    def unexpected(self):
+        raise AssertionError("add parsed the snapshot")
+
+    monkeypatch.setattr(TaskHistory, "_read_snapshot", unexpected)
+    assert [TaskHistory(data_file, 3).add_task("x")["id"] for _ in range(4)] == [
+        8,
+        9,
+        10,
+        11,
+    ]
+    monkeypatch.undo()
+    assert [t["id"] for t in TaskHistory(data_file).get_tasks(0)] == list(range(1, 12))
+
+
+def test_interrupted_fold_is_undone(tmp_path):
+    data_file = tmp_path / "agency_data.json"
+    TaskHistory(data_file, 3).add_tasks(["one", "two", "three"])
+    TaskHistory(data_file, 3).add_task("four")
+    tracker = TaskHistory(data_file)
+    # A fold that wrote part of its entries and then died.
+    with open(tracker.snapshot_file, "r+b") as f:
+        f.seek(-1, 2)
+        f.write(b', {"id": 4, "ta')
+
+    assert [t["id"] for t in TaskHistory(data_file).get_tasks(0)] == [1, 2, 3, 4]
+    assert TaskHistory(data_file, 3).add_task("five")["id"] == 5
+    tasks = TaskHistory(data_file).get_tasks(0)
+    assert [t["task"] for t in tasks] == ["one", "two", "three", "four", "five"]
+    assert json.loads(tracker.snapshot_file.read_text())[-1]["task"] == "three"
+    TaskHistory(data_file, 3).add_task("six")
+    assert len(json.loads(tracker.snapshot_file.read_text())) == 6
+
+
+def test_limited_search_matches_full_ranking_and_stops_early(tmp_path, monkeypatch):
+    tracker = TaskHistory(tmp_path / "agency_data.json")
+    tracker.add_tasks(
+        [(f"logo design {n}", "design brief" if n % 3 else "") for n in range(9000)]
+    )
+    for query in ("design", "logo", "de", "brief"):
+        full = tracker.search_tasks(query)
+        assert tracker.search_tasks(query, limit=5) == full[:5]
+
+    chunks = []
+    score = TaskHistory._score
+    monkeypatch.setattr(
+        TaskHistory,
+        "_score",
+        staticmethod(lambda *args: chunks.append(1) or score(*args)),
+    )
+    tracker.search_tasks("design", limit=5)
+    assert len(chunks) == 1
+
+
+@pytest.mark.parametrize("backend", ["json", "sqlite"])
+def test_concurrent_writers_get_unique_ids(backend):
+    result = stress_test(processes=4, tasks_per_process=40, backend=backend)
+    assert result["ok"], result
+
+
+def old_schema_db(path, tasks):
+    conn = sqlite3.connect(path)
+    conn.executescript(SQLiteTaskHistory.SCHEMA.replace(" AUTOINCREMENT", ""))
+    conn.executemany(
+        "INSERT INTO tasks (id, date, time, task) VALUES (?, '2026-01-01', '09:00:00', ?)",
+        enumerate(tasks, 1),
+    )
+    conn.commit()
+    return conn
+
+
+def test_failed_migration_leaves_the_old_table(tmp_path):
+    db_file = tmp_path / "agency_data.db"
+    old_schema_db(db_file, ["one", "two"]).close()
+
+    class BrokenIndex(SQLiteTaskHistory):
+        SCHEMA = SQLiteTaskHistory.SCHEMA.replace("(date, time)", "(missing)")
+
+    with pytest.raises(sqlite3.OperationalError):
+        BrokenIndex(db_file)
+    conn = sqlite3.connect(db_file)
+    tables = {name for (name,) in conn.execute("SELECT name FROM sqlite_master")}
+    assert "tasks_old" not in tables
+    assert conn.execute("SELECT task FROM tasks").fetchall() == [("one",), ("two",)]
+    conn.close()
+
+    db = SQLiteTaskHistory(db_file)
+    assert db.add_task("three")["id"] == 3
+
+
+def test_orphaned_tasks_old_is_recovered(tmp_path):
+    db_file = tmp_path / "agency_data.db"
+    conn = old_schema_db(db_file, ["one", "two"])
+    # What a crash after the rename left behind under the old migration.
+    conn.execute("ALTER TABLE tasks RENAME TO tasks_old")
+    conn.close()
+    conn = sqlite3.connect(db_file)
+    conn.executescript(SQLiteTaskHistory.SCHEMA)
+    conn.execute(
+        "INSERT INTO tasks (date, time, task) VALUES ('2026-01-02', '10:00:00', 'later')"
+    )
+    conn.commit()
+    conn.close()
+
+    db = SQLiteTaskHistory(db_file)
+    assert [(t["id"], t["task"]) for t in db.get_tasks(0)] == [
+        (1, "one"),
+        (2, "two"),
+        (3, "later"),
+    ]
+    assert "tasks_old" not in db._tables()
+    assert db.add_task("four")["id"] == 4
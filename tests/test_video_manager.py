@@ -0,0 +1,129 @@
+import os
+import stat
+import sys
+import time
+
+import pytest
+
+import video_manager
+from asset_cache import DerivedAssetCache
+from asset_scanner import DirectoryScanner
+
+# Stand-in for ffmpeg: copies the input to the output after FAKE_FFMPEG_SLEEP
+# seconds and fails on inputs whose name contains "bad".
+FAKE_FFMPEG = """#!{python}
+import os, sys, time
+src = sys.argv[sys.argv.index("-i") + 1]
+time.sleep(float(os.environ.get("FAKE_FFMPEG_SLEEP", "0")))
+if "bad" in os.path.basename(src):
+    sys.stderr.write("Invalid data found when processing input\\n")
+    sys.exit(1)
+with open(src, "rb") as f, open(sys.argv[-1], "wb") as out:
+    out.write(f.read())
+"""
+
+
+@pytest.fixture
+def manager(tmp_path, monkeypatch):
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    ffmpeg = bin_dir / "ffmpeg"
+    ffmpeg.write_text(FAKE_FFMPEG.format(python=sys.executable))
+    ffmpeg.chmod(ffmpeg.stat().st_mode | stat.S_IEXEC)
+    monkeypatch.setenv("PATH", f"{bin_dir}{os.pathsep}{os.environ['PATH']}")
+    monkeypatch.setattr(
+        video_manager,
+        "DirectoryScanner",
+        lambda cache_file=None: DirectoryScanner(cache_file=None),
+    )
+    return video_manager.VideoManager(
+        DerivedAssetCache(tmp_path / "cache"), tmp_path / "videos"
+    )
+
+
+def clips(tmp_path, *names):
+    paths = []
+    for name in names:
+        path = tmp_path / name
+        path.write_bytes(os.urandom(1024))
+        paths.append(path)
+    return paths
+
+
+def test_queue_reports_each_job(tmp_path, manager):
+    sources = clips(tmp_path, "a.mov", "bad.mov", "c.mov")
+    seen = []
+    queue = video_manager.CompressionQueue(
+        manager, workers=3, progress=lambda done, total, r: seen.append((done, total))
+    )
+    queue.submit_all((src, tmp_path / f"{src.stem}.mp4", "low") for src in sources)
+    results = queue.wait()
+
+    assert [r.get("status", "error") for r in results] == [
+        "success",
+        "error",
+        "success",
+    ]
+    assert results[1]["stderr"] == ["Invalid data found when processing input"]
+    assert sorted(seen) == [(1, 3), (2, 3), (3, 3)]
+    assert (tmp_path / "c.mp4").read_bytes() == sources[2].read_bytes()
+
+
+def test_cancel_stops_running_and_queued_jobs(tmp_path, manager, monkeypatch):
+    monkeypatch.setenv("FAKE_FFMPEG_SLEEP", "30")
+    sources = clips(tmp_path, *(f"clip{i}.mov" for i in range(6)))
+    queue = video_manager.CompressionQueue(manager, workers=2)
+    queue.submit_all((src, tmp_path / f"{src.stem}.mp4", "low") for src in sources)
+    time.sleep(0.5)
+    start = time.perf_counter()
+    queue.cancel()
+    results = queue.wait()
+
+    assert time.perf_counter() - start < 10
+    assert [r["status"] for r in results] == ["cancelled"] * 6
+
+
+def test_cancel_while_process_is_starting(tmp_path, manager, monkeypatch):
+    monkeypatch.setenv("FAKE_FFMPEG_SLEEP", "30")
+    (src,) = clips(tmp_path, "clip.mov")
+    queue = video_manager.CompressionQueue(manager, workers=1)
+    popen = video_manager.subprocess.Popen
+
+    def start_then_cancel(*args, **kwargs):
+        proc = popen(*args, **kwargs)
+        queue.cancel()
+        return proc
+
+    monkeypatch.setattr(video_manager.subprocess, "Popen", start_then_cancel)
+    start = time.perf_counter()
+    queue.submit(src, tmp_path / "clip.mp4", "low")
+    results = queue.wait()
+
+    assert time.perf_counter() - start < 10
+    assert results[0]["status"] == "cancelled"
+
+
+def test_ingest_keeps_clips_added_by_other_processes(tmp_path, manager):
+    (tmp_path / "card").mkdir()
+    (source,) = clips(tmp_path / "card", "intro.mp4")
+    # Another ingest placed a clip after this manager listed the library.
+    other = tmp_path / "videos" / "intro.mp4"
+    other.parent.mkdir(exist_ok=True)
+    other.write_bytes(b"other clip")
+
+    (result,) = manager.add_videos([source])
+
+    assert result["video"] == "intro-2.mp4"
+    assert other.read_bytes() == b"other clip"
+    assert (tmp_path / "videos" / "intro-2.mp4").read_bytes() == source.read_bytes()
+
+
+def test_ingest_only_removes_its_own_staging(tmp_path, manager):
+    running = tmp_path / "videos" / (video_manager.INGEST_PREFIX + "other")
+    running.mkdir(parents=True)
+    (running / "0.mp4").write_bytes(b"partial copy")
+
+    manager.add_videos(clips(tmp_path, "a.mp4", "b.mp4"))
+
+    assert (running / "0.mp4").read_bytes() == b"partial copy"
+    assert sorted(os.listdir(tmp_path / "videos")) == [running.name, "a.mp4", "b.mp4"]